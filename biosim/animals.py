@@ -5,18 +5,69 @@ __author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
 __email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
 """
 
+import itertools
 import math
-import random as rand
+import weakref
+import numpy as np
+from biosim.random_streams import default_stream
 
 """
 Implements Herbivores and Carnivores
 """
 
 
-class Animal:
+_versions = itertools.count(1)
+
+
+class _AnimalType(type):
+    """
+    Metaclass of the animal classes. Every class gets a parameter version of its own, drawn
+    from one counter so that no two classes share a version. Setting one of the parameters
+    the fitness depends on, whether through set_parameters or by assigning the class
+    attribute directly, gives the class a new version, and so invalidates the cached fitness
+    of its animals only. Subclasses that inherit the parameter get a new version too.
+    """
+    fitness_params = ('phi_age', 'a_half', 'phi_weight', 'w_half')
+
+    def __init__(cls, name, bases, attributes):
+        super().__init__(name, bases, attributes)
+        type.__setattr__(cls, '_param_version', next(_versions))
+
+    def __setattr__(cls, key, value):
+        super().__setattr__(key, value)
+        if key in _AnimalType.fitness_params:
+            cls._new_version(key)
+
+    def _new_version(cls, key=None):
+        """
+        Method that gives the class, and the subclasses that inherit the parameter key from
+        it, a new parameter version
+
+        :param key: str, the name of the changed parameter, or None for every subclass
+        """
+        type.__setattr__(cls, '_param_version', next(_versions))
+        for subclass in cls.__subclasses__():
+            if key is None or key not in vars(subclass):
+                subclass._new_version(key)
+
+
+# The bound classes are kept only as long as some simulation uses them
+_bound_classes = weakref.WeakValueDictionary()
+
+
+class Animal(metaclass=_AnimalType):
     """
-    The class contains different methods that change animal attributes and parameters
+    The class contains different methods that change animal attributes and parameters. The
+    animals keep their state in __slots__, and the species is given by the class, both as
+    the name specie and as the integer code, so no animal carries a dict or a string of its
+    own. The code indexes the pairs of herbivore and carnivore lists used in migration and
+    birth.
     """
+    __slots__ = ('_a', '_w', 'phi', '_phi_version', 'death_rate', 'not_walked')
+    params = None
+    specie = None
+    code = None
+
     param_animal_limits = {'phi_age': (0, 1), 'a_half': (0, math.inf), 'phi_weight': (0, math.inf),
                            'w_half': (0, math.inf), 'w_birth': (0, math.inf),
                            'sigma_birth': (0, math.inf), 'omega': (0, 1), 'beta': (0, 1),
@@ -45,46 +96,173 @@ class Animal:
             else:
                 raise ValueError('chosen value for parameter is invalid')
 
+    @classmethod
+    def invalidate_fitness(cls):
+        """
+        Method that invalidates the cached fitness of the animals of the class and its
+        subclasses. Animals moved to another class need no call, since no two classes share a
+        parameter version
+        """
+        cls._new_version()
+
+    @classmethod
+    def bind(cls, params):
+        """
+        Method that gives a subclass of the species with its parameters taken from a frozen
+        parameter set. The subclass is created once per species and parameter set, and its
+        parameters are never changed, so constants derived from them, like the table from
+        age_factors, are only computed once.
+
+        :param params: a SpeciesParameters
+        :return: a subclass of cls
+        """
+        key = (cls, params)
+        bound = _bound_classes.get(key)
+        if bound is None:
+            attributes = {name: value for name, value in vars(params).items()
+                          if value is not None and name in cls.param_animal_limits}
+            attributes['params'] = params
+            attributes['__slots__'] = ()
+            bound = _bound_classes[key] = type(cls)(cls.__name__, (cls,), attributes)
+        return bound
+
     def __init__(self, specie, age, weight):
         """
-        :param specie: a str, either Herbivore or Carnivore
+        :param specie: a str, either Herbivore or Carnivore. The species is given by the
+        class, and the argument is only kept so that animals are created as before
         :param age: int, the age of an animal
         :param weight: int, the weight of an animal
         """
-        self.a = age
-        self.w = weight
-        self.specie = specie
+        self._a = age
+        self._w = weight
         self.phi = None
+        self._phi_version = None
         self.death_rate = None
         self.not_walked = True
 
+    @property
+    def a(self):
+        """
+        Age of the animal. Setting it invalidates the cached fitness, but not the ordering of
+        the cell the animal lives in, see Landscape.invalidate_order
+        """
+        return self._a
+
+    @a.setter
+    def a(self, value):
+        self._a = value
+        self._phi_version = None
+
+    @property
+    def w(self):
+        """
+        Weight of the animal. Setting it invalidates the cached fitness, but not the ordering
+        of the cell the animal lives in, see Landscape.invalidate_order
+        """
+        return self._w
+
+    @w.setter
+    def w(self, value):
+        self._w = value
+        self._phi_version = None
+
     # noinspection PyUnresolvedReferences
     def fitness(self):
         """
-        Method that computes the fitness for an animal
+        Method that computes the fitness for an animal. The fitness is cached, and only
+        recomputed after the age, the weight or one of the fitness parameters has changed
 
         :return: The fitness, phi (int). If the animals weight is zero, return 0
         """
-        if self.w <= 0:
-            return 0
+        if self._phi_version == self._param_version:
+            return self.phi
+
+        if self._w <= 0:
+            self.phi = 0
         else:
             self.phi = 1 / (1 + math.exp(self.phi_age * (
-                    self.a - self.a_half))) * 1 / (
-                               1 + math.exp(-self.phi_weight * (self.w - self.w_half)))
-            return self.phi
+                    self._a - self.a_half))) * 1 / (
+                               1 + math.exp(-self.phi_weight * (self._w - self.w_half)))
+        self._phi_version = self._param_version
+        return self.phi
+
+    @classmethod
+    def age_factors(cls, max_age):
+        """
+        Method that returns the age part of the fitness, q(+, a, a_half, phi_age), tabulated
+        for the integer ages 0 to max_age. The table is kept on the class, and only recomputed
+        when it is too short or, for classes not made by bind, a fitness parameter has changed.
 
-    def move_dir(self):
+        :param max_age: int, the highest age the table must cover
+        :return: array where entry a is the age factor of an animal of age a
+        """
+        table = cls.__dict__.get('_age_table')
+        if table is None or len(table) <= max_age or (
+                cls.params is None and
+                cls.__dict__.get('_age_table_version') != cls._param_version):
+            size = max(max_age + 1, 2 * len(table) if table is not None else 64)
+            with np.errstate(over='ignore'):
+                table = 1 / (1 + np.exp(cls.phi_age * (np.arange(size) - cls.a_half)))
+            cls._age_table = table
+            cls._age_table_version = cls._param_version
+        return table
+
+    @classmethod
+    def fitness_batch(cls, ages, weights):
+        """
+        Method that computes the fitness of many animals of the species at once. Integer ages
+        are looked up in the table from age_factors.
+
+        :param ages: array of ages
+        :param weights: array of weights
+        :return: array with the fitness of each animal, 0 where the weight is zero
+        """
+        ages = np.asarray(ages)
+        weights = np.asarray(weights, dtype=np.float64)
+        with np.errstate(over='ignore'):
+            if np.issubdtype(ages.dtype, np.integer) and len(ages) > 0 and ages.min() >= 0:
+                age_factor = cls.age_factors(int(ages.max()))[ages]
+            else:
+                age_factor = 1 / (1 + np.exp(cls.phi_age * (ages - cls.a_half)))
+            weight_factor = 1 / (1 + np.exp(-cls.phi_weight * (weights - cls.w_half)))
+        return np.where(weights > 0, age_factor * weight_factor, 0.)
+
+    @classmethod
+    def update_fitness(cls, animals):
+        """
+        Method that refreshes the cached fitness of a list of animals of the species, computing
+        the stale ones in one batch
+
+        :param animals: list of animal instances
+        """
+        version = cls._param_version
+        stale = [animal for animal in animals if animal._phi_version != version]
+        if len(stale) < 8:
+            for animal in stale:
+                animal.fitness()
+            return
+
+        phis = cls.fitness_batch([animal._a for animal in stale],
+                                 [animal._w for animal in stale])
+        for animal, phi in zip(stale, phis.tolist()):
+            animal.phi = phi
+            animal._phi_version = version
+
+    def move_dir(self, rng=None):
         """
         Method that decides whether the animal moves or not, and if it moves the direction is
         returned
 
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
         :return: The direction the animal is moving, or None
         """
+        rng = rng if rng is not None else default_stream()
         # noinspection PyUnresolvedReferences
         move_prob = self.mu * self.fitness()
 
-        if rand.random() <= move_prob:
-            rand_numb = rand.randint(1, 20)
+        if rng.random() <= move_prob:
+            rand_numb = rng.integers(1, 21)
             if 1 <= rand_numb < 6:
                 return 'North'
             elif 6 <= rand_numb < 11:
@@ -109,27 +287,27 @@ class Animal:
         """
         self.a += 1
 
-    def give_birth(self, animal_type, n):
+    def give_birth(self, animal_type, n, rng=None):
         """
         Method that allows animals to give birth
 
         :param n: number of animals of the same species
         :param animal_type: str. the type of animal, either herbivore or carnivore
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
 
         :return: a new animal instance, or None
         """
         if self.w >= self.zeta * (self.w_birth + self.sigma_birth):
+            rng = rng if rng is not None else default_stream()
             birth_prob = min(1, self.gamma * self.fitness() * (n - 1))
-            if rand.random() <= birth_prob:
-                w_baby = rand.gauss(self.w_birth, self.sigma_birth)
+            if rng.random() <= birth_prob:
+                w_baby = rng.normal(self.w_birth, self.sigma_birth)
                 if w_baby > 0:
                     potential_weight_mother = self.w - self.xi * w_baby
                     if potential_weight_mother > 0:
                         self.w -= self.xi * w_baby
-                        if animal_type == 'Herbivore':
-                            return Herbivore('Herbivore', 0, w_baby)
-                        else:
-                            return Carnivore('Carnivore', 0, w_baby)
+                        return type(self)(animal_type, 0, w_baby)
 
     def loose_weight(self):
         """
@@ -137,15 +315,18 @@ class Animal:
         """
         self.w -= self.eta * self.w
 
-    def survival(self):
+    def survival(self, rng=None):
         """
         Method that computes an animals probability to survive at the end of a year, based on the
         animals fitness.
 
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
         :return: True if the animal survives
         """
+        rng = rng if rng is not None else default_stream()
         self.death_rate = self.omega * (1 - self.fitness())
-        if self.death_rate < rand.random() and self.w > 0:
+        if self.death_rate < rng.random() and self.w > 0:
             return True
 
 
@@ -153,6 +334,9 @@ class Herbivore(Animal):
     """
     A class containing parameters and methods used to implement Herbivores
     """
+    __slots__ = ()
+    specie = 'Herbivore'
+    code = 0
 
     phi_age = 0.2
     a_half = 40.0
@@ -182,9 +366,8 @@ class Herbivore(Animal):
             self.eat_gain_weight(self.F)
             food -= self.F
             return food
-        elif food < self.F:
-            f = self.F - food
-            self.eat_gain_weight(f)
+        else:
+            self.eat_gain_weight(food)
             return 0
 
 
@@ -192,6 +375,9 @@ class Carnivore(Animal):
     """
     A class containing parameters and methods used to implement Carnivores
     """
+    __slots__ = ()
+    specie = 'Carnivore'
+    code = 1
 
     phi_age = 0.4
     a_half = 60.0
@@ -212,12 +398,15 @@ class Carnivore(Animal):
     def __init__(self, specie, age, weight):
         super().__init__(specie, age, weight)
 
-    def kill(self, phi_herb):
+    def kill(self, phi_herb, rng=None):
         """
         Function that decides whether a carnivore kills a herbivore or not
         :param phi_herb: fitness of herbivore that's being hunted
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
         :return: True if herbivore is killed
         """
+        rng = rng if rng is not None else default_stream()
         if self.phi <= phi_herb:
             kill_prob = 0
         elif 0 < self.phi - phi_herb < self.DeltaPhiMax:
@@ -225,7 +414,7 @@ class Carnivore(Animal):
         else:
             kill_prob = 1
 
-        if rand.random() < kill_prob:
+        if rng.random() < kill_prob:
             return True
 
     def carn_eating(self, available_food, to_eat):
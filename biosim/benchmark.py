@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+from biosim.cell_control import Cells
+from biosim.instrumentation import PhaseRecorder
+from biosim.simulation import BioSim
+
+"""
+Times the phases of the annual cycle on fixed scenarios, and compares the timings with a stored
+baseline. Run it as
+
+    python -m biosim.benchmark run --save benchmarks/baseline.json
+    python -m biosim.benchmark compare benchmarks/baseline.json
+"""
+
+SEED = 1
+
+
+def synthetic_island(rows, cols, seed=0):
+    """
+    Function that makes a random island with ocean along the edges
+
+    :param rows: int, the number of rows, including the ocean
+    :param cols: int, the number of columns, including the ocean
+    :param seed: int used as random number seed
+    :return: Multi-line string specifying island geography
+    """
+    rng = np.random.default_rng(seed)
+    letters = rng.choice(np.array(list('JSDM')), size=(rows, cols), p=(0.45, 0.3, 0.15, 0.1))
+    letters[[0, -1], :] = 'O'
+    letters[:, [0, -1]] = 'O'
+    return '\n'.join(''.join(row) for row in letters)
+
+
+def synthetic_archipelago(rows, cols, islands, size=6, seed=0):
+    """
+    Function that makes a map of mostly ocean, with small square islands placed at random
+
+    :param rows: int, the number of rows
+    :param cols: int, the number of columns
+    :param islands: int, the number of islands. Islands may overlap
+    :param size: int, the side of every island, in cells
+    :param seed: int used as random number seed
+    :return: Multi-line string specifying island geography
+    """
+    rng = np.random.default_rng(seed)
+    letters = np.full((rows, cols), 'O')
+    for _ in range(islands):
+        x, y = rng.integers(1, rows - size), rng.integers(1, cols - size)
+        letters[x:x + size, y:y + size] = rng.choice(np.array(list('JSDM')), size=(size, size),
+                                                     p=(0.45, 0.3, 0.15, 0.1))
+    return '\n'.join(''.join(row) for row in letters)
+
+
+def spread_population(island_map, herbivores, carnivores, every=4):
+    """
+    Function that places the same group of animals in every every-th habitable cell
+
+    :param island_map: Multi-line string specifying island geography
+    :param herbivores: int, herbivores per populated cell
+    :param carnivores: int, carnivores per populated cell
+    :param every: int, the step between populated cells
+    :return: List of dictionaries specifying initial population
+    """
+    animals = [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(herbivores)] + \
+              [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(carnivores)]
+    cells = [(x + 1, y + 1) for x, row in enumerate(island_map.split())
+             for y, letter in enumerate(row) if letter in 'JSD']
+    return [{'loc': loc, 'pop': animals} for loc in cells[::every]]
+
+
+def _default():
+    return None, Cells.default_population
+
+
+def _dense_jungle():
+    return 'OOO\nOJO\nOOO', [{'loc': (2, 2),
+                              'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(2000)] +
+                                     [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                      for _ in range(200)]}]
+
+
+def _island(size):
+    def scenario():
+        island_map = synthetic_island(size, size)
+        return island_map, spread_population(island_map, 10, 2)
+    return scenario
+
+
+def _archipelago():
+    island_map = synthetic_archipelago(300, 300, 30)
+    return island_map, spread_population(island_map, 10, 2)
+
+
+scenarios = {'default': _default,
+             'dense_jungle': _dense_jungle,
+             'island_100': _island(100),
+             'island_500': _island(500),
+             'archipelago': _archipelago}
+
+# island_500 takes minutes per year on the object engine, and is only run when asked for
+default_scenarios = ('default', 'dense_jungle', 'island_100', 'archipelago')
+
+
+def calibrate(repeats=5):
+    """
+    Function that times a fixed mix of Python and NumPy work, as a measure of the speed of the
+    machine at the moment
+
+    :param repeats: int, the number of times the work is timed
+    :return: float, the fastest time in seconds
+    """
+    values = np.random.default_rng(SEED).random(100000)
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        total = 0.
+        for value in values[:20000].tolist():
+            total += value * value
+        np.sort(values).cumsum()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _time_scenario(island_map, ini_pop, engine, years, warmup):
+    """
+    Function that simulates a scenario once and times every phase in every year. The years
+    are simulated by BioSim.simulate, and the phases are timed by a PhaseRecorder
+
+    :return: dict mapping every phase and animal_distribution to a list of seconds per year,
+    and the list of the number of animals at the start of every year under 'animals'
+    """
+    recorder = PhaseRecorder()
+    sim = BioSim(seed=SEED, island_map=island_map, ini_pop=ini_pop, engine=engine,
+                 headless=True, recorder=recorder)
+    sim.simulate(warmup)
+    recorder.records = []
+    distribution = []
+    for _ in range(years):
+        sim.simulate(1)
+        start = time.perf_counter()
+        sim.animal_distribution
+        distribution.append(time.perf_counter() - start)
+
+    timings = {phase: [record.seconds[phase] for record in recorder.records]
+               for phase in Cells.phases}
+    timings['animal_distribution'] = distribution
+    timings['animals'] = [record.animals for record in recorder.records]
+    return timings
+
+
+def run_benchmarks(names=default_scenarios, engines=('object', 'array'), years=5, warmup=1,
+                   repeats=3):
+    """
+    Function that times the phases of the annual cycle. Every scenario is simulated with a
+    fixed seed, first for warmup years that are not timed, then for years years in which
+    every phase is timed separately, and animal_distribution once per year. As the seed is
+    fixed, every repeat does the same work, and the fastest of the repeats is kept for every
+    phase and year. The repeats take turns with the other scenarios, so that a short burst of
+    load from other processes slows down at most one of them.
+
+    :param names: sequence of scenario names, keys of scenarios
+    :param engines: sequence of engines, 'object' and/or 'array'
+    :param years: int, the number of timed years
+    :param warmup: int, the number of years simulated before the timing starts
+    :param repeats: int, the number of times every scenario is simulated
+    :return: dict mapping '<scenario>/<engine>' to a dict with the time in seconds per year of
+    every phase and of animal_distribution, and the mean number of animals under 'animals'.
+    The fastest time of calibrate, measured once per repeat, is under 'calibration'
+    """
+    setups = {name: scenarios[name]() for name in names}
+    runs = {}
+    calibrations = []
+    for _ in range(repeats):
+        calibrations.append(calibrate(3))
+        for name, (island_map, ini_pop) in setups.items():
+            for engine in engines:
+                runs.setdefault('{}/{}'.format(name, engine), []).append(
+                    _time_scenario(island_map, ini_pop, engine, years, warmup))
+
+    results = {}
+    for key, timings in runs.items():
+        results[key] = {phase: statistics.mean(min(values) for values in
+                                               zip(*(run[phase] for run in timings)))
+                        for phase in timings[0] if phase != 'animals'}
+        results[key]['animals'] = statistics.mean(timings[0]['animals'])
+    results['calibration'] = {'reference': min(calibrations)}
+    return results
+
+
+def relative_speed(results, baseline):
+    """
+    Function that compares the speed of the machine now with the speed when the baseline was
+    timed
+
+    :param results: dict of timings, as given by run_benchmarks
+    :param baseline: dict of timings, as given by run_benchmarks
+    :return: float, the time of calibrate now divided by its time in the baseline
+    """
+    return results['calibration']['reference'] / baseline['calibration']['reference']
+
+
+def compare(results, baseline, tolerance=0.5, min_seconds=5e-4):
+    """
+    Function that finds the timings that are slower than in the baseline. The baseline
+    timings are first scaled by relative_speed, so that a machine that is busier or slower
+    than when the baseline was stored does not show up as regressions.
+
+    :param results: dict of timings, as given by run_benchmarks
+    :param baseline: dict of timings, as given by run_benchmarks
+    :param tolerance: float, the fraction a timing may grow before it is a regression
+    :param min_seconds: float, differences below this many seconds are never regressions
+    :return: list of (benchmark, phase, baseline seconds, seconds) for every regression, with
+    the scaled baseline seconds
+    """
+    speed = relative_speed(results, baseline)
+    regressions = []
+    for key, timings in sorted(results.items()):
+        if key not in baseline or key == 'calibration':
+            continue
+        for phase, seconds in timings.items():
+            if phase == 'animals' or phase not in baseline[key]:
+                continue
+            before = baseline[key][phase] * speed
+            if seconds > before * (1 + tolerance) and seconds - before > min_seconds:
+                regressions.append((key, phase, before, seconds))
+    return regressions
+
+
+def save_baseline(results, path):
+    """
+    Function that stores timings as a baseline
+
+    :param results: dict of timings, as given by run_benchmarks
+    :param path: String, file name of the baseline
+    """
+    with open(path, 'w') as baseline:
+        json.dump({'machine': platform.platform(), 'python': platform.python_version(),
+                   'results': results}, baseline, indent=2, sort_keys=True)
+        baseline.write('\n')
+
+
+def load_baseline(path):
+    """
+    Function that reads a baseline stored by save_baseline
+
+    :param path: String, file name of the baseline
+    :return: dict of timings, as given by run_benchmarks
+    """
+    with open(path) as baseline:
+        return json.load(baseline)['results']
+
+
+def _report(results, baseline=None):
+    """
+    Function that formats the timings as a table, in milliseconds
+
+    :param results: dict of timings, as given by run_benchmarks
+    :param baseline: dict of timings to show the change against, or None
+    :return: String with the table
+    """
+    lines = []
+    for key, timings in sorted(results.items()):
+        lines.append('{} ({:.0f} animals)'.format(key, timings['animals'])
+                     if 'animals' in timings else key)
+        for phase, seconds in timings.items():
+            if phase == 'animals':
+                continue
+            line = '    {:<20} {:10.3f} ms'.format(phase, 1e3 * seconds)
+            if baseline is not None and phase in baseline.get(key, {}):
+                line += ' {:+7.1%}'.format(seconds / baseline[key][phase] - 1)
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """
+    Function that runs the command line interface
+
+    :param argv: list of arguments, or None to use sys.argv
+    :return: int, the exit status: 1 if compare found regressions, else 0
+    """
+    parser = argparse.ArgumentParser(prog='python -m biosim.benchmark',
+                                     description='Times the phases of the annual cycle')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='time the scenarios')
+    run_parser.add_argument('--save', help='store the timings as a baseline in this file')
+    compare_parser = commands.add_parser('compare', help='time the scenarios and flag '
+                                                         'regressions against a baseline')
+    compare_parser.add_argument('baseline', help='file with the stored baseline')
+    compare_parser.add_argument('--tolerance', type=float, default=0.5,
+                                help='fraction a timing may grow (default: 0.5)')
+    for command in (run_parser, compare_parser):
+        command.add_argument('--scenarios', nargs='+', choices=sorted(scenarios),
+                             default=list(default_scenarios))
+        command.add_argument('--engines', nargs='+', choices=('object', 'array'),
+                             default=['object', 'array'])
+        command.add_argument('--years', type=int, default=5)
+        command.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scenarios, args.engines, args.years, repeats=args.repeats)
+    if args.command == 'run':
+        print(_report(results))
+        if args.save is not None:
+            save_baseline(results, args.save)
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    speed = relative_speed(results, baseline)
+    print('Machine speed relative to the baseline: {:.2f}'.format(1 / speed))
+    print(_report(results, {key: {phase: seconds * speed for phase, seconds in timings.items()}
+                            for key, timings in baseline.items()}))
+    regressions = compare(results, baseline, args.tolerance)
+    for key, phase, before, seconds in regressions:
+        print('REGRESSION {} {}: {:.3f} ms -> {:.3f} ms'.format(key, phase, 1e3 * before,
+                                                                1e3 * seconds))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,45 +5,172 @@ __author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
 __email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
 """
 
+import numpy as np
 from biosim.mapping import Island
 from biosim.animals import Animal, Herbivore, Carnivore
 from biosim.landscape import Landscape, Jungle, Desert, Savannah, Mountain, Ocean
+from biosim.parameters import Parameters
+from biosim.population import Population
+from biosim.random_streams import SeedTree
 
 """
 Controls instances in a map, and generates animals in the map
 """
 
 
+def graze_array(flat_map, herbs, regrowing=None):
+    """
+    Function that lets the herbivores stored in a population graze, cell by cell, the fittest
+    first
+
+    :param flat_map: list of the landscape-instances of the cells, in flat index order
+    :param herbs: Population of herbivores, with cell indices counted from the first cell
+    in flat_map
+    :param regrowing: indices in flat_map of the cells where the food is renewed also when no
+    herbivores live there. Only these cells and the cells with herbivores are visited. If
+    None, every cell is visited
+    :return: the order and cell starts of the herbivores by fitness before grazing, as given
+    by Population.fitness_order, and a list telling for every cell whether any herbivore ate
+    """
+    herb_order, herb_starts = herbs.fitness_order(len(flat_map))
+    if regrowing is None:
+        cells = range(len(flat_map))
+    else:
+        cells = set(regrowing).union(np.flatnonzero(np.diff(herb_starts)).tolist())
+
+    ate = [False] * len(flat_map)
+    for ix in cells:
+        ate[ix] = flat_map[ix].feeding_herb_array(
+            herbs, herb_order[herb_starts[ix]:herb_starts[ix + 1]], ordered=True)
+    return herb_order, herb_starts, ate
+
+
+def hunt_array(flat_map, herbs, carns, grazed, seeds, year, first_cell=0):
+    """
+    Function that lets the carnivores stored in a population hunt, cell by cell, and removes
+    the herbivores that were killed. Hunting in a cell draws from a stream of its own, so the
+    result does not depend on which other cells are fed in the same call.
+
+    :param flat_map: list of the landscape-instances of the cells, in flat index order
+    :param herbs: Population of herbivores, with cell indices counted from the first cell
+    in flat_map
+    :param carns: Population of carnivores, with cell indices counted the same way
+    :param grazed: what graze_array returned for the herbivores this year
+    :param seeds: the SeedTree of the simulation
+    :param year: int, the simulated year
+    :param first_cell: flat index on the island of the first cell in flat_map
+    """
+    herb_order, herb_starts, ate = grazed
+    carn_order, carn_starts = carns.fitness_order(len(flat_map))
+
+    shared = (np.diff(herb_starts) > 0) & (np.diff(carn_starts) > 0)
+    for ix in np.flatnonzero(shared).tolist():
+        herb_idx = herb_order[herb_starts[ix]:herb_starts[ix + 1]]
+        carn_idx = carn_order[carn_starts[ix]:carn_starts[ix + 1]]
+        flat_map[ix].feeding_carn_array(herbs, herb_idx, carns, carn_idx,
+                                        herbs_ordered=not ate[ix], carns_ordered=True,
+                                        rng=seeds.stream(year, 'feeding', first_cell + ix))
+
+    herbs.keep(herbs.w > 0)
+
+
+def feed_array(flat_map, herbs, carns, seeds, year, first_cell=0, regrowing=None):
+    """
+    Function that feeds the animals stored in populations: first the herbivores graze, then
+    the carnivores hunt
+
+    :param flat_map: list of the landscape-instances of the cells, in flat index order
+    :param herbs: Population of herbivores, with cell indices counted from the first cell
+    in flat_map
+    :param carns: Population of carnivores, with cell indices counted the same way
+    :param seeds: the SeedTree of the simulation
+    :param year: int, the simulated year
+    :param first_cell: flat index on the island of the first cell in flat_map
+    :param regrowing: indices in flat_map of the cells where the food is renewed also when no
+    herbivores live there, as in graze_array
+    """
+    hunt_array(flat_map, herbs, carns, graze_array(flat_map, herbs, regrowing), seeds, year,
+               first_cell)
+
+
 class Cells:
     """
-    The class generates animals onto a map and controls the annual cycle of events
+    The class generates animals onto a map and controls the annual cycle of events. With the
+    object backend, the flat indices of the cells where animals may live are kept in the set
+    active, so that the phases of the year only visit those cells. The set is updated when
+    animals are generated or migrate, and cells that have become empty are dropped from it.
+    Code that places animals in the cells directly must call refresh_active afterwards.
+
+    The food is only renewed in cells that are visited when the herbivores graze. The first
+    year each cell has not yet been renewed for is kept in food_year, and when a cell is
+    visited again, or the food is read by update_food, the missed years are caught up with.
     """
+    default_population = [{'loc': (2, 18),
+                           'pop': [{'species': 'Herbivore', 'age': 8, 'weight': 16}
+                                   for _ in range(100)]},
+                          {'loc': (5, 17),
+                           'pop': [{'species': 'Carnivore', 'age': 10, 'weight': 14.2}
+                                   for _ in range(50)]}]
+    phases = ('grazing', 'hunting', 'birth', 'migration', 'aging', 'weight_loss', 'death')
+    recorder = None
 
-    def __init__(self, population_cell=None, island_map=None):
+    def __init__(self, population_cell=None, island_map=None, backend='object', seed=None,
+                 params=None):
         """
 
         :param population_cell: list of dicts containing animals in locations
         :param island_map: a string containing the letters O, M, D, J and S, representing the
         landscape types. If None, the default in the Island class is used
+        :param backend: 'object' to keep every animal as a Herbivore or Carnivore instance in
+        the cells, or 'array' to keep the animals in one Population per species
+        :param seed: int used as random number seed. Every phase of every year draws from its
+        own stream derived from this seed, so the simulation does not depend on, or change, the
+        state of the random and numpy.random modules
+        :param params: the Parameters of the simulation. If None, the parameters are read from
+        the Herbivore, Carnivore, Jungle and Savannah classes
         """
         self.population_cell = population_cell if population_cell \
-                                                  is not None else [{'loc': (2, 18),
-                                                                     'pop': [{'species':
-                                                                                  'Herbivore',
-                                                                              'age': 8,
-                                                                              'weight': 16} for
-                                                                             _ in range(100)]},
-                                                                    {'loc': (5, 17),
-                                                                     'pop': [
-                                                                         {'species': 'Carnivore',
-                                                                          'age': 10,
-                                                                          'weight': 14.2} for
-                                                                         _ in range(50)]}]
-
-        isle = Island(island_map)
-        self.map = isle.create_map()
+                                                  is not None else self.default_population
+
+        self.params = params if params is not None else Parameters.from_classes()
+        self.species = {specie: self.params.species(specie)
+                        for specie in ('Herbivore', 'Carnivore')}
+        self.island = Island(island_map)
+        self.map = self.island.create_map(self.params.landscapes())
         self.food_source = 0
 
+        if backend not in ('object', 'array'):
+            raise ValueError('The backend must be either object or array')
+        self.backend = backend
+        self.populations = {specie: Population(specie, animal=animal)
+                            for specie, animal in self.species.items()}
+        self.flat_map = [cell for row in self.map for cell in row]
+        self.regrowing = [ix for ix, cell in enumerate(self.flat_map) if cell.f_max > 0]
+        self.food_year = [0] * len(self.flat_map)
+        self.active = set()
+        self.neighbours = self.island.neighbours
+        self.seeds = SeedTree(seed)
+        self.year = 0
+        self._grazed = None
+        self.counts = {}
+        self.totals = {}
+        self.update_counts()
+
+    @property
+    def n_cells(self):
+        """Number of cells on the island"""
+        return self.island.cell_ids.size
+
+    def cell_index(self, x, y):
+        """
+        Method that converts a row and column coordinate to a flat cell index
+
+        :param x: row coordinate, starting at 0
+        :param y: column coordinate, starting at 0
+        :return: the flat index of the cell
+        """
+        return int(self.island.cell_ids[x, y])
+
     def generate_animals(self):
         """
         Method that generates an animal and places it in a cell
@@ -52,111 +179,408 @@ class Cells:
             x, y = lo['loc']
             x -= 1
             y -= 1
-            if not self.map[x][y].habitable:
+            if not self.island.habitable[x, y]:
                 raise ValueError('The location of animal is not habitable')
 
+            if self.backend == 'array':
+                for specie, pop in self.populations.items():
+                    animals = [ind for ind in lo['pop'] if ind['species'] == specie]
+                    pop.add([ind['age'] for ind in animals],
+                            [ind['weight'] for ind in animals], self.cell_index(x, y))
+                continue
+
             for ind in lo['pop']:
                 if ind['species'] == 'Herbivore':
-                    herb = Herbivore(ind['species'], ind['age'], ind['weight'])
+                    herb = self.species['Herbivore'](ind['species'], ind['age'], ind['weight'])
                     self.map[x][y].pop_herb.append(herb)
                 elif ind['species'] == 'Carnivore':
-                    carn = Carnivore(ind['species'], ind['age'], ind['weight'])
+                    carn = self.species['Carnivore'](ind['species'], ind['age'], ind['weight'])
                     self.map[x][y].pop_carn.append(carn)
+            self.active.add(self.cell_index(x, y))
+
+        self.update_counts()
+
+    def refresh_active(self):
+        """
+        Method that finds the cells where animals live by looking at every cell, e.g. after
+        animals have been placed in the cells directly
+        """
+        self.active = {ix for ix, cell in enumerate(self.flat_map)
+                       if cell.pop_herb or cell.pop_carn}
 
-    def move(self, x, y):
+    def occupied_cells(self):
         """
-        Method that may move an animal to a neighbouring cell
+        Method that drops the cells that have become empty from active
+
+        :return: sorted list of the flat indices of the cells where animals live. The phases
+        drawing from one stream for the whole island visit the cells in this order
+        """
+        flat_map = self.flat_map
+        self.active = {ix for ix in self.active if flat_map[ix].pop_herb or flat_map[ix].pop_carn}
+        return sorted(self.active)
+
+    def set_parameters(self, params):
+        """
+        Method that lets the simulation continue with a new parameter set. The animals and
+        cells are moved to the classes bound to the new parameters, and the food in the cells
+        is kept.
+
+        :param params: the new Parameters
+        """
+        if params == self.params:
+            return
+        self.update_food()
+        self.params = params
+        self.species = {specie: params.species(specie) for specie in self.species}
+        landscapes = params.landscapes()
+        for letter, cell in zip(''.join(self.island.letter_map.split()), self.flat_map):
+            cell.__class__ = landscapes[letter]
+            for animal in cell.pop_herb:
+                animal.__class__ = self.species['Herbivore']
+            for animal in cell.pop_carn:
+                animal.__class__ = self.species['Carnivore']
+        for specie, pop in self.populations.items():
+            pop.animal = self.species[specie]
+            pop.invalidate_order()
+
+    def stream(self, phase, *key):
+        """
+        Method that gives the random number stream for a phase of the current year
+
+        :param phase: str, one of the phases in SeedTree
+        :param key: further ints, e.g. a flat cell index, identifying the stream
+        :return: a RandomStream
+        """
+        return self.seeds.stream(self.year, phase, *key)
+
+    def _leave(self, ix, arrivals, rng):
+        """
+        Method that decides which animals leave a cell, following the rules in
+        Animal.move_dir. The leaving animals are collected in arrivals instead of being placed
+        in their new cell, so that they are not moved again in the same year.
+
+        :param ix: flat index of the cell
+        :param arrivals: dict mapping flat cell indices to a pair of lists, the herbivores and
+        the carnivores arriving in that cell
+        :param rng: the random number stream used for the migration
+        """
+        cell = self.flat_map[ix]
+        targets = self.neighbours[ix].tolist()
+        for animals in (cell.pop_herb, cell.pop_carn):
+            staying = []
+            for animal in animals:
+                if animal.not_walked and rng.random() <= animal.mu * animal.fitness():
+                    target = targets[rng.integers(0, 4)]
+                    if target >= 0:
+                        animal.not_walked = False
+                        arrivals.setdefault(target, ([], []))[type(animal).code].append(animal)
+                        continue
+                staying.append(animal)
+
+            if len(staying) < len(animals):
+                if type(animals[0]).code == 0:
+                    cell.pop_herb = staying
+                else:
+                    cell.pop_carn = staying
+
+    def _arrive(self, arrivals):
+        """
+        Method that places migrating animals in their new cells
+
+        :param arrivals: dict mapping flat cell indices to a pair of lists, the herbivores and
+        the carnivores arriving in that cell
+        """
+        for target, (herbs, carns) in arrivals.items():
+            self.flat_map[target].pop_herb.extend(herbs)
+            self.flat_map[target].pop_carn.extend(carns)
+        self.active.update(arrivals)
+
+    def move(self, x, y, rng=None):
+        """
+        Method that may move the animals in a cell to a neighbouring cell
 
         :param x: row coordinate of the animals current position
         :param y: column coordinate of animals current position
+        :param rng: the random number stream used for the migration. If None, the migration
+        stream of the current year is used
         """
-        not_move_herb = []
-        not_move_carn = []
+        rng = rng if rng is not None else self.stream('migration')
+        arrivals = {}
+        self._leave(self.cell_index(x, y), arrivals, rng)
+        self._arrive(arrivals)
 
-        for animal in self.map[x][y].pop_herb + self.map[x][y].pop_carn:
-            if animal.not_walked:
-                direction = animal.move_dir()
-                if not direction:
-                    if animal.specie == 'Herbivore':
-                        not_move_herb.append(animal)
-                    else:
-                        not_move_carn.append(animal)
+    def migrate(self, rng=None):
+        """
+        Method that lets the animals in all cells migrate. Every animal decides whether and
+        where to move before any of them arrive, and the destinations are looked up in the
+        table of habitable neighbours
 
-                elif direction == 'North':
-                    if self.map[x - 1][y].habitable:
-                        animal.not_walked = False
-                        if animal.specie == 'Herbivore':
-                            self.map[x - 1][y].pop_herb.append(animal)
-                        else:
-                            self.map[x - 1][y].pop_carn.append(animal)
-                    else:
-                        if animal.specie == 'Herbivore':
-                            not_move_herb.append(animal)
-                        else:
-                            not_move_carn.append(animal)
-
-                elif direction == 'East':
-                    if self.map[x][y + 1].habitable:
-                        animal.not_walked = False
-                        if animal.specie == 'Herbivore':
-                            self.map[x][y + 1].pop_herb.append(animal)
-                        else:
-                            self.map[x][y + 1].pop_carn.append(animal)
-                    else:
-                        if animal.specie == 'Herbivore':
-                            not_move_herb.append(animal)
-                        else:
-                            not_move_carn.append(animal)
-
-                elif direction == 'South':
-                    if self.map[x + 1][y].habitable:
-                        animal.not_walked = False
-                        if animal.specie == 'Herbivore':
-                            self.map[x + 1][y].pop_herb.append(animal)
-                        else:
-                            self.map[x + 1][y].pop_carn.append(animal)
-                    else:
-                        if animal.specie == 'Herbivore':
-                            not_move_herb.append(animal)
-                        else:
-                            not_move_carn.append(animal)
-
-                elif direction == 'West':
-                    if self.map[x][y - 1].habitable:
-                        animal.not_walked = False
-                        if animal.specie == 'herbivore':
-                            self.map[x][y - 1].pop_herb.append(animal)
-                        else:
-                            self.map[x][y - 1].pop_carn.append(animal)
-                    else:
-                        if animal.specie == 'Herbivore':
-                            not_move_herb.append(animal)
-                        else:
-                            not_move_carn.append(animal)
+        :param rng: the random number stream used for the migration. If None, the migration
+        stream of the current year is used
+        :return: int, the number of animals that moved
+        """
+        rng = rng if rng is not None else self.stream('migration')
+        arrivals = {}
+        for ix in self.occupied_cells():
+            self._leave(ix, arrivals, rng)
+        self._arrive(arrivals)
+        return sum(len(herbs) + len(carns) for herbs, carns in arrivals.values())
 
+    def migrate_array(self, pop, rng=None):
+        """
+        Method that lets all animals of a Population migrate at once, following the rules in
+        Animal.move_dir
+
+        :param pop: Population containing the animals
+        :param rng: the random number stream used for the migration. If None, the migration
+        stream of the current year is used
+        :return: int, the number of animals that moved
+        """
+        rng = rng if rng is not None else self.stream('migration')
+        moving = np.flatnonzero(rng.random(len(pop)) <= pop.animal.mu * pop.fitness())
+        targets = self.neighbours[pop.cell[moving], rng.integers(0, 4, len(moving))]
+        habitable = targets >= 0
+        pop.cell[moving[habitable]] = targets[habitable]
+        pop.invalidate_order()
+        return int(habitable.sum())
+
+    def animal_arrays(self):
+        """
+        Method that collects the ages and weights of the animals, without touching the food
+        in the cells
+
+        :return: dict mapping each species to a pair of arrays, the ages and the weights
+        """
+        if self.backend == 'array':
+            return {specie: (pop.a, pop.w) for specie, pop in self.populations.items()}
+
+        occupied = self.occupied_cells()
+        arrays = {}
+        for specie in self.populations:
+            animals = [animal for ix in occupied
+                       for animal in (self.flat_map[ix].pop_herb if specie == 'Herbivore'
+                                      else self.flat_map[ix].pop_carn)]
+            arrays[specie] = (np.array([animal.a for animal in animals], dtype=np.int64),
+                              np.array([animal.w for animal in animals], dtype=np.float64))
+        return arrays
+
+    def state(self):
+        """
+        Method that collects the state of the cells and animals in arrays, e.g. for a
+        checkpoint
+
+        :return: dict with the food in every cell under 'food', and the ages, weights and flat
+        cell indices of the animals of each species under '<species>_a', '<species>_w' and
+        '<species>_cell'
+        """
+        self.update_food()
+        state = {'food': np.array([cell.food for cell in self.flat_map], dtype=np.float64)}
+        for specie, pop in self.populations.items():
+            if self.backend == 'array':
+                a, w, cells = pop.a, pop.w, pop.cell
             else:
-                if animal.specie == 'Herbivore':
-                    not_move_herb.append(animal)
+                animals = [(animal.a, animal.w, ix) for ix in self.occupied_cells()
+                           for animal in (self.flat_map[ix].pop_herb if specie == 'Herbivore'
+                                          else self.flat_map[ix].pop_carn)]
+                a, w, cells = (list(column) for column in zip(*animals)) if animals \
+                    else ([], [], [])
+            state[specie + '_a'] = np.array(a, dtype=np.int64)
+            state[specie + '_w'] = np.array(w, dtype=np.float64)
+            state[specie + '_cell'] = np.array(cells, dtype=np.int64)
+        return state
+
+    def load_state(self, state):
+        """
+        Method that replaces the cells and animals with a state from the state method
+
+        :param state: dict of arrays, as given by state
+        """
+        for cell, food in zip(self.flat_map, state['food'].tolist()):
+            cell.food = food
+        self.food_year = [self.year] * len(self.flat_map)
+        for specie, pop in self.populations.items():
+            a, w, cells = (state[specie + key] for key in ('_a', '_w', '_cell'))
+            if self.backend == 'array':
+                pop.keep(np.zeros(len(pop), dtype=bool))
+                pop.add(a, w, cells)
+                continue
+
+            animal = self.species[specie]
+            for cell in self.flat_map:
+                if specie == 'Herbivore':
+                    cell.pop_herb = []
                 else:
-                    not_move_carn.append(animal)
+                    cell.pop_carn = []
+            for age, weight, ix in zip(a.tolist(), w.tolist(), cells.tolist()):
+                cell = self.flat_map[ix]
+                (cell.pop_herb if specie == 'Herbivore' else cell.pop_carn).append(
+                    animal(specie, age, weight))
+        self.refresh_active()
+        self.update_counts()
+
+    def update_counts(self):
+        """
+        Method that counts the animals of each species in every cell. The counts are stored in
+        counts, as arrays with one entry per cell, and the number of animals on the island in
+        totals
+        """
+        shape = self.island.cell_ids.shape
+        if self.backend == 'array':
+            self.counts = {specie: pop.count(self.n_cells).reshape(shape)
+                           for specie, pop in self.populations.items()}
+        else:
+            occupied = self.occupied_cells()
+            herbs = np.zeros(self.n_cells, dtype=np.int64)
+            carns = np.zeros(self.n_cells, dtype=np.int64)
+            herbs[occupied] = [len(self.flat_map[ix].pop_herb) for ix in occupied]
+            carns[occupied] = [len(self.flat_map[ix].pop_carn) for ix in occupied]
+            self.counts = {'Herbivore': herbs.reshape(shape), 'Carnivore': carns.reshape(shape)}
+
+        self.totals = {specie: int(count.sum()) for specie, count in self.counts.items()}
+
+    def update_food(self, cells=None):
+        """
+        Method that renews the food in cells for the years they have not been visited in, up
+        to the start of the current year
+
+        :param cells: iterable of flat cell indices. If None, every cell where the food
+        regrows is brought up to date, e.g. before the food is read
+        """
+        for ix in (cells if cells is not None else self.regrowing):
+            self.flat_map[ix].idle(self.year - self.food_year[ix])
+            self.food_year[ix] = self.year
+
+    def grazing(self):
+        """
+        Method for the first phase of the year: the herbivores graze. Only the cells where
+        animals live are visited, and their food is first renewed for the years they were
+        not visited in
+        """
+        if self.backend == 'array':
+            herbs = self.populations['Herbivore']
+            cells = np.flatnonzero(herbs.count(self.n_cells)).tolist()
+            self.update_food(cells)
+            self._grazed = graze_array(self.flat_map, herbs, ())
+        else:
+            cells = list(self.active)
+            self.update_food(cells)
+            for ix in cells:
+                self.flat_map[ix].feeding_herb()
+
+        for ix in cells:
+            self.food_year[ix] = self.year + 1
+
+    def hunting(self):
+        """
+        Method for the phase of the year where the carnivores hunt in the cells where there are
+        herbivores too. Hunting in a cell draws from a stream of its own.
+        """
+        if self.backend == 'array':
+            grazed, self._grazed = self._grazed, None
+            hunt_array(self.flat_map, self.populations['Herbivore'],
+                       self.populations['Carnivore'], grazed, self.seeds, self.year)
+            return
+
+        for ix in self.occupied_cells():
+            cell = self.flat_map[ix]
+            if cell.pop_carn and cell.pop_herb:
+                cell.feeding_carn(self.stream('feeding', ix))
+
+    def birth(self):
+        """
+        Method for the birth phase of the year, drawing from one stream for the whole island
+        """
+        rng = self.stream('birth')
+        if self.backend == 'array':
+            for pop in self.populations.values():
+                pop.give_birth(None, pop.count(self.n_cells)[pop.cell], rng)
+            return
+
+        for ix in self.occupied_cells():
+            self.flat_map[ix].birth(rng)
+
+    def migration(self):
+        """
+        Method for the migration phase of the year, drawing from one stream for the whole
+        island
+
+        :return: int, the number of animals that moved
+        """
+        rng = self.stream('migration')
+        if self.backend == 'array':
+            return sum(self.migrate_array(pop, rng) for pop in self.populations.values())
+
+        return self.migrate(rng)
+
+    def aging(self):
+        """
+        Method for the phase of the year where the animals grow one year older
+        """
+        if self.backend == 'array':
+            for pop in self.populations.values():
+                pop.aging()
+            return
+
+        for ix in self.occupied_cells():
+            cell = self.flat_map[ix]
+            cell.set_not_walked_true()
+            cell.age()
 
-        self.map[x][y].pop_herb = not_move_herb
-        self.map[x][y].pop_carn = not_move_carn
+    def weight_loss(self):
+        """
+        Method for the phase of the year where the animals loose weight
+        """
+        if self.backend == 'array':
+            for pop in self.populations.values():
+                pop.loose_weight()
+            return
+
+        for ix in self.occupied_cells():
+            self.flat_map[ix].weight_loss()
+
+    def death(self):
+        """
+        Method for the last phase of the year, where animals may die, drawing from one stream
+        for the whole island
+        """
+        rng = self.stream('death')
+        if self.backend == 'array':
+            for pop in self.populations.values():
+                pop.keep(pop.survival(rng=rng))
+            return
+
+        for ix in self.occupied_cells():
+            self.flat_map[ix].survive(rng)
+
+    def count_animals(self):
+        """
+        Method that counts the animals on the island at the moment, also in the middle of a
+        year
+
+        :return: int, the number of animals
+        """
+        if self.backend == 'array':
+            return sum(len(pop) for pop in self.populations.values())
+        return sum(len(self.flat_map[ix].pop_herb) + len(self.flat_map[ix].pop_carn)
+                   for ix in self.active)
+
+    def end_year(self):
+        """
+        Method that counts the animals and moves on to the next year
+        """
+        self.update_counts()
+        self.year += 1
 
     def cell_cycle(self):
         """
-        Method that completes a full cycle of events through a year for all animals in all cells
-        """
-        for x, row in enumerate(self.map):
-            for y, cell in enumerate(row):
-                cell.feeding_herb()
-                cell.feeding_carn()
-                cell.birth()
-                self.move(x, y)
-
-        for row in self.map:
-            for cell in row:
-                cell.set_not_walked_true()
-                cell.age()
-                cell.weight_loss()
-                cell.survive()
+        Method that completes a full cycle of events through a year for all animals in all cells,
+        running the phases in the order given by phases. With the array backend, feeding is done
+        cell by cell, while the other phases are done for the whole island at once. If a
+        PhaseRecorder is set as recorder, it runs the phases and records the year.
+        """
+        if self.recorder is None:
+            for phase in self.phases:
+                getattr(self, phase)()
+        else:
+            self.recorder.run_year(self)
+        self.end_year()
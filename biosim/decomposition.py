@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import multiprocessing
+import os
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from biosim.cell_control import Cells, feed_array
+from biosim.mapping import Island
+from biosim.parameters import Parameters
+from biosim.population import Population
+from biosim.random_streams import SeedTree
+
+"""
+Runs one island in row bands, each band in a worker process of its own
+"""
+
+
+class _Band:
+    """
+    The cells and animals of a band of consecutive rows. The animals are kept in one
+    Population per species, with cell indices counted from the first cell of the band.
+    """
+
+    def __init__(self, band, letters, first_cell, neighbours, params, entropy):
+        """
+        :param band: int, the number of the band, used to key its random number streams
+        :param letters: list of the rows of the letter map in the band
+        :param first_cell: flat index on the island of the first cell in the band
+        :param neighbours: the rows of the neighbour table of the island for the cells in the
+        band, holding flat indices on the island
+        :param params: the Parameters of the simulation
+        :param entropy: the entropy of the SeedTree of the simulation
+        """
+        self.band = band
+        self.params = params
+        landscapes = params.landscapes()
+        self.letters = ''.join(letters)
+        self.flat_map = [landscapes[letter]() for letter in self.letters]
+        self.first_cell = first_cell
+        self.n_cells = len(self.flat_map)
+        self.regrowing = [ix for ix, cell in enumerate(self.flat_map) if cell.f_max > 0]
+        self.neighbours = neighbours
+        self.seeds = SeedTree(entropy)
+        self.populations = {specie: Population(specie, animal=params.species(specie))
+                            for specie in ('Herbivore', 'Carnivore')}
+        self.counts = None
+
+    def add(self, batches):
+        """
+        Method that places animals in the band, and writes the new counts
+
+        :param batches: list of (specie, ages, weights, cells) tuples, with the species name,
+        sequences of ages and weights, and the flat cell indices on the island
+        """
+        for specie, ages, weights, cells in batches:
+            self.populations[specie].add(ages, weights, np.asarray(cells) - self.first_cell)
+        self.write_counts()
+
+    def write_counts(self):
+        """
+        Method that writes the number of animals per cell in the band to counts
+        """
+        for row, pop in enumerate(self.populations.values()):
+            self.counts[row, self.first_cell:self.first_cell + self.n_cells] = \
+                pop.count(self.n_cells)
+
+    def state(self):
+        """
+        Method that collects the state of the band in arrays, as in Cells.state
+
+        :return: dict of arrays, with flat cell indices on the island
+        """
+        state = {'food': np.array([cell.food for cell in self.flat_map], dtype=np.float64)}
+        for specie, pop in self.populations.items():
+            state[specie + '_a'] = pop.a.astype(np.int64)
+            state[specie + '_w'] = pop.w.copy()
+            state[specie + '_cell'] = pop.cell.astype(np.int64) + self.first_cell
+        return state
+
+    def animal_arrays(self):
+        """
+        Method that collects the ages and weights of the animals in the band
+
+        :return: dict mapping each species to a pair of arrays, the ages and the weights
+        """
+        return {specie: (pop.a.astype(np.int64), pop.w.copy())
+                for specie, pop in self.populations.items()}
+
+    def load_state(self, state):
+        """
+        Method that replaces the cells and animals of the band with a state
+
+        :param state: dict of arrays, as given by state
+        """
+        for cell, food in zip(self.flat_map, state['food'].tolist()):
+            cell.food = food
+        for specie, pop in self.populations.items():
+            pop.keep(np.zeros(len(pop), dtype=bool))
+            pop.add(state[specie + '_a'], state[specie + '_w'],
+                    state[specie + '_cell'] - self.first_cell)
+        self.write_counts()
+
+    def set_parameters(self, params):
+        """
+        Method that moves the cells and animals to the classes of a new parameter set
+
+        :param params: the new Parameters
+        """
+        self.params = params
+        landscapes = params.landscapes()
+        for letter, cell in zip(self.letters, self.flat_map):
+            cell.__class__ = landscapes[letter]
+        for specie, pop in self.populations.items():
+            pop.animal = params.species(specie)
+            pop.invalidate_order()
+
+    def grow(self, year):
+        """
+        Method that runs the first half of a year: feeding, birth and migration. Animals that
+        migrate to a cell outside the band are removed from it.
+
+        :param year: int, the simulated year
+        :return: dict mapping each species to the ages, weights and flat cell indices on the
+        island of the animals that left the band
+        """
+        herbs = self.populations['Herbivore']
+        carns = self.populations['Carnivore']
+        feed_array(self.flat_map, herbs, carns, self.seeds, year, self.first_cell,
+                   self.regrowing)
+
+        rng = self.seeds.stream(year, 'birth', self.band)
+        for pop in (herbs, carns):
+            pop.give_birth(None, pop.count(self.n_cells)[pop.cell], rng)
+
+        rng = self.seeds.stream(year, 'migration', self.band)
+        emigrants = {}
+        for specie, pop in self.populations.items():
+            moving = np.flatnonzero(rng.random(len(pop)) <= pop.animal.mu * pop.fitness())
+            targets = self.neighbours[pop.cell[moving], rng.integers(0, 4, len(moving))]
+            moving, targets = moving[targets >= 0], targets[targets >= 0]
+
+            local = targets - self.first_cell
+            inside = (local >= 0) & (local < self.n_cells)
+            pop.cell[moving[inside]] = local[inside]
+            pop.cell[moving[~inside]] = targets[~inside]
+            leaving = np.zeros(len(pop), dtype=bool)
+            leaving[moving[~inside]] = True
+            emigrants[specie] = pop.take(leaving)
+            pop.invalidate_order()
+        return emigrants
+
+    def settle(self, year, immigrants):
+        """
+        Method that runs the second half of a year: the animals arriving from other bands are
+        placed, and then all animals age, loose weight and may die. The number of animals per
+        cell is written to counts.
+
+        :param year: int, the simulated year
+        :param immigrants: dict mapping each species to a list of (ages, weights, cells)
+        tuples of arriving animals, with flat cell indices on the island
+        """
+        for specie, batches in immigrants.items():
+            for ages, weights, cells in batches:
+                self.populations[specie].add(ages, weights, cells - self.first_cell)
+
+        rng = self.seeds.stream(year, 'death', self.band)
+        for pop in self.populations.values():
+            pop.aging()
+            pop.loose_weight()
+            pop.keep(pop.survival(rng=rng))
+        self.write_counts()
+
+
+def _serve_band(connection, spec, memory_name, n_cells):
+    """
+    Function that runs in a worker process. It holds one band, and calls the methods the
+    parent asks for until it receives None.
+
+    :param connection: the worker end of a multiprocessing Pipe
+    :param spec: tuple of the arguments to _Band
+    :param memory_name: str, the name of the shared memory holding the counts
+    :param n_cells: int, the number of cells on the island
+    """
+    memory = SharedMemory(name=memory_name)
+    band = _Band(*spec)
+    band.counts = np.ndarray((2, n_cells), dtype=np.int64, buffer=memory.buf)
+    try:
+        while True:
+            request = connection.recv()
+            if request is None:
+                break
+            method, args = request
+            try:
+                connection.send((True, getattr(band, method)(*args)))
+            except Exception as err:
+                connection.send((False, err))
+    finally:
+        band.counts = None
+        memory.close()
+
+
+def _shut_down(connections, workers, memory):
+    """
+    Function that stops the worker processes and frees the shared memory
+
+    :param connections: the parent ends of the pipes to the workers
+    :param workers: the worker processes
+    :param memory: the SharedMemory holding the counts
+    """
+    for connection in connections:
+        try:
+            connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+    for worker in workers:
+        worker.join(timeout=5)
+        if worker.is_alive():
+            worker.terminate()
+    memory.close()
+    memory.unlink()
+
+
+class DecomposedCells:
+    """
+    Runs the annual cycle of an island split into bands of consecutive rows. Feeding, birth,
+    aging, weight loss and death happen inside each band, in a worker process per band, and
+    only the animals migrating across a band border are sent between the processes. The
+    number of animals per cell is gathered in shared memory.
+
+    The results follow the same rules as the array backend of Cells. Hunting uses the same
+    stream per cell, while birth, migration and death draw from one stream per band instead
+    of one for the whole island, so runs are reproducible for a given number of bands and
+    statistically identical to the serial engine.
+    """
+
+    def __init__(self, population_cell=None, island_map=None, seed=None, params=None,
+                 n_bands=None, processes=True):
+        """
+        :param population_cell: list of dicts containing animals in locations. If None, the
+        default in the Cells class is used
+        :param island_map: a string containing the letters O, M, D, J and S, representing the
+        landscape types. If None, the default in the Island class is used
+        :param seed: int used as random number seed
+        :param params: the Parameters of the simulation. If None, the parameters are read from
+        the Herbivore, Carnivore, Jungle and Savannah classes
+        :param n_bands: int, the number of bands. If None, one per CPU is used
+        :param processes: bool, False to run all bands in this process, e.g. for debugging
+        """
+        self.population_cell = population_cell if population_cell is not None \
+            else Cells.default_population
+        self.island = Island(island_map)
+        self.island.validate()
+        self.island.compile()
+        self.params = params if params is not None else Parameters.from_classes()
+        self.seeds = SeedTree(seed)
+        self.year = 0
+
+        rows, cols = self.island.cell_ids.shape
+        n_bands = min(n_bands if n_bands is not None else os.cpu_count() or 1, rows)
+        row_bounds = np.linspace(0, rows, n_bands + 1).round().astype(int)
+        self.first_cells = row_bounds[:-1] * cols
+        letters = self.island.letter_map.split()
+        specs = [(band, letters[start:stop], start * cols,
+                  self.island.neighbours[start * cols:stop * cols], self.params,
+                  self.seeds.entropy)
+                 for band, (start, stop) in enumerate(zip(row_bounds[:-1], row_bounds[1:]))]
+
+        self._memory = SharedMemory(create=True, size=2 * self.n_cells * 8)
+        self._counts = np.ndarray((2, self.n_cells), dtype=np.int64, buffer=self._memory.buf)
+        self._counts[:] = 0
+        self._bands = []
+        self._connections = []
+        workers = []
+        if processes:
+            for spec in specs:
+                parent_end, worker_end = multiprocessing.Pipe()
+                worker = multiprocessing.Process(target=_serve_band, daemon=True,
+                                                 args=(worker_end, spec, self._memory.name,
+                                                       self.n_cells))
+                worker.start()
+                self._connections.append(parent_end)
+                workers.append(worker)
+        else:
+            for spec in specs:
+                band = _Band(*spec)
+                band.counts = self._counts
+                self._bands.append(band)
+
+        self._finalizer = weakref.finalize(self, _shut_down, self._connections, workers,
+                                           self._memory)
+        self.counts = {}
+        self.totals = {}
+        self.update_counts()
+
+    @property
+    def n_cells(self):
+        """Number of cells on the island"""
+        return self.island.cell_ids.size
+
+    @property
+    def n_bands(self):
+        """Number of bands the island is split into"""
+        return len(self.first_cells)
+
+    def _call(self, method, args_per_band):
+        """
+        Method that calls a method of every band, in parallel when the bands run in worker
+        processes
+
+        :param method: str, the name of the _Band method
+        :param args_per_band: list with a tuple of arguments for every band
+        :return: list with the result from every band
+        """
+        if self._bands:
+            return [getattr(band, method)(*args) for band, args in zip(self._bands,
+                                                                      args_per_band)]
+
+        for connection, args in zip(self._connections, args_per_band):
+            connection.send((method, args))
+        results = []
+        for connection in self._connections:
+            ok, result = connection.recv()
+            if not ok:
+                raise result
+            results.append(result)
+        return results
+
+    def band_of(self, cells):
+        """
+        Method that finds the band of cells
+
+        :param cells: array of flat cell indices on the island
+        :return: array with the number of the band of each cell
+        """
+        return np.searchsorted(self.first_cells, cells, side='right') - 1
+
+    def generate_animals(self):
+        """
+        Method that places the animals in population_cell in their bands
+        """
+        batches = [[] for _ in range(self.n_bands)]
+        for lo in self.population_cell:
+            x, y = lo['loc']
+            x -= 1
+            y -= 1
+            if not self.island.habitable[x, y]:
+                raise ValueError('The location of animal is not habitable')
+
+            cell = int(self.island.cell_ids[x, y])
+            band = int(self.band_of(cell))
+            for specie in ('Herbivore', 'Carnivore'):
+                animals = [ind for ind in lo['pop'] if ind['species'] == specie]
+                if animals:
+                    batches[band].append((specie, [ind['age'] for ind in animals],
+                                          [ind['weight'] for ind in animals], cell))
+
+        self._call('add', [(batch,) for batch in batches])
+        self.update_counts()
+
+    def set_parameters(self, params):
+        """
+        Method that lets the simulation continue with a new parameter set
+
+        :param params: the new Parameters
+        """
+        if params == self.params:
+            return
+        self.params = params
+        self._call('set_parameters', [(params,) for _ in range(self.n_bands)])
+
+    def cell_cycle(self):
+        """
+        Method that completes a full cycle of events through a year for all animals. The bands
+        run the first half of the year, the migrants crossing band borders are handed to their
+        new bands, and the bands run the second half.
+        """
+        emigrants = self._call('grow', [(self.year,) for _ in range(self.n_bands)])
+
+        immigrants = [{'Herbivore': [], 'Carnivore': []} for _ in range(self.n_bands)]
+        for leaving in emigrants:
+            for specie, (ages, weights, cells) in leaving.items():
+                bands = self.band_of(cells)
+                for band in np.unique(bands).tolist():
+                    mask = bands == band
+                    immigrants[band][specie].append((ages[mask], weights[mask], cells[mask]))
+
+        self._call('settle', [(self.year, arriving) for arriving in immigrants])
+        self.update_counts()
+        self.year += 1
+
+    def state(self):
+        """
+        Method that collects the state of the cells and animals in all bands in arrays, as in
+        Cells.state
+
+        :return: dict of arrays
+        """
+        states = self._call('state', [() for _ in range(self.n_bands)])
+        return {key: np.concatenate([state[key] for state in states]) for key in states[0]}
+
+    def animal_arrays(self):
+        """
+        Method that collects the ages and weights of the animals in all bands, as in
+        Cells.animal_arrays
+
+        :return: dict mapping each species to a pair of arrays, the ages and the weights
+        """
+        arrays = self._call('animal_arrays', [() for _ in range(self.n_bands)])
+        return {specie: tuple(np.concatenate([band[specie][ix] for band in arrays])
+                              for ix in range(2))
+                for specie in ('Herbivore', 'Carnivore')}
+
+    def load_state(self, state):
+        """
+        Method that replaces the cells and animals in all bands with a state from the state
+        method
+
+        :param state: dict of arrays, as given by state
+        """
+        last_cells = list(self.first_cells[1:]) + [self.n_cells]
+        states = [{'food': state['food'][first:last]}
+                  for first, last in zip(self.first_cells, last_cells)]
+        for specie in ('Herbivore', 'Carnivore'):
+            bands = self.band_of(state[specie + '_cell'])
+            for band, band_state in enumerate(states):
+                for key in ('_a', '_w', '_cell'):
+                    band_state[specie + key] = state[specie + key][bands == band]
+        self._call('load_state', [(band_state,) for band_state in states])
+        self.update_counts()
+
+    def update_counts(self):
+        """
+        Method that reads the number of animals of each species in every cell from the shared
+        memory. The counts are stored in counts, as arrays with the shape of the map, and the
+        number of animals on the island in totals
+        """
+        shape = self.island.cell_ids.shape
+        self.counts = {specie: self._counts[row].reshape(shape).copy()
+                       for row, specie in enumerate(('Herbivore', 'Carnivore'))}
+        self.totals = {specie: int(count.sum()) for specie, count in self.counts.items()}
+
+    def close(self):
+        """
+        Method that stops the worker processes and frees the shared memory. Called
+        automatically when the object is garbage collected
+        """
+        self._finalizer()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import multiprocessing
+import numpy as np
+from biosim.parameters import Parameters
+from biosim.simulation import BioSim
+
+"""
+Runs many replicates of a simulation, one per seed, in a pool of processes
+"""
+
+
+def replicate_counts(task):
+    """
+    Function that runs one replicate, e.g. in a worker process
+
+    :param task: tuple of island map, initial population, Parameters, seed, number of years
+    and engine
+    :return: array of shape (num_years + 1, 2) with the number of herbivores and carnivores
+    at the start and at the end of every year
+    """
+    island_map, ini_pop, params, seed, num_years, engine = task
+    sim = BioSim(seed=seed, island_map=island_map, ini_pop=ini_pop, engine=engine,
+                 params=params, headless=True)
+    counts = np.zeros((num_years + 1, 2), dtype=np.int64)
+    for year in range(num_years + 1):
+        if year > 0:
+            sim.simulate(1)
+        totals = sim.num_animals_per_species
+        counts[year] = totals['Herbivore'], totals['Carnivore']
+    return counts
+
+
+class Ensemble:
+    """
+    Runs replicates of one simulation setup with different seeds, and summarises the number
+    of animals per year. Only the yearly counts are sent back from the worker processes, never
+    the populations.
+    """
+
+    def __init__(self, island_map=None, ini_pop=None, params=None, engine='array'):
+        """
+        :param island_map: Multi-line string specifying island geography. If None, the default
+        in the Island class is used
+        :param ini_pop: List of dictionaries specifying initial population. If None, the
+        default in the Cells class is used
+        :param params: Parameters used by every replicate, or a dict mapping 'Herbivore',
+        'Carnivore', 'J' or 'S' to a dict of parameter values that replace the defaults
+        :param engine: String, 'object' or 'array', the engine used by every BioSim
+        """
+        self.island_map = island_map
+        self.ini_pop = ini_pop
+        if not isinstance(params, Parameters):
+            overrides = params if params is not None else {}
+            params = Parameters.from_classes()
+            for owner, new_params in overrides.items():
+                params = params.update(owner, new_params)
+        self.params = params
+        self.engine = engine
+        self.counts = None
+        self.seeds = None
+
+    def run(self, seeds, num_years, processes=None):
+        """
+        Method that runs one replicate per seed. The counts of every replicate are stored in
+        counts, an array of shape (len(seeds), num_years + 1, 2), where the last axis holds
+        herbivores and carnivores and year 0 is the initial population.
+
+        :param seeds: sequence of ints, one seed per replicate
+        :param num_years: number of years to simulate
+        :param processes: number of worker processes. If None, one per CPU is used. With 1,
+        the replicates run in this process
+        :return: counts
+        """
+        self.seeds = list(seeds)
+        tasks = [(self.island_map, self.ini_pop, self.params, seed, num_years, self.engine)
+                 for seed in self.seeds]
+
+        if processes == 1 or len(tasks) <= 1:
+            results = [replicate_counts(task) for task in tasks]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.map(replicate_counts, tasks, chunksize=1)
+
+        self.counts = np.stack(results) if results else \
+            np.zeros((0, num_years + 1, 2), dtype=np.int64)
+        return self.counts
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        """
+        Method that summarises the counts of the last run over the replicates
+
+        :param quantiles: sequence of quantiles to compute, between 0 and 1
+        :return: dict mapping 'Herbivore' and 'Carnivore' to a dict with the mean count per
+        year under 'mean', and under 'quantiles' a dict mapping every quantile to the count per
+        year
+        """
+        if self.counts is None:
+            raise RuntimeError('The ensemble has not been run')
+
+        summary = {}
+        for ix, specie in enumerate(('Herbivore', 'Carnivore')):
+            counts = self.counts[:, :, ix]
+            summary[specie] = {'mean': counts.mean(axis=0),
+                               'quantiles': {q: np.quantile(counts, q, axis=0)
+                                             for q in quantiles}}
+        return summary
+
+
+def run_ensemble(seeds, num_years, island_map=None, ini_pop=None, params=None,
+                 engine='array', processes=None, quantiles=(0.05, 0.5, 0.95)):
+    """
+    Function that runs one replicate per seed in a pool of processes and summarises the
+    number of animals per year
+
+    :param seeds: sequence of ints, one seed per replicate
+    :param num_years: number of years to simulate
+    :param island_map: Multi-line string specifying island geography
+    :param ini_pop: List of dictionaries specifying initial population
+    :param params: Parameters used by every replicate, or a dict mapping 'Herbivore',
+    'Carnivore', 'J' or 'S' to a dict of parameter values that replace the defaults
+    :param engine: String, 'object' or 'array'
+    :param processes: number of worker processes. If None, one per CPU is used
+    :param quantiles: sequence of quantiles to compute, between 0 and 1
+    :return: the summary, as returned by Ensemble.summary
+    """
+    ensemble = Ensemble(island_map, ini_pop, params, engine)
+    ensemble.run(seeds, num_years, processes)
+    return ensemble.summary(quantiles)
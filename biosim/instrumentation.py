@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import csv
+import time
+from dataclasses import dataclass, field
+from biosim.cell_control import Cells
+
+"""
+Records where the time of every simulated year goes, and what happened in it
+"""
+
+
+@dataclass
+class YearRecord:
+    """
+    The record of one simulated year: the wall time in seconds of every phase, the number of
+    animals at the start of the year, and the number of births, deaths, kills and migrations
+    """
+    year: int
+    animals: int
+    seconds: dict = field(default_factory=dict)
+    births: int = 0
+    deaths: int = 0
+    kills: int = 0
+    migrations: int = 0
+
+    @property
+    def total_seconds(self):
+        """The wall time of the whole year, including output such as graphics"""
+        return sum(self.seconds.values())
+
+    @property
+    def phase_seconds(self):
+        """The wall time of the phases of the annual cycle, without output"""
+        return sum(seconds for part, seconds in self.seconds.items() if part in Cells.phases)
+
+    @property
+    def animal_years_per_second(self):
+        """
+        The number of animals simulated through the year per second spent in the phases. Time
+        spent on output is left out, so the rate measures the simulation only
+        """
+        seconds = self.phase_seconds
+        return self.animals / seconds if seconds > 0 else 0.
+
+
+class PhaseRecorder:
+    """
+    Times the phases of the annual cycle and counts births, deaths, kills and migrations. Set
+    it as the recorder of a Cells, or give it to BioSim, to record every year in records.
+    Without a recorder nothing is timed or counted.
+    """
+    counted_phases = {'hunting': 'kills', 'birth': 'births', 'death': 'deaths'}
+
+    def __init__(self):
+        self.records = []
+
+    def run_year(self, cells):
+        """
+        Method that runs the phases of one year of a Cells, and records the year
+
+        :param cells: the Cells
+        :return: the YearRecord of the year
+        """
+        record = YearRecord(cells.year, cells.count_animals())
+        animals = record.animals
+        for phase in cells.phases:
+            start = time.perf_counter()
+            result = getattr(cells, phase)()
+            record.seconds[phase] = time.perf_counter() - start
+
+            if phase == 'migration':
+                record.migrations = result
+            elif phase in self.counted_phases:
+                before, animals = animals, cells.count_animals()
+                setattr(record, self.counted_phases[phase], abs(animals - before))
+        self.records.append(record)
+        return record
+
+    def add_seconds(self, part, seconds):
+        """
+        Method that adds time spent outside the phases, e.g. on graphics, to the last year
+
+        :param part: str, the name the time is recorded under
+        :param seconds: float, the wall time
+        """
+        if self.records:
+            seconds_so_far = self.records[-1].seconds.get(part, 0.)
+            self.records[-1].seconds[part] = seconds_so_far + seconds
+
+    def export(self, path):
+        """
+        Method that writes the records to a CSV file, one row per year, with the seconds of
+        every phase in columns named seconds_<phase>
+
+        :param path: String, file name of the CSV file
+        """
+        parts = []
+        for record in self.records:
+            parts.extend(part for part in record.seconds if part not in parts)
+
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['year', 'animals', 'births', 'deaths', 'kills', 'migrations',
+                             'total_seconds', 'phase_seconds', 'animal_years_per_second'] +
+                            ['seconds_' + part for part in parts])
+            for record in self.records:
+                writer.writerow([record.year, record.animals, record.births, record.deaths,
+                                 record.kills, record.migrations, record.total_seconds,
+                                 record.phase_seconds, record.animal_years_per_second] +
+                                [record.seconds.get(part, 0.) for part in parts])
@@ -6,20 +6,88 @@ __email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
 """
 
 
-from biosim.animals import Animal, Carnivore, Herbivore
+from biosim.animals import Carnivore, Herbivore
+from biosim.random_streams import default_stream
+from bisect import bisect_left
 import math
+import weakref
+import numpy as np
 
 """
 Manages landscape instances, each containing a list which may contain animal instances
 """
 
 
+class _PreyIndex:
+    """
+    A Fenwick tree over the herbivores of a cell, sorted by fitness, that keeps track of which
+    herbivores are still alive. Finding the k-th living herbivore and removing a herbivore
+    both take O(log n) time.
+    """
+
+    def __init__(self, n):
+        """
+        :param n: int, the number of herbivores, all alive to begin with
+        """
+        self.n = n
+        self.tree = [i & -i for i in range(n + 1)]
+        self.top = 1 << (n.bit_length() - 1) if n > 0 else 0
+
+    def remove(self, i):
+        """
+        Method that marks a herbivore as killed
+
+        :param i: position of the herbivore in the sorted order, starting at 0
+        """
+        i += 1
+        while i <= self.n:
+            self.tree[i] -= 1
+            i += i & -i
+
+    def alive_before(self, i):
+        """
+        Method that counts the living herbivores before a position
+
+        :param i: position in the sorted order
+        :return: the number of living herbivores at positions 0 to i - 1
+        """
+        count = 0
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    def kth(self, k):
+        """
+        Method that finds the k-th living herbivore
+
+        :param k: int, starting at 0. Must be less than the number of living herbivores
+        :return: the position of the herbivore in the sorted order
+        """
+        pos = 0
+        step = self.top
+        while step:
+            if pos + step <= self.n and self.tree[pos + step] <= k:
+                pos += step
+                k -= self.tree[pos]
+            step >>= 1
+        return pos
+
+
+# The bound classes are kept only as long as some simulation uses them
+_bound_classes = weakref.WeakValueDictionary()
+
+
 class Landscape:
     """
     The class contains different methods that change landscape attributes and parameters.
     It also contains methods iterating through animal-instances, and changing the animal attributes
     """
     param_landscape_limits = {'f_max': (0, math.inf), 'alpha': (0, 1)}
+    f_max = 0
+    params = None
+    herbivore = Herbivore
+    carnivore = Carnivore
 
     @classmethod
     def set_parameters(cls, new_params):
@@ -41,22 +109,103 @@ class Landscape:
             else:
                 raise ValueError('chosen value for parameter is invalid')
 
+    @classmethod
+    def bind(cls, params, herbivore, carnivore):
+        """
+        Method that gives a subclass of the landscape type with its parameters taken from a
+        frozen parameter set, and with the animal classes it feeds. The subclass is created
+        once per landscape type, parameter set and animal classes.
+
+        :param params: a LandscapeParameters, or None for landscape types without parameters
+        :param herbivore: the class of the herbivores living in the cells
+        :param carnivore: the class of the carnivores living in the cells
+        :return: a subclass of cls
+        """
+        key = (cls, params, herbivore, carnivore)
+        bound = _bound_classes.get(key)
+        if bound is None:
+            attributes = {name: value for name, value in vars(params).items()
+                          if value is not None and name in cls.param_landscape_limits} \
+                if params is not None else {}
+            attributes.update(params=params, herbivore=herbivore, carnivore=carnivore)
+            bound = _bound_classes[key] = type(cls.__name__, (cls,), attributes)
+        return bound
+
     def __init__(self):
-        self.pop_herb = []
-        self.pop_carn = []
-        self.f_max = 0
+        self._pop_herb = []
+        self._pop_carn = []
+        self._herb_order = None
+        self._carn_order = None
         self.food = self.f_max
         self.habitable = True
 
-    def sort_fitness(self):
+    @property
+    def pop_herb(self):
+        """
+        List of the herbivores in the cell. Assigning a new list discards the ordering. Code
+        that changes the list in place without changing its length, e.g. by swapping an
+        animal, must call invalidate_order
+        """
+        return self._pop_herb
+
+    @pop_herb.setter
+    def pop_herb(self, animals):
+        self._pop_herb = animals
+        self._herb_order = None
+
+    @property
+    def pop_carn(self):
+        """
+        List of the carnivores in the cell. Assigning a new list discards the ordering. Code
+        that changes the list in place without changing its length, e.g. by swapping an
+        animal, must call invalidate_order
+        """
+        return self._pop_carn
+
+    @pop_carn.setter
+    def pop_carn(self, animals):
+        self._pop_carn = animals
+        self._carn_order = None
+
+    def invalidate_order(self, herbs=True, carns=True):
+        """
+        Method that marks the fitness ordering of the populations as outdated. It must be
+        called after the weight or age of an animal in the cell has been changed, or after a
+        list has been changed in place without changing its length, since sort_fitness cannot
+        detect those changes. The methods of the cell call it themselves.
+
+        :param herbs: bool, True to invalidate the ordering of the herbivores
+        :param carns: bool, True to invalidate the ordering of the carnivores
+        """
+        if herbs:
+            self._herb_order = None
+        if carns:
+            self._carn_order = None
+
+    def sort_fitness(self, herbs=True, carns=True):
         """
         Method that sorts the animals by fitness in descending order, one list for herbivores,
-        one for carnivores
+        one for carnivores. A list is only sorted again if it has changed since it was last
+        sorted: the ordering is kept together with the length of the list and the parameter
+        version it was computed for, and methods that change fitness invalidate it.
+
+        The ordering is trusted as long as the length and the parameter version are the same.
+        Changing animal.w or animal.a directly, or replacing an animal in the list, is not
+        noticed, and must be followed by a call to invalidate_order, or the old ordering is
+        used.
+
+        :param herbs: bool, True to sort the herbivores
+        :param carns: bool, True to sort the carnivores
         """
-        for animal in self.pop_herb+self.pop_carn:
-            animal.fitness()
-        self.pop_herb.sort(key=lambda individual: individual.phi, reverse=True)
-        self.pop_carn.sort(key=lambda individual: individual.phi, reverse=True)
+        if herbs and self._herb_order != (len(self._pop_herb), self.herbivore._param_version):
+            self.herbivore.update_fitness(self._pop_herb)
+            self._pop_herb.sort(key=lambda individual: individual.phi, reverse=True)
+            self._herb_order = (len(self._pop_herb), self.herbivore._param_version)
+
+        if carns and self._carn_order != (len(self._pop_carn), self.carnivore._param_version):
+            self.carnivore.update_fitness(self._pop_carn)
+            self._pop_carn.sort(key=lambda individual: individual.phi, reverse=True)
+            self._carn_order = (len(self._pop_carn), self.carnivore._param_version)
 
     def feeding_herb(self):
         """
@@ -64,30 +213,170 @@ class Landscape:
         """
         pass
 
-    def feeding_carn(self):
+    def renew_food(self):
+        """
+        Method that renews the food in the cell at the start of the feeding season
+        """
+        pass
+
+    def idle(self, years):
+        """
+        Method that renews the food for feeding seasons the cell was not visited in, because
+        no herbivores lived there
+
+        :param years: int, the number of feeding seasons
+        """
+        pass
+
+    def feeding_herb_array(self, herbs, idx, ordered=False):
+        """
+        Method that feeds the herbivores of a Population living in this cell. The fittest
+        herbivores eat first, each eating at most F until the food is gone.
+
+        :param herbs: Population containing the herbivores
+        :param idx: array with the indices of the herbivores living in this cell
+        :param ordered: bool, True if idx is already sorted with the fittest herbivore first
+        :return: True if any herbivore ate, so that the fitness ordering is outdated
+        """
+        self.renew_food()
+        if len(idx) == 0 or self.food <= 0:
+            return False
+
+        order = idx if ordered else idx[np.argsort(-herbs.fitness(idx), kind='stable')]
+        appetite = herbs.animal.F
+        eaten = np.clip(self.food - appetite * np.arange(len(order)), 0, appetite)
+        herbs.w[order] += herbs.animal.beta * eaten
+        herbs.invalidate_order()
+        self.food = max(0, self.food - eaten.sum())
+        return True
+
+    @staticmethod
+    def hunt(prey_phi, prey_w, hunter_phi, appetite, delta_phi_max, feed, random):
+        """
+        Method that lets carnivores hunt the herbivores of a cell. The carnivores hunt one at a
+        time, in the given order, and each tries the living herbivores from the weakest and up
+        until it has eaten its appetite. A herbivore is killed with probability
+        (phi_carn - phi_herb) / DeltaPhiMax, clipped to [0, 1].
+
+        Since the herbivores are sorted by fitness, a carnivore only has a chance against the
+        herbivores before the first one that is at least as fit as itself, and the kill
+        probability decreases along the order. The attempts that fail are therefore skipped
+        in bulk with a geometric draw, and each skipped-to herbivore is accepted with the
+        ratio of its own kill probability to that of the first herbivore in the window. This
+        gives the same distribution as trying every herbivore in turn, while the work per
+        carnivore is proportional to its kills rather than to the number of herbivores.
+
+        :param prey_phi: list with the fitness of the herbivores, in ascending order
+        :param prey_w: list with the weights of the herbivores, in the same order
+        :param hunter_phi: list with the fitness of the carnivores, in hunting order
+        :param appetite: the amount of food each carnivore wants to eat
+        :param delta_phi_max: the carnivores DeltaPhiMax parameter
+        :param feed: function taking the position of a carnivore and the amount it ate, which
+        feeds the carnivore and returns its new fitness
+        :param random: function returning a random number in [0, 1)
+        :return: list with one boolean per herbivore, True if it was killed
+        """
+        killed = [False] * len(prey_phi)
+        alive = _PreyIndex(len(prey_phi))
+
+        for hunter, phi_carn in enumerate(hunter_phi):
+            eat_food = appetite
+            rank = 0
+            while eat_food > 0:
+                window = alive.alive_before(bisect_left(prey_phi, phi_carn))
+                if rank >= window:
+                    break
+
+                herb = alive.kth(rank)
+                prob_max = (phi_carn - prey_phi[herb]) / delta_phi_max
+                if prob_max < 1:
+                    log_miss = math.log1p(-prob_max)
+                    if log_miss == 0:
+                        # Too small to kill with any chance, and the rest of the window less
+                        break
+                    rank += int(math.log1p(-random()) / log_miss)
+                    if rank >= window:
+                        break
+                    herb = alive.kth(rank)
+                    if random() * prob_max >= (phi_carn - prey_phi[herb]) / delta_phi_max:
+                        rank += 1
+                        continue
+
+                killed[herb] = True
+                alive.remove(herb)
+                eaten = min(prey_w[herb], eat_food)
+                eat_food -= eaten
+                phi_carn = feed(hunter, eaten)
+
+        return killed
+
+    def feeding_carn_array(self, herbs, herb_idx, carns, carn_idx, herbs_ordered=False,
+                           carns_ordered=False, rng=None):
+        """
+        Method that feeds the carnivores of a Population living in this cell. The fittest
+        carnivores hunt first, trying the weakest herbivores first. Killed herbivores get
+        weight 0, and are removed from the population when survival is decided.
+
+        :param herbs: Population containing the herbivores
+        :param herb_idx: array with the indices of the herbivores living in this cell
+        :param carns: Population containing the carnivores
+        :param carn_idx: array with the indices of the carnivores living in this cell
+        :param herbs_ordered: bool, True if herb_idx is sorted with the fittest herbivore first
+        and the fitness in herbs.phi is up to date
+        :param carns_ordered: bool, True if carn_idx is sorted with the fittest carnivore first
+        and the fitness in carns.phi is up to date
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
+        """
+        herb_idx = herb_idx[herbs.w[herb_idx] > 0]
+        if len(herb_idx) == 0 or len(carn_idx) == 0:
+            return
+        rng = rng if rng is not None else default_stream()
+
+        if herbs_ordered:
+            prey = herb_idx[::-1]
+        else:
+            prey = herb_idx[np.argsort(herbs.fitness(herb_idx), kind='stable')]
+        if carns_ordered:
+            hunters = carn_idx
+        else:
+            hunters = carn_idx[np.argsort(-carns.fitness(carn_idx), kind='stable')]
+
+        def feed(hunter, eaten):
+            carns.w[hunters[hunter]] += carns.animal.beta * eaten
+            return carns.fitness(hunters[hunter:hunter + 1])[0]
+
+        killed = self.hunt(herbs.phi[prey].tolist(), herbs.w[prey].tolist(),
+                           carns.phi[hunters].tolist(), carns.animal.F,
+                           carns.animal.DeltaPhiMax, feed, rng.random)
+        if any(killed):
+            herbs.w[prey[np.array(killed, dtype=bool)]] = 0
+            carns.invalidate_order()
+
+    def feeding_carn(self, rng=None):
         """
         Method that feeds the carnivores
+
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
         """
         if self.pop_carn and self.pop_herb:
+            rng = rng if rng is not None else default_stream()
             self.sort_fitness()
-            herb_hunted = self.pop_herb.copy()
-            herb_survived = []
-
-            for animal in self.pop_carn:
-                if animal.not_walked:
-                    eat_food = Carnivore.F
-                    herb_survived = []
-                    while eat_food > 0 and len(herb_hunted) > 0:
-                        if animal.kill(herb_hunted[-1].phi):
-                            eat_food = animal.carn_eating(herb_hunted[-1].w, eat_food)
-                            animal.fitness()
-                        else:
-                            herb_survived.append(herb_hunted[-1])
+            prey = self.pop_herb[::-1]
+            hunters = [animal for animal in self.pop_carn if animal.not_walked]
 
-                        del herb_hunted[-1]
-                    herb_hunted = herb_survived
+            def feed(hunter, eaten):
+                hunters[hunter].eat_gain_weight(eaten)
+                return hunters[hunter].fitness()
 
-            self.pop_herb = herb_survived
+            killed = self.hunt([herb.phi for herb in prey], [herb.w for herb in prey],
+                               [animal.phi for animal in hunters], self.carnivore.F,
+                               self.carnivore.DeltaPhiMax, feed, rng.random)
+            if any(killed):
+                self._pop_herb = [herb for herb, dead in zip(prey, killed) if not dead][::-1]
+                self._herb_order = (len(self._pop_herb), self.herbivore._param_version)
+                self.invalidate_order(herbs=False)
 
     def age(self):
         """
@@ -95,6 +384,7 @@ class Landscape:
         """
         for animal in self.pop_herb+self.pop_carn:
             animal.aging()
+        self.invalidate_order()
 
     def weight_loss(self):
         """
@@ -102,48 +392,49 @@ class Landscape:
         """
         for animal in self.pop_herb+self.pop_carn:
             animal.loose_weight()
+        self.invalidate_order()
 
-    def birth(self):
+    def birth(self, rng=None):
         """
         Method that checks if animals should give birth and adds the newborn babies to the
         populations
-        """
 
-        newborn_herb = []
-        newborn_carn = []
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
+        """
+        rng = rng if rng is not None else default_stream()
 
-        for animal in self.pop_herb+self.pop_carn:
-            if animal.not_walked and animal.specie == 'Herbivore':
-                baby = animal.give_birth(animal.specie, len(self.pop_herb))
-                if baby:
-                    newborn_herb.append(baby)
+        newborn = ([], [])
 
-            elif animal.not_walked and animal.specie == 'Carnivore':
-                baby = animal.give_birth(animal.specie, len(self.pop_carn))
-                if baby:
-                    newborn_carn.append(baby)
+        for animals in (self.pop_herb, self.pop_carn):
+            n = len(animals)
+            for animal in animals:
+                if animal.not_walked:
+                    baby = animal.give_birth(animal.specie, n, rng)
+                    if baby:
+                        newborn[type(baby).code].append(baby)
 
+        newborn_herb, newborn_carn = newborn
         self.pop_herb.extend(newborn_herb)
         self.pop_carn.extend(newborn_carn)
+        self.invalidate_order(herbs=bool(newborn_herb), carns=bool(newborn_carn))
 
-    def survive(self):
+    def survive(self, rng=None):
         """
         Method that updates the populations with the surviving animals at the end of each year
+
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
         """
         if self.pop_carn or self.pop_herb:
-            alive_herb = []
-            alive_carn = []
+            rng = rng if rng is not None else default_stream()
+            self.herbivore.update_fitness(self.pop_herb)
+            self.carnivore.update_fitness(self.pop_carn)
 
-            for animal in self.pop_herb+self.pop_carn:
-                if animal.survival() and animal.specie == 'Herbivore':
-                    if animal.fitness() != 0:
-                        alive_herb.append(animal)
-                elif animal.survival() and animal.specie == 'Carnivore':
-                    if animal.fitness() != 0:
-                        alive_carn.append(animal)
-
-            self.pop_herb = alive_herb
-            self.pop_carn = alive_carn
+            self.pop_herb = [animal for animal in self.pop_herb
+                             if animal.survival(rng) and animal.fitness() != 0]
+            self.pop_carn = [animal for animal in self.pop_carn
+                             if animal.survival(rng) and animal.fitness() != 0]
 
     def set_not_walked_true(self):
         """
@@ -163,16 +454,32 @@ class Jungle(Landscape):
         super().__init__()
         self.food = self.f_max
 
+    def renew_food(self):
+        """
+        Method that sets the food in the jungle back to f_max
+        """
+        self.food = self.f_max
+
+    def idle(self, years):
+        """
+        Method that sets the food in the jungle back to f_max if any feeding season has passed
+
+        :param years: int, the number of feeding seasons
+        """
+        if years > 0:
+            self.food = self.f_max
+
     def feeding_herb(self):
         """
         Method that feeds the herbivores in jungle instances
         """
         if self.pop_herb:
-            self.sort_fitness()
+            self.sort_fitness(carns=False)
             self.food = self.f_max
             for animal in self.pop_herb:
                 if animal.not_walked:
                     self.food = animal.herb_eating(self.food)
+            self.invalidate_order(herbs=self.food < self.f_max, carns=False)
 
 
 class Savannah(Landscape):
@@ -186,11 +493,34 @@ class Savannah(Landscape):
         super().__init__()
         self.food = self.f_max
 
-    def regrow(self):
+    def regrow(self, years=1):
         """
-        Method that regrows some of the vegetation in a savannah instance
+        Method that regrows some of the vegetation in a savannah instance, once per year. The
+        yearly step is repeated rather than summed up in a closed form, so that the food is the
+        same to the last bit as if the savannah had been regrown every year. The steps stop
+        when the food no longer changes, so a long time takes a bounded number of steps.
+
+        :param years: int, the number of years to regrow
+        """
+        for _ in range(years):
+            food = self.food + self.alpha * (self.f_max - self.food)
+            if food == self.food:
+                break
+            self.food = food
+
+    def renew_food(self):
+        """
+        Method that regrows the savannah at the start of the feeding season
+        """
+        self.regrow()
+
+    def idle(self, years):
         """
-        self.food = self.food + self.alpha * (self.f_max - self.food)
+        Method that regrows the savannah for feeding seasons it was not visited in
+
+        :param years: int, the number of feeding seasons
+        """
+        self.regrow(years)
 
     def feeding_herb(self):
         """
@@ -198,10 +528,12 @@ class Savannah(Landscape):
         """
         self.regrow()
         if self.pop_herb:
-            self.sort_fitness()
+            self.sort_fitness(carns=False)
+            food_start = self.food
             for animal in self.pop_herb:
                 if animal.not_walked:
                     self.food = animal.herb_eating(self.food)
+            self.invalidate_order(herbs=self.food < food_start, carns=False)
 
 
 class Mountain(Landscape):
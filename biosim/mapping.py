@@ -8,6 +8,7 @@ __email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
 
 from biosim.landscape import Landscape, Jungle, Savannah, Desert, Ocean, Mountain
 import textwrap
+import numpy as np
 
 """
 Creates an Island map
@@ -16,8 +17,13 @@ Creates an Island map
 
 class Island:
     """
-    The class creates a map containing landscape-instances
+    The class creates a map containing landscape-instances, together with a compiled
+    representation of the map: flat cell indices, a grid of landscape codes, a mask of the
+    habitable cells and a table of habitable neighbours
     """
+    landscape_codes = {'O': 0, 'M': 1, 'D': 2, 'S': 3, 'J': 4}
+    directions = ((-1, 0), (0, 1), (1, 0), (0, -1))
+
     def __init__(self, island_map=None):
         """
         :param island_map: a string containing the letters O, M, D, J and S, representing the
@@ -40,26 +46,53 @@ class Island:
                                                                     OOOOOOOOOOOOOOOOOOOOO"""
         self.letter_map = textwrap.dedent(input_map)
         self.finished_map = None
+        self.cell_ids = None
+        self.type_grid = None
+        self.habitable = None
+        self.neighbours = None
 
-    def create_map(self):
+    def create_map(self, landscapes=None):
         """
         Method that creates a map where each cell is an instance based on the type of
         landscape
 
+        :param landscapes: dict mapping the landscape letters to the classes used for the
+        cells, e.g. the bound classes from Parameters.landscapes. Letters that are missing use
+        the Desert, Jungle, Savannah, Ocean and Mountain classes
         :return: A map containing landscape-instances
         """
+        classes = {'D': Desert, 'J': Jungle, 'S': Savannah, 'O': Ocean, 'M': Mountain}
+        classes.update(landscapes if landscapes is not None else {})
+        self.validate()
+        self.compile()
+
+        for i in range(len(self.finished_map)):
+            for j in range(len(self.finished_map[i])):
+                if self.finished_map[i][j] in classes:
+                    self.finished_map[i][j] = classes[self.finished_map[i][j]]()
+                else:
+                    raise ValueError('The map can only consist of the letters D, S, J, M, O')
+
+        return self.finished_map
+
+    def validate(self):
+        """
+        Method that checks that the edges of the map are Ocean and that all lines have the
+        same length. Called by create_map, and by users of the compiled map that do not need
+        the landscape-instances
+        """
         map_split = self.letter_map.split()
         self.finished_map = [list(map_split[j]) for j in range(len(map_split))]
 
         for element in self.finished_map[0]+self.finished_map[-1]:
-            if element is not 'O':
+            if element != 'O':
                 raise ValueError('The edges of the map must be Ocean')
 
         for ind in range(len(self.finished_map)):
             for element in self.finished_map[ind]:
-                if element == self.finished_map[ind][0] and element is not 'O':
+                if element == self.finished_map[ind][0] and element != 'O':
                     raise ValueError('The edges of the map must be Ocean')
-                elif element == self.finished_map[ind][-1] and element is not 'O':
+                elif element == self.finished_map[ind][-1] and element != 'O':
                     raise ValueError('The edges of the map must be Ocean')
 
         comparison_length = len(self.finished_map[0])
@@ -67,20 +100,32 @@ class Island:
             if len(row) != comparison_length:
                 raise ValueError('The map has inconsistent line length')
 
-        for i in range(len(self.finished_map)):
-            for j in range(len(self.finished_map[i])):
-                if self.finished_map[i][j] == 'D':
-                    self.finished_map[i][j] = Desert()
-                elif self.finished_map[i][j] == 'J':
-                    self.finished_map[i][j] = Jungle()
-                elif self.finished_map[i][j] == 'S':
-                    self.finished_map[i][j] = Savannah()
-                elif self.finished_map[i][j] == 'O':
-                    self.finished_map[i][j] = Ocean()
-                elif self.finished_map[i][j] == 'M':
-                    self.finished_map[i][j] = Mountain()
-                else:
+    def compile(self):
+        """
+        Method that computes the compiled representation of the letter map. Called by
+        create_map, after the map has been validated by validate
+
+        Sets cell_ids, an array giving the flat index of each cell, type_grid, an array with
+        the landscape code of each cell, habitable, a boolean array that is True for the
+        habitable cells, and neighbours, an array with one row per flat cell index and one
+        column per direction, North, East, South and West, holding the flat index of the
+        habitable neighbour in that direction or -1
+        """
+        letters = [list(row) for row in self.letter_map.split()]
+        for row in letters:
+            for letter in row:
+                if letter not in self.landscape_codes:
                     raise ValueError('The map can only consist of the letters D, S, J, M, O')
 
-        return self.finished_map
+        self.type_grid = np.array([[self.landscape_codes[letter] for letter in row]
+                                   for row in letters], dtype=np.int8)
+        rows, cols = self.type_grid.shape
+        self.cell_ids = np.arange(rows * cols).reshape(rows, cols)
+        self.habitable = np.isin(self.type_grid, [self.landscape_codes[letter]
+                                                  for letter in ('D', 'S', 'J')])
+
+        padded_ids = np.full((rows + 2, cols + 2), -1, dtype=np.int64)
+        padded_ids[1:-1, 1:-1] = np.where(self.habitable, self.cell_ids, -1)
+        self.neighbours = np.stack([padded_ids[1 + dx:rows + 1 + dx, 1 + dy:cols + 1 + dy]
+                                    for dx, dy in self.directions], axis=-1).reshape(-1, 4)
 
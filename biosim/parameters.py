@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+from dataclasses import dataclass, fields, replace
+from biosim.animals import Animal, Herbivore, Carnivore
+from biosim.landscape import Landscape, Jungle, Savannah, Desert, Mountain, Ocean
+
+"""
+Frozen parameter sets, owned by each simulation
+"""
+
+
+def _checked(values, limits):
+    """
+    Function that checks new parameter values against their limits
+
+    :param values: dict with the new parameter values
+    :param limits: dict mapping every valid parameter name to a pair of exclusive limits
+    """
+    for key in values:
+        if key not in limits:
+            raise KeyError('Invalid parameter name' + key)
+
+    for key, value in values.items():
+        if not limits[key][0] < value < limits[key][1]:
+            raise ValueError('chosen value for parameter is invalid')
+
+
+@dataclass(frozen=True)
+class SpeciesParameters:
+    """
+    The parameters of one animal species. DeltaPhiMax is None for species that do not hunt.
+    """
+    phi_age: float
+    a_half: float
+    phi_weight: float
+    w_half: float
+    w_birth: float
+    sigma_birth: float
+    omega: float
+    beta: float
+    gamma: float
+    eta: float
+    mu: float
+    zeta: float
+    xi: float
+    F: float
+    DeltaPhiMax: float = None
+
+    @classmethod
+    def from_class(cls, animal):
+        """
+        Method that reads the parameters of an animal class
+
+        :param animal: Herbivore, Carnivore or a subclass
+        :return: a SpeciesParameters
+        """
+        return cls(**{f.name: getattr(animal, f.name, None) for f in fields(cls)})
+
+    def update(self, new_params, check=True):
+        """
+        Method that gives a copy with some parameters changed, as long as the chosen
+        parameters exist and are within their limits
+
+        :param new_params: a dict, containing the new parameter values
+        :param check: bool, False to skip the check of the limits
+        :return: a new SpeciesParameters
+        """
+        if check:
+            _checked(new_params, Animal.param_animal_limits)
+        return replace(self, **new_params)
+
+
+@dataclass(frozen=True)
+class LandscapeParameters:
+    """
+    The parameters of one landscape type. alpha is None where the vegetation does not regrow
+    gradually.
+    """
+    f_max: float
+    alpha: float = None
+
+    @classmethod
+    def from_class(cls, landscape):
+        """
+        Method that reads the parameters of a landscape class
+
+        :param landscape: Jungle, Savannah or a subclass
+        :return: a LandscapeParameters
+        """
+        return cls(**{f.name: getattr(landscape, f.name, None) for f in fields(cls)})
+
+    def update(self, new_params, check=True):
+        """
+        Method that gives a copy with some parameters changed, as long as the chosen
+        parameters exist and are within their limits
+
+        :param new_params: a dict, containing the new parameter values
+        :param check: bool, False to skip the check of the limits
+        :return: a new LandscapeParameters
+        """
+        if check:
+            _checked(new_params, Landscape.param_landscape_limits)
+        return replace(self, **new_params)
+
+
+@dataclass(frozen=True)
+class Parameters:
+    """
+    All parameters of a simulation. The object is frozen and hashable, so it can be shared
+    between simulations, used as a dictionary key and compared. Changing a parameter gives a
+    new object.
+    """
+    herbivore: SpeciesParameters
+    carnivore: SpeciesParameters
+    jungle: LandscapeParameters
+    savannah: LandscapeParameters
+
+    _owners = {'Herbivore': 'herbivore', 'Carnivore': 'carnivore', 'J': 'jungle',
+               'S': 'savannah'}
+
+    @classmethod
+    def from_classes(cls):
+        """
+        Method that reads the parameters from the Herbivore, Carnivore, Jungle and Savannah
+        classes, which hold the defaults
+
+        :return: a Parameters
+        """
+        return cls(SpeciesParameters.from_class(Herbivore),
+                   SpeciesParameters.from_class(Carnivore),
+                   LandscapeParameters.from_class(Jungle),
+                   LandscapeParameters.from_class(Savannah))
+
+    @classmethod
+    def from_dict(cls, params):
+        """
+        Method that rebuilds Parameters from the dict given by dataclasses.asdict, e.g. after
+        it has been stored as JSON
+
+        :param params: dict mapping herbivore, carnivore, jungle and savannah to a dict of
+        parameter values
+        :return: a Parameters
+        """
+        return cls(SpeciesParameters(**params['herbivore']),
+                   SpeciesParameters(**params['carnivore']),
+                   LandscapeParameters(**params['jungle']),
+                   LandscapeParameters(**params['savannah']))
+
+    def update(self, owner, new_params, check=True):
+        """
+        Method that gives a copy with the parameters of one species or landscape changed
+
+        :param owner: str, 'Herbivore', 'Carnivore', 'J' or 'S'
+        :param new_params: a dict, containing the new parameter values
+        :param check: bool, False to skip the check of the limits
+        :return: a new Parameters
+        """
+        if owner not in self._owners:
+            raise ValueError('Parameters can only be given for Herbivore, Carnivore, J or S')
+        name = self._owners[owner]
+        return replace(self, **{name: getattr(self, name).update(new_params, check)})
+
+    def species(self, specie):
+        """
+        Method that gives the animal class of a species, bound to these parameters
+
+        :param specie: str, 'Herbivore' or 'Carnivore'
+        :return: a subclass of Herbivore or Carnivore
+        """
+        if specie == 'Herbivore':
+            return Herbivore.bind(self.herbivore)
+        elif specie == 'Carnivore':
+            return Carnivore.bind(self.carnivore)
+        raise ValueError('The species must be either Herbivore or Carnivore')
+
+    def landscapes(self):
+        """
+        Method that gives the landscape classes bound to these parameters, and to the bound
+        animal classes
+
+        :return: dict mapping the landscape letters to subclasses of the landscape classes
+        """
+        herbivore, carnivore = self.species('Herbivore'), self.species('Carnivore')
+        return {'J': Jungle.bind(self.jungle, herbivore, carnivore),
+                'S': Savannah.bind(self.savannah, herbivore, carnivore),
+                'D': Desert.bind(None, herbivore, carnivore),
+                'M': Mountain.bind(None, herbivore, carnivore),
+                'O': Ocean.bind(None, herbivore, carnivore)}
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import numpy as np
+from biosim.animals import Herbivore, Carnivore
+from biosim.random_streams import default_stream
+
+"""
+Stores all animals of one species in contiguous arrays
+"""
+
+
+class Population:
+    """
+    A struct-of-arrays store for every animal of one species on the island. Age, weight,
+    cached fitness and cell index are kept in NumPy arrays, so the annual steps work on flat
+    buffers instead of one Python object per animal. The species parameters are read from the
+    animal class, Herbivore, Carnivore or a class bound to the parameters of a simulation.
+    """
+
+    def __init__(self, specie, capacity=64, animal=None):
+        """
+        :param specie: a str, either Herbivore or Carnivore
+        :param capacity: int, number of animals the arrays have room for before they grow
+        :param animal: the class the species parameters are read from, e.g. a class bound to
+        the parameters of a simulation. If None, Herbivore or Carnivore is used
+        """
+        if specie == 'Herbivore':
+            self.animal = Herbivore
+        elif specie == 'Carnivore':
+            self.animal = Carnivore
+        else:
+            raise ValueError('The species must be either Herbivore or Carnivore')
+        if animal is not None:
+            self.animal = animal
+
+        self.specie = specie
+        self._n = 0
+        self._a = np.zeros(capacity, dtype=np.int32)
+        self._w = np.zeros(capacity, dtype=np.float64)
+        self._phi = np.zeros(capacity, dtype=np.float64)
+        self._cell = np.zeros(capacity, dtype=np.int32)
+        self._order = None
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def a(self):
+        """Ages of the animals"""
+        return self._a[:self._n]
+
+    @property
+    def w(self):
+        """Weights of the animals"""
+        return self._w[:self._n]
+
+    @property
+    def phi(self):
+        """Fitness of the animals, as computed by the last call to fitness"""
+        return self._phi[:self._n]
+
+    @property
+    def cell(self):
+        """Flat index of the cell each animal lives in"""
+        return self._cell[:self._n]
+
+    def _reserve(self, n_new):
+        """
+        Method that grows the arrays, doubling the capacity, until n_new more animals fit
+
+        :param n_new: int, number of animals that are about to be added
+        """
+        capacity = len(self._a)
+        if self._n + n_new <= capacity:
+            return
+
+        while capacity < self._n + n_new:
+            capacity = max(2 * capacity, 1)
+
+        for name in ('_a', '_w', '_phi', '_cell'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, name, new)
+
+    def add(self, ages, weights, cells):
+        """
+        Method that appends animals to the population
+
+        :param ages: sequence of ages
+        :param weights: sequence of weights
+        :param cells: sequence of flat cell indices, or a single index used for all animals
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        n_new = len(weights)
+        self._reserve(n_new)
+
+        start, stop = self._n, self._n + n_new
+        self._a[start:stop] = ages
+        self._w[start:stop] = weights
+        self._cell[start:stop] = cells
+        self._n = stop
+        self._order = None
+        self.fitness(np.arange(start, stop))
+
+    def keep(self, mask):
+        """
+        Method that removes every animal whose entry in mask is False, preserving the order
+        of the others
+
+        :param mask: boolean array with one entry per animal
+        """
+        n_kept = int(np.count_nonzero(mask))
+        for name in ('_a', '_w', '_phi', '_cell'):
+            arr = getattr(self, name)
+            arr[:n_kept] = arr[:self._n][mask]
+        self._n = n_kept
+        self._order = None
+
+    def take(self, mask):
+        """
+        Method that removes every animal whose entry in mask is True, and returns them
+
+        :param mask: boolean array with one entry per animal
+        :return: the ages, weights and cell indices of the removed animals
+        """
+        taken = (self.a[mask].copy(), self.w[mask].copy(), self.cell[mask].copy())
+        self.keep(~mask)
+        return taken
+
+    def fitness(self, idx=None):
+        """
+        Method that computes the fitness of the animals and caches it in phi
+
+        :param idx: array of animal indices, or None for the whole population
+        :return: array with the fitness of the chosen animals. Animals with no weight have
+        fitness 0
+        """
+        idx = slice(0, self._n) if idx is None else idx
+        phi = self.animal.fitness_batch(self._a[idx], self._w[idx])
+        self._phi[idx] = phi
+        return phi
+
+    def count(self, n_cells):
+        """
+        Method that counts the animals in every cell
+
+        :param n_cells: int, the number of cells on the island
+        :return: array with the number of animals per flat cell index
+        """
+        return np.bincount(self.cell, minlength=n_cells)
+
+    def by_cell(self, n_cells):
+        """
+        Method that groups the animals by cell
+
+        :param n_cells: int, the number of cells on the island
+        :return: an index array ordering the animals by cell, and an array of n_cells + 1
+        offsets such that the animals of cell c are order[starts[c]:starts[c + 1]]
+        """
+        order = np.argsort(self.cell, kind='stable')
+        starts = np.zeros(n_cells + 1, dtype=np.int64)
+        np.cumsum(self.count(n_cells), out=starts[1:])
+        return order, starts
+
+    def fitness_order(self, n_cells):
+        """
+        Method that groups the animals by cell, with the fittest animal of each cell first.
+        The ordering is cached, and only computed again after the population has changed
+        through add, keep, aging, loose_weight or invalidate_order.
+
+        :param n_cells: int, the number of cells on the island
+        :return: an index array ordering the animals, and an array of n_cells + 1 offsets such
+        that the animals of cell c are order[starts[c]:starts[c + 1]]
+        """
+        if self._order is None or len(self._order[1]) != n_cells + 1:
+            order = np.lexsort((-self.fitness(), self.cell))
+            starts = np.zeros(n_cells + 1, dtype=np.int64)
+            np.cumsum(self.count(n_cells), out=starts[1:])
+            self._order = (order, starts)
+        return self._order
+
+    def invalidate_order(self):
+        """
+        Method that discards the cached ordering, after weights or cells have been changed
+        directly in the arrays
+        """
+        self._order = None
+
+    def aging(self, idx=None):
+        """
+        Method that ages the animals by a year
+
+        :param idx: array of animal indices, or None for the whole population
+        """
+        idx = slice(0, self._n) if idx is None else idx
+        self._a[idx] += 1
+        self._order = None
+
+    def loose_weight(self, idx=None):
+        """
+        Method that makes the animals loose weight at the end of a year
+
+        :param idx: array of animal indices, or None for the whole population
+        """
+        idx = slice(0, self._n) if idx is None else idx
+        self._w[idx] -= self.animal.eta * self._w[idx]
+        self._order = None
+
+    def give_birth(self, idx, n, rng=None):
+        """
+        Method that lets the animals give birth, following the rules in Animal.give_birth.
+        The babies are appended to the population in the cell of their mother.
+
+        :param idx: array of indices of the animals that may give birth, or None for the whole
+        population
+        :param n: number of animals of the same species in the cell of each animal
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
+        :return: the number of babies born
+        """
+        rng = rng if rng is not None else default_stream()
+        p = self.animal
+        idx = np.arange(self._n) if idx is None else np.asarray(idx)
+        fertile = self._w[idx] >= p.zeta * (p.w_birth + p.sigma_birth)
+        idx = idx[fertile]
+        n = np.broadcast_to(n, fertile.shape)[fertile]
+
+        birth_prob = np.minimum(1, p.gamma * self.fitness(idx) * (n - 1))
+        idx = idx[rng.random(len(idx)) <= birth_prob]
+
+        w_baby = rng.normal(p.w_birth, p.sigma_birth, len(idx))
+        born = (w_baby > 0) & (self._w[idx] - p.xi * w_baby > 0)
+        idx, w_baby = idx[born], w_baby[born]
+
+        self._w[idx] -= p.xi * w_baby
+        self.add(np.zeros(len(idx)), w_baby, self._cell[idx])
+        return len(idx)
+
+    def survival(self, idx=None, rng=None):
+        """
+        Method that decides which animals survive the year, following Animal.survival
+
+        :param idx: array of animal indices, or None for the whole population
+        :param rng: the random number stream of the simulation. If None, the shared
+        default stream is used
+        :return: boolean array, True for the animals that survive
+        """
+        rng = rng if rng is not None else default_stream()
+        phi = self.fitness(idx)
+        death_rate = self.animal.omega * (1 - phi)
+        w = self._w[slice(0, self._n) if idx is None else idx]
+        return (death_rate < rng.random(len(phi))) & (w > 0)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import numpy as np
+
+"""
+Independent, seedable random number streams for a simulation
+"""
+
+
+class RandomStream:
+    """
+    Wraps a NumPy Generator for use both in array code and in loops over single animals.
+    Array draws go straight to the generator, while single uniform numbers are handed out
+    from a block drawn in advance, which keeps per-animal draws cheap.
+    """
+
+    def __init__(self, generator=None, block=1024):
+        """
+        :param generator: a numpy.random.Generator. If None, a generator with fresh entropy
+        is created
+        :param block: int, number of uniform numbers drawn at a time for single draws
+        """
+        self.generator = generator if generator is not None else np.random.default_rng()
+        self.block = block
+        self._next_uniform = [].pop
+
+    def random(self, size=None):
+        """
+        Method that draws uniform numbers in [0, 1)
+
+        :param size: int, the number of draws, or None for a single float
+        :return: a float, or an array of size floats
+        """
+        if size is None:
+            try:
+                return self._next_uniform()
+            except IndexError:
+                self._next_uniform = self.generator.random(self.block).tolist().pop
+                return self._next_uniform()
+        return self.generator.random(size)
+
+    def normal(self, loc, scale, size=None):
+        """
+        Method that draws normally distributed numbers
+
+        :param loc: the mean
+        :param scale: the standard deviation
+        :param size: int, the number of draws, or None for a single float
+        :return: a float, or an array of size floats
+        """
+        return self.generator.normal(loc, scale, size)
+
+    def integers(self, low, high, size=None):
+        """
+        Method that draws integers from low (inclusive) to high (exclusive)
+
+        :param low: the lowest integer
+        :param high: one above the highest integer
+        :param size: int, the number of draws, or None for a single int
+        :return: an int, or an array of size ints
+        """
+        return self.generator.integers(low, high, size)
+
+
+_default_stream = None
+
+
+def default_stream():
+    """
+    Function that gives the stream used when no stream is passed, e.g. when the methods of
+    an animal or a cell are called outside a simulation. The stream is created once, with
+    fresh entropy, and shared by all such calls
+
+    :return: a RandomStream
+    """
+    global _default_stream
+    if _default_stream is None:
+        _default_stream = RandomStream()
+    return _default_stream
+
+
+class SeedTree:
+    """
+    Gives every year, phase and optional sub-key of a simulation its own independent stream,
+    derived from one seed. The stream for a given key is the same no matter in which order,
+    or in which process, the streams are requested, so parts of a year can be simulated in
+    parallel and still be reproduced exactly.
+    """
+    phases = ('feeding', 'birth', 'migration', 'death')
+
+    def __init__(self, seed=None):
+        """
+        :param seed: int used as random number seed. If None, fresh entropy is used
+        """
+        self.seed_sequence = np.random.SeedSequence(seed)
+
+    @property
+    def entropy(self):
+        """The entropy of the root seed, which together with a key identifies every stream"""
+        return self.seed_sequence.entropy
+
+    def stream(self, year, phase, *key):
+        """
+        Method that creates the stream for a phase of a year
+
+        :param year: int, the simulated year
+        :param phase: str, one of the names in phases
+        :param key: further non-negative ints, e.g. a cell index, identifying the stream
+        :return: a RandomStream
+        """
+        spawn_key = (year, self.phases.index(phase)) + tuple(int(k) for k in key)
+        sequence = np.random.SeedSequence(self.entropy, spawn_key=spawn_key)
+        return RandomStream(np.random.default_rng(sequence))
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import functools
+import queue
+import subprocess
+import threading
+import weakref
+import numpy as np
+
+"""
+Renders frames of a simulation in a background thread and pipes them into ffmpeg
+"""
+
+#                   R    G    B
+map_colours = {'O': (0, 0, 255),      # blue
+               'M': (128, 128, 128),  # grey
+               'J': (0, 153, 0),      # dark green
+               'S': (128, 255, 128),  # light green
+               'D': (255, 255, 128)}  # light yellow
+
+# Colours of the viridis colour map at 0, 0.25, 0.5, 0.75 and 1
+_viridis = np.array([(68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98),
+                     (253, 231, 37)], dtype=np.float64)
+density_colours = np.stack([np.interp(np.linspace(0, 1, 256), np.linspace(0, 1, 5),
+                                      _viridis[:, channel])
+                            for channel in range(3)], axis=1).round().astype(np.uint8)
+
+
+def _render_frame(background, scale, cmax_animals, density):
+    """
+    Function that draws one frame: the map, then the herbivore and carnivore densities, with
+    a gap of one cell between them
+
+    :param background: array with the RGB values of the map, scaled up
+    :param scale: int, pixels per cell side
+    :param cmax_animals: Dict specifying color-code limits for animal densities
+    :param density: dict mapping 'Herbivore' and 'Carnivore' to an array with the number
+    of animals per cell
+    :return: array of shape (height, width, 3) with the RGB values of the frame
+    """
+    height, panel_width = background.shape[:2]
+    frame = np.full((height, 3 * panel_width + 2 * scale, 3), 255, dtype=np.uint8)
+    frame[:, :panel_width] = background
+    for ix, specie in enumerate(('Herbivore', 'Carnivore')):
+        levels = np.clip(density[specie] * (255 / cmax_animals[specie]), 0, 255)
+        panel = density_colours[levels.astype(np.intp)]
+        start = (ix + 1) * (panel_width + scale)
+        frame[:, start:start + panel_width] = np.repeat(np.repeat(panel, scale, axis=0),
+                                                        scale, axis=1)
+    return frame
+
+
+def _write_frames(snapshots, render, stdin, errors):
+    """
+    Function run by the rendering thread. It renders the snapshots in the queue and writes
+    them to ffmpeg until it gets None. After the first error, whatever raised it, the
+    remaining snapshots are only taken from the queue, so that neither submit nor close waits
+    for a thread that has stopped
+
+    :param snapshots: queue.Queue of density dicts
+    :param render: function that turns a density dict into a frame
+    :param stdin: the standard input of ffmpeg
+    :param errors: list that the first error is appended to
+    """
+    while True:
+        density = snapshots.get()
+        if density is None:
+            return
+        if errors:
+            continue
+        try:
+            stdin.write(render(density).tobytes())
+        except Exception as err:
+            errors.append(err)
+
+
+def _finish(snapshots, thread, process, errors):
+    """
+    Function that lets the rendering thread write the remaining snapshots, and waits for
+    ffmpeg to finish the movie. It is called by FrameRenderer.close, or when the renderer is
+    garbage collected or the interpreter exits without it being closed
+
+    :return: int, the exit status of ffmpeg
+    """
+    snapshots.put(None)
+    thread.join()
+    try:
+        process.stdin.close()
+    except OSError as err:
+        errors.append(err)
+    return process.wait()
+
+
+class FrameRenderer:
+    """
+    Turns snapshots of the animal densities into RGB frames and writes them to the standard
+    input of an ffmpeg process, which encodes the movie while the simulation goes on. Every
+    frame shows the island map and the herbivore and carnivore densities side by side, each
+    cell drawn as a square of scale x scale pixels. No image files are written.
+
+    The thread and ffmpeg are stopped by close, by leaving a with block, or when the renderer
+    is garbage collected, so they do not outlive it if close is never reached.
+    """
+
+    def __init__(self, path, letter_map, cmax_animals, fps=10, scale=8, binary='ffmpeg',
+                 queue_size=64):
+        """
+        :param path: String, file name of the movie
+        :param letter_map: Multi-line string specifying island geography
+        :param cmax_animals: Dict specifying color-code limits for animal densities
+        :param fps: int, frames per second of the movie
+        :param scale: int, pixels per cell side. It must be even, as the encoder needs even
+        frame sizes
+        :param binary: String, path to ffmpeg
+        :param queue_size: int, number of snapshots that can wait for rendering before submit
+        waits
+        """
+        if scale < 2 or scale % 2:
+            raise ValueError('The scale must be even')
+        letters = letter_map.split()
+        self.scale = scale
+        self.cmax_animals = cmax_animals
+        self.background = np.repeat(np.repeat(
+            np.array([[map_colours[letter] for letter in row] for row in letters],
+                     dtype=np.uint8), scale, axis=0), scale, axis=1)
+        self.height, panel_width = self.background.shape[:2]
+        self.width = 3 * panel_width + 2 * scale
+        self.frames = 0
+
+        command = [binary, '-y',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                   '-s', '{}x{}'.format(self.width, self.height),
+                   '-r', str(fps),
+                   '-i', '-',
+                   '-an',
+                   '-profile:v', 'baseline',
+                   '-level', '3.0',
+                   '-pix_fmt', 'yuv420p',
+                   path]
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                             stdout=subprocess.DEVNULL,
+                                             stderr=subprocess.DEVNULL)
+        except OSError as err:
+            raise RuntimeError('ERROR: ffmpeg could not be started: {}'.format(err))
+
+        self._queue = queue.Queue(queue_size)
+        self._errors = []
+        render = functools.partial(_render_frame, self.background, scale, cmax_animals)
+        thread = threading.Thread(target=_write_frames,
+                                  args=(self._queue, render, self._process.stdin, self._errors),
+                                  daemon=True)
+        thread.start()
+        self._finalizer = weakref.finalize(self, _finish, self._queue, thread, self._process,
+                                           self._errors)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._finalizer()
+
+    def render(self, density):
+        """
+        Method that draws one frame
+
+        :param density: dict mapping 'Herbivore' and 'Carnivore' to an array with the number
+        of animals per cell
+        :return: array of shape (height, width, 3) with the RGB values of the frame
+        """
+        return _render_frame(self.background, self.scale, self.cmax_animals, density)
+
+    def submit(self, density):
+        """
+        Method that hands a snapshot of the densities to the rendering thread
+
+        :param density: dict mapping 'Herbivore' and 'Carnivore' to an array with the number
+        of animals per cell. The arrays are copied
+        """
+        if self._errors:
+            raise RuntimeError('ERROR: rendering the movie failed with: {!r}'.format(
+                self._errors[0])) from self._errors[0]
+        self._queue.put({specie: np.array(counts) for specie, counts in density.items()})
+        self.frames += 1
+
+    def close(self):
+        """
+        Method that renders the remaining snapshots and waits for ffmpeg to finish the movie.
+        Closing a renderer again does nothing
+        """
+        if not self._finalizer.alive:
+            return
+        returncode = self._finalizer()
+        if returncode != 0 or self._errors:
+            raise RuntimeError('ERROR: ffmpeg failed with: {}'.format(
+                self._errors[0] if self._errors else 'exit status {}'.format(returncode)))
@@ -5,16 +5,18 @@ __author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
 __email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
 """
 
-import matplotlib.pyplot as plt
-from biosim.cell_control import *
-import pandas as pd
+from biosim.cell_control import Cells
+from biosim.parameters import Parameters
+from biosim.rendering import FrameRenderer
 import numpy as np
-import random as rand
-from matplotlib.widgets import Button, Slider
+import dataclasses
+import json
 import subprocess
+import time
 
 """
-Simulates an ecosystem
+Simulates an ecosystem. Only what a headless simulation needs is imported with the module;
+matplotlib, pandas and the band decomposition are imported when they are first used.
 """
 
 # update the variable to your path
@@ -33,9 +35,11 @@ class BioSim:
 
     Author: Hans E Plesser
     """
+    movie_formats = ('mp4',)
 
     def __init__(self, seed=None, island_map=None, ini_pop=None, ymax_animals=None,
-                 cmax_animals=None, img_base=None, img_fmt='png'):
+                 cmax_animals=None, img_base=None, img_fmt='png', engine='object', params=None,
+                 checkpoint_base=None, stats=None, headless=False, recorder=None):
 
         """
         :param island_map: Multi-line string specifying island geography
@@ -45,7 +49,25 @@ class BioSim:
         :param cmax_animals: Dict specifying color-code limits for animal densities
         :param img_base: String with beginning of file name for figures, including path. If None,
          no figures are written to file
-        :param img_fmt: String with file type for figures, e.g. ’png’
+        :param img_fmt: String with file type for figures, e.g. ’png’, or a movie format,
+         e.g. ’mp4’, to stream the frames into the movie ’{}.{}’.format(img_base, img_fmt)
+         without writing any images
+        :param engine: String, 'object' to simulate every animal as a Python object,
+         'array' to simulate the whole island with batched NumPy operations, or 'bands' to
+         split the island in row bands simulated by one worker process each
+        :param params: Parameters of the animals and landscapes. If None, the parameters are
+         read from the Herbivore, Carnivore, Jungle and Savannah classes
+        :param checkpoint_base: String with beginning of file name for checkpoints, including
+         path. If None, no checkpoints are written by simulate
+        :param stats: StatisticsSink that receives the simulation after every simulated year,
+         e.g. a StatisticsWriter. If None, no statistics are recorded
+        :param headless: bool, True to simulate without graphics. A headless simulation never
+         imports matplotlib, draws no figures and writes no images, which makes batch runs
+         start and run faster
+        :param recorder: PhaseRecorder that records the wall time of every phase of every year,
+         and the number of births, deaths, kills and migrations. The time simulate spends on
+         graphics, statistics and checkpoints is recorded as ’output’. If None, nothing is
+         recorded. Not available with the 'bands' engine
 
         If img_base is None, no figures are written to file.
 
@@ -55,10 +77,23 @@ class BioSim:
         where img_no are consecutive image numbers starting from 0.
         img_base should contain a path and beginning of a file name.
         """
-        self._cycle = Cells(ini_pop, island_map)
-        self._isl = Island(island_map)
+        if engine == 'bands':
+            from biosim.decomposition import DecomposedCells
+            self._cycle = DecomposedCells(ini_pop, island_map, seed=seed, params=params)
+        else:
+            self._cycle = Cells(ini_pop, island_map, backend=engine, seed=seed, params=params)
+        self._cycle.generate_animals()
+        self._isl = self._cycle.island
+        self._engine = engine
+        self.checkpoint_base = checkpoint_base
+        self.stats = stats
+        self.headless = headless
+        self.recorder = recorder
+        if recorder is not None:
+            if engine == 'bands':
+                raise ValueError('Phases can not be recorded with the bands engine')
+            self._cycle.recorder = recorder
 
-        rand.seed(seed)
         self.ymax_animals = ymax_animals if ymax_animals is not None else self.num_animals + 10
         self.automatic_ymax = False if ymax_animals is not None else True
         self.cmax_animals = cmax_animals if cmax_animals is not None else {'Herbivore': 100,
@@ -66,8 +101,11 @@ class BioSim:
         self.img_base = img_base
         self.img_fmt = img_fmt
         self._img_ctr = 0
+        self._renderer = None
 
         self._fig = None
+        self._title = None
+        self._background = None
         self._map_ax = None
         self._legend_ax = None
         self._herb_ax = None
@@ -96,82 +134,148 @@ class BioSim:
         self._final_year = None
         self._quit_sim = None
 
-        self._omega_herb = Herbivore.omega
-        self._omega_carn = Carnivore.omega
-        self._gamma_herb = Herbivore.gamma
-        self._gamma_carn = Carnivore.gamma
+        self._gui_params = None
+
+    @property
+    def params(self):
+        """The Parameters of the simulation. Assigning new Parameters applies them to the
+        animals and cells already on the island"""
+        return self._cycle.params
+
+    @params.setter
+    def params(self, params):
+        self._cycle.set_parameters(params)
 
     def set_animal_parameters(self, species, params):
         """
-        The method sets parameters for animal species
+        The method sets parameters for animal species, in this simulation only
 
         :param species: String, name of animal species
         :param params: Dict with valid parameter specification for species
         """
-        if species == 'Herbivore':
-            Herbivore.set_parameters(params)
-        elif species == 'Carnivore':
-            Carnivore.set_parameters(params)
-        else:
+        if species not in ('Herbivore', 'Carnivore'):
             raise ValueError('Your chosen species is not valid. Choose either Herbivore or '
                              'Carnivore')
+        self.params = self.params.update(species, params)
 
     def set_landscape_parameters(self, landscape, params):
         """
-        The method sets parameters for landscape type
+        The method sets parameters for landscape type, in this simulation only
 
         :param landscape: String, code letter for landscape
         :param params: Dict with valid parameter specification for landscape
         """
-        if landscape == 'J':
-            Jungle.set_parameters(params)
-        elif landscape == 'S':
-            Savannah.set_parameters(params)
-        else:
+        if landscape not in ('J', 'S'):
             raise ValueError('Your chosen landscape is not valid. Choose either J or '
                              'S')
+        self.params = self.params.update(landscape, params)
 
-    def simulate(self, num_years, vis_years=1, img_years=None):
+    def simulate(self, num_years, vis_years=1, img_years=None, checkpoint_years=None):
         """
-        Runs simulation while visualizing the result
+        Runs simulation while visualizing the result. The figure is only drawn every vis_years
+        years, and not at all if the simulation is headless.
 
         :param num_years: number of years to simulate
         :param vis_years: years between visualization updates
         :param img_years: years between visualizations saved to files (default: vis_years)
+        :param checkpoint_years: years between checkpoints written to files named
+         ’{}_{:05d}.npz’.format(checkpoint_base, year). If None, no checkpoints are written
         """
         if img_years is None:
             img_years = vis_years
 
         self._quit_sim = False
         self._final_year = self.year + num_years
-        #self.set_up_graphics()
-
-        self._cycle.generate_animals()
+        if not self.headless:
+            self.set_up_graphics()
 
         while self._year < self._final_year:
 
             self._cycle.cell_cycle()
+            if self.recorder is not None:
+                output_start = time.perf_counter()
 
-            #if self._year % vis_years == 0:
-                #self._update_graphics()
+            if not self.headless and self._year % vis_years == 0:
+                self._update_graphics()
 
-            #if self._year % img_years == 0:
-                #self._save_graphics()
+            if self._year % img_years == 0:
+                if self.img_fmt in self.movie_formats:
+                    self._stream_frame()
+                elif not self.headless:
+                    if self._year % vis_years != 0:
+                        self._update_graphics()
+                    self._save_graphics()
 
             self._year += 1
 
+            if self.stats is not None:
+                self.stats.record(self)
+
+            if checkpoint_years and self.checkpoint_base is not None and \
+                    self._year % checkpoint_years == 0:
+                self.save_checkpoint('{base}_{year:05d}.npz'.format(base=self.checkpoint_base,
+                                                                   year=self._year))
+
+            if self.recorder is not None:
+                self.recorder.add_seconds('output', time.perf_counter() - output_start)
+
             if self._quit_sim:
                 break
 
+        if self.stats is not None:
+            self.stats.flush()
+
+    def save_checkpoint(self, path):
+        """
+        Writes the full state of the simulation to a compressed NumPy archive: the year, the
+        seed, the engine, the map, the parameters, the food in every cell and the age, weight
+        and cell of every animal. The random number streams are derived from the seed and the
+        year alone, so no generator state needs to be stored.
+
+        :param path: String, file name of the checkpoint, ending in .npz
+        """
+        np.savez_compressed(path, year=self._year,
+                            entropy=str(self._cycle.seeds.entropy),
+                            engine=self._engine,
+                            island_map=self._isl.letter_map,
+                            params=json.dumps(dataclasses.asdict(self.params)),
+                            **self._cycle.state())
+
+    @classmethod
+    def from_checkpoint(cls, path, **kwargs):
+        """
+        Creates a simulation from a checkpoint written by save_checkpoint. Simulating further
+        gives the same result as the simulation that wrote the checkpoint would have.
+
+        :param path: String, file name of the checkpoint
+        :param kwargs: further arguments to BioSim, e.g. img_base or checkpoint_base
+        :return: a BioSim
+        """
+        with np.load(path) as data:
+            state = {key: data[key] for key in data.files}
+        sim = cls(seed=int(state.pop('entropy')), island_map=str(state.pop('island_map')),
+                  ini_pop=[], engine=str(state.pop('engine')),
+                  params=Parameters.from_dict(json.loads(str(state.pop('params')))), **kwargs)
+        sim._year = sim._cycle.year = int(state.pop('year'))
+        sim._cycle.load_state(state)
+        return sim
+
     def set_up_graphics(self):
         """
         Method sets up graphics, and creates axes containing a island map, distribution maps and
         a line plot. The methods also creates widgets that let us adjust parameters and stop and
-        reset the simulation
+        reset the simulation. The figure is shown without blocking, so the simulation goes on
+        while it is open
         """
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Rectangle
+        from matplotlib.widgets import Button, Slider
+
         if self._fig is None:
             self._fig = plt.figure()
-            self._fig.suptitle('BioSimulation Year:{}'.format(self.year), fontsize=16)
+            self._title = self._fig.suptitle('BioSimulation Year:{}'.format(self.year),
+                                             fontsize=16, animated=True)
+            self._fig.canvas.mpl_connect('draw_event', self._on_draw)
 
         #                   R    G    B
         rgb_value = {'O': (0.0, 0.0, 1.0),  # blue
@@ -188,9 +292,9 @@ class BioSim:
             self._legend_ax.axis('off')
             for ix, name in enumerate(('Ocean', 'Mountain', 'Jungle',
                                        'Savannah', 'Desert')):
-                self._legend_ax.add_patch(plt.Rectangle((0., ix * 0.2), 0.1, 0.1,
-                                                        edgecolor='none',
-                                                        facecolor=rgb_value[name[0]]))
+                self._legend_ax.add_patch(Rectangle((0., ix * 0.2), 0.1, 0.1,
+                                                    edgecolor='none',
+                                                    facecolor=rgb_value[name[0]]))
                 self._legend_ax.text(0.35, ix * 0.2, name, transform=self._legend_ax.transAxes)
 
         if self._map_ax is None:
@@ -233,6 +337,7 @@ class BioSim:
             herb_plot = self._pop_ax.plot(np.arange(0, self._final_year),
                                           np.full(self._final_year, np.nan))
             self._herb_line = herb_plot[0]
+            self._herb_line.set_animated(True)
             self._herb_line.set_label('Herbivore')
         else:
             xdata, ydata = self._herb_line.get_data()
@@ -246,6 +351,7 @@ class BioSim:
             carn_plot = self._pop_ax.plot(np.arange(0, self._final_year),
                                           np.full(self._final_year, np.nan))
             self._carn_line = carn_plot[0]
+            self._carn_line.set_animated(True)
             self._carn_line.set_label('Carnivore')
         else:
             xdata, ydata = self._carn_line.get_data()
@@ -256,13 +362,19 @@ class BioSim:
                                          np.hstack((ydata, ynew)))
 
         self._pop_ax.legend()
-        plt.subplots_adjust(bottom=0.1, right=0.65, top=0.9)
+        self._fig.subplots_adjust(bottom=0.1, right=0.65, top=0.9)
+        self._background = None
+
+        if self._reset_widget is not None:
+            plt.show(block=False)
+            return
 
+        self._gui_params = self.params
         self._ax_omega_herb_slider = self._fig.add_axes([0.86, 0.75, 0.1, 0.05])
         self._omega_herb_slide = Slider(self._ax_omega_herb_slider,
                                         label='Herbivore: Omega',
                                         valmin=0, valmax=1,
-                                        valinit=Herbivore.omega,
+                                        valinit=self.params.herbivore.omega,
                                         valfmt='%.2f')
         self._omega_herb_slide.on_changed(self._set_om_herb)
 
@@ -270,7 +382,7 @@ class BioSim:
         self._gamma_herb_slide = Slider(self._ax_gamma_herb_slider,
                                         label='Herbivore: Gamma',
                                         valmin=0, valmax=1,
-                                        valinit=Herbivore.gamma,
+                                        valinit=self.params.herbivore.gamma,
                                         valfmt='%.2f')
         self._gamma_herb_slide.on_changed(self._set_ga_herb)
 
@@ -278,7 +390,7 @@ class BioSim:
         self._omega_carn_slide = Slider(self._ax_omega_carn_slider,
                                         label='Carnivore: Omega',
                                         valmin=0, valmax=1,
-                                        valinit=Carnivore.omega,
+                                        valinit=self.params.carnivore.omega,
                                         valfmt='%.2f')
         self._omega_carn_slide.on_changed(self._set_om_carn)
 
@@ -286,7 +398,7 @@ class BioSim:
         self._gamma_carn_slide = Slider(self._ax_gamma_carn_slider,
                                         label='Carnivore: Gamma',
                                         valmin=0, valmax=1,
-                                        valinit=Carnivore.gamma,
+                                        valinit=self.params.carnivore.gamma,
                                         valfmt='%.2f')
         self._gamma_carn_slide.on_changed(self._set_ga_carn)
 
@@ -298,7 +410,7 @@ class BioSim:
         self._interrupt_widget = Button(self._ax_interrupt, 'Quit')
         self._interrupt_widget.on_clicked(self._interrupt)
 
-        plt.show()
+        plt.show(block=False)
 
     def _set_om_herb(self, value):
         """
@@ -306,7 +418,7 @@ class BioSim:
 
         :param value: new value of omega
         """
-        Herbivore.omega = value
+        self.params = self.params.update('Herbivore', {'omega': value}, check=False)
 
     def _set_ga_herb(self, value):
         """
@@ -314,7 +426,7 @@ class BioSim:
 
         :param value: new value of gamma
         """
-        Herbivore.gamma = value
+        self.params = self.params.update('Herbivore', {'gamma': value}, check=False)
 
     def _set_om_carn(self, value):
         """
@@ -322,7 +434,7 @@ class BioSim:
 
         :param value: new value of omega
         """
-        Carnivore.omega = value
+        self.params = self.params.update('Carnivore', {'omega': value}, check=False)
 
     def _set_ga_carn(self, value):
         """
@@ -330,19 +442,15 @@ class BioSim:
 
         :param value: new value of gamma
         """
-        Carnivore.gamma = value
+        self.params = self.params.update('Carnivore', {'gamma': value}, check=False)
 
     def _reset(self, event):
         """
-        Reset parameters
+        Reset parameters to the ones the graphics were set up with
 
         :param event: the button click
         """
-
-        Herbivore.omega = self._omega_herb
-        Carnivore.omega = self._omega_carn
-        Herbivore.gamma = self._gamma_herb
-        Carnivore.gamma = self._gamma_carn
+        self.params = self._gui_params
 
         self._omega_herb_slide.reset()
         self._omega_carn_slide.reset()
@@ -356,26 +464,16 @@ class BioSim:
         :param event: the button click
         """
         self._quit_sim = True
-        Herbivore.omega = self._omega_herb
-        Carnivore.omega = self._omega_carn
-        Herbivore.gamma = self._gamma_herb
-        Carnivore.gamma = self._gamma_carn
 
     def _df_to_matrix(self):
         """
-        turns a dataframe into a matrix
+        Gives the number of animals per cell, as kept by the cells in counts after every year
 
-        :return: matrix containing number of animals in cells
+        :return: the herbivore and carnivore counts, each an array with one entry per cell
+        in the shape of the island map
         """
-        df = self.animal_distribution
-        herb_mat = df['Herbivore'].values
-        carn_mat = df['Carnivore'].values
-
-        length_x = len(self._cycle.map)
-        length_y = len(self._cycle.map[0])
-
-        return np.reshape(herb_mat, (length_x, length_y)), \
-               np.reshape(carn_mat, (length_x, length_y))
+        counts = self._cycle.counts
+        return counts['Herbivore'], counts['Carnivore']
 
     def _update_distribution_map(self):
         """
@@ -389,18 +487,22 @@ class BioSim:
         else:
             self._herb_dist_axis = self._herb_ax.imshow(herb_matrix,
                                                         interpolation='nearest',
-                                                        vmin=0, vmax=self.cmax_animals['Herbivore'])
-            plt.colorbar(self._herb_dist_axis, ax=self._herb_ax,
-                         orientation='horizontal')
+                                                        vmin=0, vmax=self.cmax_animals['Herbivore'],
+                                                        animated=True)
+            self._fig.colorbar(self._herb_dist_axis, ax=self._herb_ax,
+                               orientation='horizontal')
+            self._background = None
 
         if self._carn_dist_axis is not None:
             self._carn_dist_axis.set_data(carn_matrix)
         else:
             self._carn_dist_axis = self._carn_ax.imshow(carn_matrix,
                                                         interpolation='nearest',
-                                                        vmin=0, vmax=self.cmax_animals['Carnivore'])
-            plt.colorbar(self._carn_dist_axis, ax=self._carn_ax,
-                         orientation='horizontal')
+                                                        vmin=0, vmax=self.cmax_animals['Carnivore'],
+                                                        animated=True)
+            self._fig.colorbar(self._carn_dist_axis, ax=self._carn_ax,
+                               orientation='horizontal')
+            self._background = None
 
     def _update_population_graph(self):
         """
@@ -419,16 +521,53 @@ class BioSim:
         if self.automatic_ymax and self.ymax_animals < (self.num_animals + 100):
             self.ymax_animals = self.num_animals + 100
             self._pop_ax.set_ylim(0, self.ymax_animals)
+            self._background = None
+
+    def _animated_artists(self):
+        """
+        Returns the artists that change every year: the title, the distribution maps and the
+        population lines. They are left out of the background and drawn on top of it.
+        """
+        return [artist for artist in (self._title, self._herb_dist_axis, self._carn_dist_axis,
+                                      self._herb_line, self._carn_line)
+                if artist is not None]
+
+    def _on_draw(self, event):
+        """
+        Stores the background after every full draw of the figure, e.g. after the window is
+        resized, and draws the changing artists on top of it
+
+        :param event: the draw event
+        """
+        canvas = self._fig.canvas
+        if canvas.is_saving() or not canvas.supports_blit:
+            return
+        self._background = canvas.copy_from_bbox(self._fig.bbox)
+        for artist in self._animated_artists():
+            self._fig.draw_artist(artist)
 
     def _update_graphics(self):
         """
-        Updates the interface, and pauses the figure
+        Updates the interface. Only the changing artists are redrawn and blitted onto the
+        stored background; the whole figure is drawn again only when the background is out of
+        date, e.g. when the axis limits have changed
         """
         self._update_distribution_map()
         self._update_population_graph()
-        self._fig.suptitle('BioSimulation Year:{}'.format(self.year), fontsize=16)
-
-        plt.pause(1e-6)
+        self._title.set_text('BioSimulation Year:{}'.format(self.year))
+
+        canvas = self._fig.canvas
+        if not canvas.supports_blit:
+            canvas.draw_idle()
+        elif self._background is None:
+            canvas.draw()
+            canvas.blit(self._fig.bbox)
+        else:
+            canvas.restore_region(self._background)
+            for artist in self._animated_artists():
+                self._fig.draw_artist(artist)
+            canvas.blit(self._fig.bbox)
+        canvas.flush_events()
 
     def add_population(self, population):
         """
@@ -448,31 +587,45 @@ class BioSim:
     @property
     def num_animals(self):
         """Returns total number of animals on island"""
-        df_pop = self.animal_distribution
-        num_herb = df_pop['Herbivore'].sum()
-        num_carn = df_pop['Carnivore'].sum()
-        return num_carn + num_herb
+        totals = self._cycle.totals
+        return totals['Herbivore'] + totals['Carnivore']
 
     @property
     def num_animals_per_species(self):
         """Returns number of animals per species in island, as dictionary."""
-        df_pop = self.animal_distribution
-        num_herb = df_pop['Herbivore'].sum()
-        num_carn = df_pop['Carnivore'].sum()
-        return {'Herbivore': num_herb, 'Carnivore': num_carn}
+        return dict(self._cycle.totals)
+
+    @property
+    def density(self):
+        """
+        Returns dict with an array of the number of animals per cell for each species, shaped
+        like the island map
+        """
+        return {specie: counts.copy() for specie, counts in self._cycle.counts.items()}
+
+    def animal_properties(self):
+        """
+        Returns dict with the ages, weights and fitness of all animals of each species, as a
+        tuple of three arrays. Only the animals are read, so the food in idle cells is left
+        to be renewed lazily
+        """
+        return {specie: (ages, weights, self.params.species(specie).fitness_batch(ages, weights))
+                for specie, (ages, weights) in self._cycle.animal_arrays().items()}
 
     @property
     def animal_distribution(self):
-        """Returns pandas DataFrame with animal count per species for each cell on island."""
-        animal_df = pd.DataFrame(columns=['Row', 'Col', 'Herbivore', 'Carnivore'])
+        """
+        Returns pandas DataFrame with animal count per species for each cell on island. Rows
+        and columns are numbered from 1, like the locations of the initial population.
+        """
+        import pandas as pd
 
-        ix = 0
-        for x, row in enumerate(self._cycle.map):
-            for y, cell in enumerate(row):
-                ix += 1
-                animal_df.loc[ix] = [x, y, len(cell.pop_herb), len(cell.pop_carn)]
-        animal_df = animal_df.astype(int)
-        return animal_df
+        counts = self._cycle.counts
+        rows, cols = np.indices(counts['Herbivore'].shape)
+        return pd.DataFrame({'Row': rows.ravel() + 1,
+                             'Col': cols.ravel() + 1,
+                             'Herbivore': counts['Herbivore'].ravel(),
+                             'Carnivore': counts['Carnivore'].ravel()})
 
     def _save_graphics(self):
         """
@@ -483,14 +636,35 @@ class BioSim:
         if self.img_base is None:
             return
 
-        self._fig.savefig('{base}_{num:05d}.{type}'.format(base=self.img_base,
-                                                           num=self._img_ctr,
-                                                           type=self.img_fmt))
+        # Animated artists of the figure itself are left out when saving, so the title is
+        # made static while the figure is saved
+        self._title.set_animated(False)
+        try:
+            self._fig.savefig('{base}_{num:05d}.{type}'.format(base=self.img_base,
+                                                               num=self._img_ctr,
+                                                               type=self.img_fmt))
+        finally:
+            self._title.set_animated(True)
         self._img_ctr += 1
 
+    def _stream_frame(self):
+        """
+        Hands the current densities to the renderer, which encodes them as the next frame of
+        the movie in a background thread. The renderer is started with the first frame.
+        """
+        if self.img_base is None:
+            return
+
+        if self._renderer is None:
+            self._renderer = FrameRenderer('{}.{}'.format(self.img_base, self.img_fmt),
+                                           self._isl.letter_map, self.cmax_animals,
+                                           binary=_FFMPEG_BINARY)
+        self._renderer.submit(self.density)
+
     def make_movie(self, movie_fmt=None):
         """
-        Create MPEG4 movie from visualization images saved
+        Create MPEG4 movie from visualization images saved. If the frames were streamed, the
+        movie is finished instead
         :param movie_fmt: movie format
         """
         movie_fmt = movie_fmt if movie_fmt is not None else 'mp4'
@@ -498,6 +672,13 @@ class BioSim:
         if self.img_base is None:
             raise RuntimeError("No filename defined.")
 
+        if self.img_fmt in self.movie_formats:
+            if self._renderer is None:
+                raise RuntimeError('No frames have been streamed')
+            renderer, self._renderer = self._renderer, None
+            renderer.close()
+            return
+
         if movie_fmt == 'mp4':
             try:
                 subprocess.check_call([_FFMPEG_BINARY,
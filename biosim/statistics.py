@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import abc
+import glob
+import numpy as np
+
+"""
+Records statistics of a simulation year by year
+"""
+
+
+class StatisticsSink(abc.ABC):
+    """
+    Receives the state of a simulation after every simulated year. Subclass it and implement
+    record to store other statistics, and override close to release what the sink holds.
+    """
+
+    @abc.abstractmethod
+    def record(self, sim):
+        """
+        Method that is called by BioSim.simulate after every year
+
+        :param sim: the BioSim
+        """
+
+    def flush(self):
+        """
+        Method that is called by BioSim.simulate when the simulation stops
+        """
+        pass
+
+    def close(self):
+        """
+        Method that stores what is left in the sink
+        """
+        self.flush()
+
+
+class StatisticsWriter(StatisticsSink):
+    """
+    Writes per-year statistics to NumPy archives, one chunk of at most chunk_years years per
+    file, so that memory use stays bounded in long runs. Every chunk holds the arrays
+
+    - year: shape (n,), the year after the step
+    - counts: shape (n, 2), the number of herbivores and carnivores
+    - density: shape (n, 2, rows, cols), the number of herbivores and carnivores per cell
+    - age, weight and fitness: shape (n, 2, bins), histograms per species
+
+    together with the bin edges of the histograms. Values outside the edges are counted in
+    the first or last bin. Files are named ’{}_{:05d}.npz’.format(base, chunk_no).
+    """
+    species = ('Herbivore', 'Carnivore')
+
+    def __init__(self, base, chunk_years=100, age_bins=None, weight_bins=None,
+                 fitness_bins=None):
+        """
+        :param base: String with beginning of file name for chunks, including path
+        :param chunk_years: int, the number of years kept in memory before a chunk is written
+        :param age_bins: sequence of bin edges for ages. Default: 0 to 60 in steps of 2
+        :param weight_bins: sequence of bin edges for weights. Default: 0 to 100 in steps of 5
+        :param fitness_bins: sequence of bin edges for fitness. Default: 0 to 1 in steps of
+        0.05
+        """
+        if chunk_years < 1:
+            raise ValueError('A chunk must hold at least one year')
+        self.base = base
+        self.chunk_years = chunk_years
+        self.bins = {'age': np.asarray(age_bins if age_bins is not None
+                                       else np.arange(0, 62, 2), dtype=np.float64),
+                     'weight': np.asarray(weight_bins if weight_bins is not None
+                                          else np.arange(0, 105, 5), dtype=np.float64),
+                     'fitness': np.asarray(fitness_bins if fitness_bins is not None
+                                           else np.linspace(0, 1, 21), dtype=np.float64)}
+        self._chunk_no = 0
+        self._buffer = []
+
+    def _histogram(self, values, key):
+        edges = self.bins[key]
+        return np.histogram(np.clip(values, edges[0], edges[-1]), edges)[0]
+
+    def record(self, sim):
+        """
+        Method that adds the statistics of the current year to the buffer, and writes a chunk
+        when the buffer is full
+
+        :param sim: the BioSim
+        """
+        density = sim.density
+        properties = sim.animal_properties()
+        row = {'year': sim.year,
+               'counts': [int(density[specie].sum()) for specie in self.species],
+               'density': [density[specie] for specie in self.species]}
+        for ix, key in enumerate(('age', 'weight', 'fitness')):
+            row[key] = [self._histogram(properties[specie][ix], key)
+                        for specie in self.species]
+        self._buffer.append(row)
+
+        if len(self._buffer) >= self.chunk_years:
+            self.flush()
+
+    def flush(self):
+        """
+        Method that writes the buffered years as one chunk
+        """
+        if not self._buffer:
+            return
+        arrays = {key: np.array([row[key] for row in self._buffer])
+                  for key in self._buffer[0]}
+        arrays.update({key + '_bins': edges for key, edges in self.bins.items()})
+        np.savez_compressed('{base}_{num:05d}.npz'.format(base=self.base, num=self._chunk_no),
+                            **arrays)
+        self._chunk_no += 1
+        self._buffer = []
+
+
+def read_statistics(base):
+    """
+    Function that joins the chunks written by a StatisticsWriter
+
+    :param base: String with beginning of file name for chunks, including path
+    :return: dict with the arrays of all chunks joined along the year axis, and the bin edges
+    """
+    paths = sorted(glob.glob(glob.escape(base) + '_[0-9][0-9][0-9][0-9][0-9].npz'))
+    if not paths:
+        raise FileNotFoundError('No statistics found for ' + base)
+
+    chunks = []
+    for path in paths:
+        with np.load(path) as data:
+            chunks.append({key: data[key] for key in data.files})
+    return {key: chunks[0][key] if key.endswith('_bins')
+            else np.concatenate([chunk[key] for chunk in chunks])
+            for key in chunks[0]}
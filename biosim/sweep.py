@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import dataclasses
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import textwrap
+import numpy as np
+from biosim.ensemble import replicate_counts
+from biosim.mapping import Island
+from biosim.parameters import Parameters
+
+"""
+Runs a simulation for many parameter sets and seeds, and keeps the results on disk
+"""
+
+
+def grid(space):
+    """
+    Function that lists every combination of parameter values
+
+    :param space: dict mapping 'Herbivore', 'Carnivore', 'J' or 'S' to a dict mapping
+    parameter names to a sequence of values
+    :return: list of points, each a dict mapping owners to a dict of parameter values
+    """
+    names = [(owner, key) for owner, values in space.items() for key in values]
+    points = []
+    for combination in itertools.product(*(space[owner][key] for owner, key in names)):
+        point = {}
+        for (owner, key), value in zip(names, combination):
+            point.setdefault(owner, {})[key] = value
+        points.append(point)
+    return points
+
+
+def latin_hypercube(bounds, n, seed=None):
+    """
+    Function that draws a Latin hypercube sample of parameter values. The range of every
+    parameter is split in n equal strata, and every stratum is used exactly once.
+
+    :param bounds: dict mapping 'Herbivore', 'Carnivore', 'J' or 'S' to a dict mapping
+    parameter names to a (low, high) pair
+    :param n: int, number of points
+    :param seed: int used as random number seed
+    :return: list of points, each a dict mapping owners to a dict of parameter values
+    """
+    rng = np.random.default_rng(seed)
+    names = [(owner, key) for owner, values in bounds.items() for key in values]
+    points = [{} for _ in range(n)]
+    for owner, key in names:
+        low, high = bounds[owner][key]
+        fractions = (rng.permutation(n) + rng.random(n)) / n
+        for point, fraction in zip(points, fractions.tolist()):
+            point.setdefault(owner, {})[key] = low + fraction * (high - low)
+    return points
+
+
+def _digest(obj):
+    """
+    Function that hashes an object that can be written as JSON
+
+    :param obj: the object
+    :return: str, the hexadecimal SHA-256 digest of the canonical JSON form
+    """
+    text = json.dumps(obj, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _keyed_counts(item):
+    """
+    Function that runs one replicate in a worker process, and tells which run it was
+
+    :param item: pair of the key of the run and its task, as for replicate_counts
+    :return: pair of the key and the counts
+    """
+    key, task = item
+    return key, replicate_counts(task)
+
+
+class ResultCache:
+    """
+    Stores the yearly counts of finished runs in a directory, one .npy file per run. A run is
+    identified by the hash of its island map, initial population, parameters, seed, number of
+    years and engine.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: str, path of the directory. It is created if it does not exist
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(island_map, ini_pop, params, seed, num_years, engine):
+        """
+        Method that computes the key of a run
+
+        :param island_map: Multi-line string specifying island geography
+        :param ini_pop: List of dictionaries specifying initial population
+        :param params: the Parameters of the run
+        :param seed: int, the seed of the run
+        :param num_years: int, the number of years simulated
+        :param engine: String, 'object' or 'array'
+        :return: str, the key
+        """
+        letters = textwrap.dedent(island_map if island_map is not None
+                                  else Island().letter_map).split()
+        return _digest({'map': _digest(letters),
+                        'population': _digest(ini_pop),
+                        'params': dataclasses.asdict(params),
+                        'seed': seed,
+                        'years': num_years,
+                        'engine': engine})
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        """
+        Method that looks up a run
+
+        :param key: str, the key of the run
+        :return: the stored counts, or None if the run is not in the cache
+        """
+        try:
+            return np.load(self._path(key))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, counts):
+        """
+        Method that stores a run. The file is written under a temporary name first, so that
+        an interrupted sweep never leaves a partial result behind.
+
+        :param key: str, the key of the run
+        :param counts: array with the counts of the run
+        """
+        temporary = '{}.{}.tmp.npy'.format(self._path(key)[:-4], os.getpid())
+        np.save(temporary, counts)
+        os.replace(temporary, self._path(key))
+
+
+class Sweep:
+    """
+    Runs one simulation setup for many parameter sets and seeds on a pool of processes. Runs
+    that are already in the cache are not run again.
+    """
+
+    def __init__(self, island_map=None, ini_pop=None, cache_dir=None, engine='array'):
+        """
+        :param island_map: Multi-line string specifying island geography. If None, the default
+        in the Island class is used
+        :param ini_pop: List of dictionaries specifying initial population. If None, the
+        default in the Cells class is used
+        :param cache_dir: str, directory of the ResultCache. If None, nothing is cached
+        :param engine: String, 'object' or 'array', the engine used by every BioSim
+        """
+        self.island_map = island_map
+        self.ini_pop = ini_pop
+        self.cache = ResultCache(cache_dir) if cache_dir is not None else None
+        self.engine = engine
+        self.runs = 0
+
+    def parameters(self, point):
+        """
+        Method that turns a point of the sweep into Parameters
+
+        :param point: dict mapping 'Herbivore', 'Carnivore', 'J' or 'S' to a dict of parameter
+        values that replace the defaults
+        :return: the Parameters
+        """
+        params = Parameters.from_classes()
+        for owner, new_params in point.items():
+            params = params.update(owner, new_params)
+        return params
+
+    def _collect(self, computed, results):
+        """
+        Method that stores runs as they finish, in results and in the cache
+
+        :param computed: iterable of pairs of the key of a run and its counts
+        :param results: dict mapping keys to counts, updated in place
+        """
+        for key, counts in computed:
+            results[key] = counts
+            if self.cache is not None:
+                self.cache.put(key, counts)
+            self.runs += 1
+
+    def run(self, points, seeds, num_years, processes=None):
+        """
+        Method that runs every combination of point and seed. Identical runs are only done
+        once, and every run is stored in the cache as soon as it is finished, so an
+        interrupted sweep keeps the runs it completed
+
+        :param points: sequence of points, e.g. from grid or latin_hypercube
+        :param seeds: sequence of ints, one seed per replicate
+        :param num_years: number of years to simulate
+        :param processes: number of worker processes. If None, one per CPU is used. With 1,
+        the runs happen in this process
+        :return: list with one array of shape (len(seeds), num_years + 1, 2) per point, holding
+        the number of herbivores and carnivores per year
+        """
+        seeds = list(seeds)
+        if not seeds:
+            raise ValueError('At least one seed is needed')
+        tasks = [(self.island_map, self.ini_pop, self.parameters(point), seed, num_years,
+                  self.engine) for point in points for seed in seeds]
+        keys = [ResultCache.key(*task) for task in tasks]
+        unique = dict(zip(keys, tasks))
+
+        results = {}
+        if self.cache is not None:
+            for key in unique:
+                counts = self.cache.get(key)
+                if counts is not None:
+                    results[key] = counts
+
+        missing = [(key, task) for key, task in unique.items() if key not in results]
+        if processes == 1 or len(missing) <= 1:
+            self._collect(map(_keyed_counts, missing), results)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                self._collect(pool.imap_unordered(_keyed_counts, missing, chunksize=1), results)
+
+        n = len(seeds)
+        return [np.stack([results[key] for key in keys[ix * n:(ix + 1) * n]])
+                for ix in range(len(points))]
@@ -5,8 +5,10 @@ __author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
 __email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
 """
 
+import math
 import pytest
 from biosim.animals import Animal, Carnivore, Herbivore
+from biosim.parameters import Parameters
 
 
 class TestAnimal:
@@ -44,20 +46,22 @@ class TestAnimal:
     def test_dies(self, mocker):
         """
         The animal dies
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
-        mocker.patch('random.random', return_value=0)
+        rng = mocker.Mock()
+        rng.random.return_value = 0
         carn = Carnivore('Carnivore', 5, 10)
-        assert not carn.survival()
+        assert not carn.survival(rng)
 
     def test_alive(self, mocker):
         """
         The animal survives
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
-        mocker.patch('random.random', return_value=0.999999)
+        rng = mocker.Mock()
+        rng.random.return_value = 0.999999
         herb = Herbivore('Herbivore', 6, 2)
-        assert herb.survival()
+        assert herb.survival(rng)
 
     def test_food_loss(self):
         """
@@ -75,77 +79,161 @@ class TestAnimal:
         herb = Herbivore('Herbivore', 5, 10)
         assert 0 <= herb.fitness() <= 1
 
+    def test_fitness_cached(self, mocker):
+        """
+        The fitness is only recomputed when the age, weight or fitness parameters change
+        """
+        herb = Herbivore('Herbivore', 5, 10)
+        phi = herb.fitness()
+        spy = mocker.spy(math, 'exp')
+        assert herb.fitness() == phi
+        assert spy.call_count == 0
+
+        herb.eat_gain_weight(10)
+        assert herb.fitness() > phi
+        assert spy.call_count == 2
+
+    def test_fitness_parameter_change(self):
+        """
+        The cached fitness is invalidated when a fitness parameter of the species changes
+        """
+        herb = Herbivore('Herbivore', 5, 10)
+        phi = herb.fitness()
+        old_w_half = Herbivore.w_half
+        try:
+            Herbivore.set_parameters({'w_half': 20.0})
+            assert herb.fitness() < phi
+            Herbivore.w_half = old_w_half
+            assert herb.fitness() == pytest.approx(phi)
+        finally:
+            Herbivore.w_half = old_w_half
+
+    def test_fitness_batch(self):
+        """
+        The batched fitness equals the fitness of each animal, for integer and float ages
+        """
+        ages = [0, 5, 40, 200]
+        weights = [0, 10, 33.3, 50]
+        expected = [Carnivore('Carnivore', a, w).fitness() for a, w in zip(ages, weights)]
+        assert Carnivore.fitness_batch(ages, weights) == pytest.approx(expected)
+        assert Carnivore.fitness_batch([float(a) for a in ages], weights) == \
+            pytest.approx(expected)
+
+    def test_update_fitness(self):
+        """
+        The batched update stores the fitness in every animal
+        """
+        herbs = [Herbivore('Herbivore', a, 12) for a in range(20)]
+        Herbivore.update_fitness(herbs)
+        for herb in herbs:
+            assert herb.phi == pytest.approx(Herbivore('Herbivore', herb.a, 12).fitness())
+
+    def test_age_table_parameter_change(self):
+        """
+        The age table is recomputed when phi_age changes
+        """
+        old_phi_age = Herbivore.phi_age
+        try:
+            before = Herbivore.age_factors(10)[10]
+            Herbivore.phi_age = 0.5
+            assert Herbivore.age_factors(10)[10] != before
+        finally:
+            Herbivore.phi_age = old_phi_age
+
     def test_direction_not_move(self, mocker):
         """
         The animal does not move
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
         herb = Herbivore('Herbivore', 5, 10)
-        mocker.patch('random.random', return_value=1)
-        assert herb.move_dir() is None
+        rng = mocker.Mock()
+        rng.random.return_value = 1
+        assert herb.move_dir(rng) is None
 
     def test_direction_north(self, mocker):
         """
         The animal moves north
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
         herb = Herbivore('Herbivore', 5, 10)
-        mocker.patch('random.random', return_value=0.0001)
-        mocker.patch('random.randint', return_value=3)
-        assert herb.move_dir() == 'North'
+        rng = mocker.Mock()
+        rng.random.return_value = 0.0001
+        rng.integers.return_value = 3
+        assert herb.move_dir(rng) == 'North'
 
     def test_direction_east(self, mocker):
         """
         The animal moves east
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
         herb = Herbivore('Herbivore', 5, 10)
-        mocker.patch('random.random', return_value=0.0001)
-        mocker.patch('random.randint', return_value=7)
-        assert herb.move_dir() == 'East'
+        rng = mocker.Mock()
+        rng.random.return_value = 0.0001
+        rng.integers.return_value = 7
+        assert herb.move_dir(rng) == 'East'
 
     def test_direction_south(self, mocker):
         """
         The animal moves south
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
         herb = Herbivore('Herbivore', 5, 10)
-        mocker.patch('random.random', return_value=0.0001)
-        mocker.patch('random.randint', return_value=12)
-        assert herb.move_dir() == 'South'
+        rng = mocker.Mock()
+        rng.random.return_value = 0.0001
+        rng.integers.return_value = 12
+        assert herb.move_dir(rng) == 'South'
 
     def test_direction_west(self, mocker):
         """
         The animal moves west
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
         herb = Herbivore('Herbivore', 5, 10)
-        mocker.patch('random.random', return_value=0.0001)
-        mocker.patch('random.randint', return_value=17)
-        assert herb.move_dir() == 'West'
+        rng = mocker.Mock()
+        rng.random.return_value = 0.0001
+        rng.integers.return_value = 17
+        assert herb.move_dir(rng) == 'West'
 
     def test_birth_weight(self, mocker):
         """
         The animal gives birth to a baby and the mother looses the correct weight
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         :return:
         """
         carn = Carnivore('Carnivore', 5, 10000)
-        mocker.patch('random.random', return_value=0)
-        baby = carn.give_birth('Carnivore', 2)
+        rng = mocker.Mock()
+        rng.random.return_value = 0
+        rng.normal.return_value = 6
+        baby = carn.give_birth('Carnivore', 2, rng)
         assert carn.w == 10000-carn.xi*baby.w
 
     def test_birth_weight_zero(self, mocker):
         """
         The mothers weight can't be negative after giving birth
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
         herb = Herbivore('Herbivore', 5, 34)
-        mocker.patch('random.random', return_value=0)
-        mocker.patch('random.gauss', return_value=50)
-        herb.give_birth('Herbivore', 2)
+        rng = mocker.Mock()
+        rng.random.return_value = 0
+        rng.normal.return_value = 50
+        herb.give_birth('Herbivore', 2, rng)
         assert herb.w == 34
 
+    def test_compact(self):
+        """
+        Animals keep their state in slots, also in classes bound to parameters, and the
+        species is given by the class
+        """
+        params = Parameters.from_classes()
+        for animal, code in ((Herbivore, 0), (Carnivore, 1),
+                             (params.species('Herbivore'), 0), (params.species('Carnivore'), 1)):
+            instance = animal(animal.specie, 5, 10)
+            assert not hasattr(instance, '__dict__')
+            assert instance.code == code
+            assert instance.specie == ('Herbivore', 'Carnivore')[code]
+            with pytest.raises(AttributeError):
+                instance.colour = 'brown'
+
 
 class TestHerbivore:
     """
@@ -177,12 +265,13 @@ class TestCarnivore:
     def test_kill(self, mocker):
         """
         The carnivore can kill a herbivore
-        :param mocker: mocks a random number
+        :param mocker: mocks a random number stream
         """
-        mocker.patch('random.random', return_value=0.0001)
+        rng = mocker.Mock()
+        rng.random.return_value = 0.0001
         carn = Carnivore('Carnivore', 5, 10)
         carn.fitness()
-        assert carn.kill(0.000001)
+        assert carn.kill(0.000001, rng)
 
     def test_carn_eating(self):
         """
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import pytest
+from biosim import benchmark
+from biosim.cell_control import Cells
+
+
+class TestScenarios:
+    """
+    Class for testing the benchmark scenarios
+    """
+    def test_synthetic_island(self):
+        """
+        A synthetic island has the asked size, ocean along the edges and is the same for the
+        same seed
+        """
+        island = benchmark.synthetic_island(6, 8, seed=3)
+        rows = island.split()
+        assert len(rows) == 6 and all(len(row) == 8 for row in rows)
+        assert set(rows[0] + rows[-1] + ''.join(row[0] + row[-1] for row in rows)) == {'O'}
+        assert island == benchmark.synthetic_island(6, 8, seed=3)
+        Cells([], island)
+
+    def test_synthetic_archipelago(self):
+        """
+        A synthetic archipelago is mostly ocean, with at most the asked number of islands
+        """
+        archipelago = benchmark.synthetic_archipelago(40, 50, 3, size=4, seed=2)
+        rows = archipelago.split()
+        assert len(rows) == 40 and all(len(row) == 50 for row in rows)
+        assert 0 < sum(letter != 'O' for letter in archipelago if letter != '\n') <= 3 * 16
+        assert archipelago == benchmark.synthetic_archipelago(40, 50, 3, size=4, seed=2)
+        Cells([], archipelago)
+
+    def test_spread_population(self):
+        """
+        Animals are placed in every every-th habitable cell only
+        """
+        population = benchmark.spread_population('OOOO\nOJMO\nOSDO\nOOOO', 2, 1, every=2)
+        assert [group['loc'] for group in population] == [(2, 2), (3, 3)]
+        assert len(population[0]['pop']) == 3
+
+
+class TestBenchmarks:
+    """
+    Class for testing the timing and comparison of benchmarks
+    """
+    def test_run(self):
+        """
+        Every phase of every scenario and engine is timed
+        """
+        results = benchmark.run_benchmarks(['dense_jungle'], years=1, repeats=2)
+        assert set(results) == {'dense_jungle/object', 'dense_jungle/array', 'calibration'}
+        for engine in ('object', 'array'):
+            timings = results['dense_jungle/' + engine]
+            assert set(timings) == set(Cells.phases) | {'animal_distribution', 'animals'}
+            assert all(seconds > 0 for seconds in timings.values())
+
+    def test_compare(self):
+        """
+        Only timings that grew by more than the tolerance and the minimum are regressions, and
+        the baseline is scaled by the speed of the machine
+        """
+        baseline = {'a/object': {'feeding': 0.1, 'birth': 0.1, 'animals': 10},
+                    'calibration': {'reference': 0.01}}
+        results = {'a/object': {'feeding': 0.2, 'birth': 0.11, 'animals': 20},
+                   'b/object': {'feeding': 1.},
+                   'calibration': {'reference': 0.01}}
+        assert benchmark.compare(results, baseline) == [('a/object', 'feeding', 0.1, 0.2)]
+        assert benchmark.compare(results, baseline, tolerance=1.5) == []
+
+        results['calibration']['reference'] = 0.02
+        assert benchmark.compare(results, baseline) == []
+
+    def test_command_line(self, tmpdir, capsys):
+        """
+        A stored baseline can be compared against, and regressions give exit status 1
+        """
+        path = str(tmpdir.join('baseline.json'))
+        arguments = ['--scenarios', 'dense_jungle', '--engines', 'array', '--years', '1',
+                     '--repeats', '1']
+        assert benchmark.main(['run', '--save', path] + arguments) == 0
+        assert benchmark.load_baseline(path)['dense_jungle/array']['hunting'] > 0
+
+        assert benchmark.main(['compare', path, '--tolerance', '1000'] + arguments) == 0
+        assert 'dense_jungle/array' in capsys.readouterr().out
+        results = benchmark.load_baseline(path)
+        results['dense_jungle/array'] = {phase: seconds / 1000 for phase, seconds
+                                         in results['dense_jungle/array'].items()}
+        benchmark.save_baseline(results, path)
+        assert benchmark.main(['compare', path] + arguments) == 1
+        assert 'REGRESSION dense_jungle/array hunting' in capsys.readouterr().out
+
+    def test_unknown_scenario(self):
+        """
+        Only known scenarios can be run
+        """
+        with pytest.raises(SystemExit):
+            benchmark.main(['run', '--scenarios', 'nowhere'])
@@ -5,8 +5,12 @@ __author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
 __email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
 """
 
+import numpy as np
 import pytest
+from biosim.animals import Herbivore
 from biosim.cell_control import Cells
+from biosim.landscape import Jungle, Savannah
+from biosim.random_streams import RandomStream
 
 
 class TestGenAnimal:
@@ -54,12 +58,206 @@ class TestMove:
         celle = Cells()
         celle.generate_animals()
 
-        mocker.patch('random.random', return_value=1)
+        rng = mocker.Mock()
+        rng.random.return_value = 1
 
         for x, row in enumerate(celle.map):
             for y, cell in enumerate(row):
                 n_animal = len(cell.pop_herb)+len(cell.pop_carn)
-                celle.move(x, y)
+                celle.move(x, y, rng)
                 assert n_animal == len(cell.pop_herb)+len(cell.pop_carn)
 
 
+    def test_neighbour_table(self):
+        """
+        Only habitable neighbours are listed in the neighbour table
+        """
+        celle = Cells([], """\
+                           OOOO
+                           OJMO
+                           OSJO
+                           OOOO""")
+        assert list(celle.neighbours[celle.cell_index(1, 1)]) == [-1, -1,
+                                                                celle.cell_index(2, 1), -1]
+        assert list(celle.neighbours[celle.cell_index(0, 0)]) == [-1, -1, -1, -1]
+
+    @pytest.mark.parametrize('backend', ['object', 'array'])
+    def test_migrate(self, backend, mocker):
+        """
+        Animals that migrate move at most one step, to a habitable cell, and none are lost
+        """
+        celle = Cells([{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5,
+                                                'weight': 50} for _ in range(200)]}],
+                      """\
+                      OOOO
+                      OJMO
+                      OSJO
+                      OOOO""", backend=backend)
+        celle.generate_animals()
+        rng = RandomStream(np.random.default_rng(1))
+        mocker.patch.object(rng, 'random',
+                            side_effect=lambda size=None: 0 if size is None else np.zeros(size))
+        if backend == 'object':
+            celle.migrate(rng)
+        else:
+            celle.migrate_array(celle.populations['Herbivore'], rng)
+
+        celle.update_counts()
+        herbs = celle.counts['Herbivore']
+        assert herbs.sum() == 200
+        assert herbs[2, 1] > 0
+        assert herbs[1, 2] == 0 and herbs[2, 2] == 0
+
+    def test_migrate_by_code(self, mocker):
+        """
+        Migrating animals arrive in the population list given by the code of their species
+        """
+        celle = Cells([{'loc': (2, 2), 'pop': [{'species': species, 'age': 5, 'weight': 50}
+                                               for species in ('Herbivore', 'Carnivore')
+                                               for _ in range(20)]}],
+                      """\
+                      OOOO
+                      OJMO
+                      OSJO
+                      OOOO""")
+        celle.generate_animals()
+        rng = RandomStream(np.random.default_rng(1))
+        mocker.patch.object(rng, 'random', return_value=0)
+        celle.migrate(rng)
+
+        herbs = [animal for cell in celle.flat_map for animal in cell.pop_herb]
+        carns = [animal for cell in celle.flat_map for animal in cell.pop_carn]
+        assert len(herbs) == len(carns) == 20
+        assert {type(animal).code for animal in herbs} == {0}
+        assert {type(animal).code for animal in carns} == {1}
+        assert not all(animal.not_walked for animal in herbs + carns)
+
+
+class TestCounts:
+    """
+    Class for testing the census kept by Cells
+    """
+    @pytest.mark.parametrize('backend', ['object', 'array'])
+    def test_counts_follow_cycle(self, backend):
+        """
+        The counts per cell and the totals match the animals on the island after a year
+        """
+        celle = Cells(backend=backend)
+        celle.generate_animals()
+        assert celle.counts['Herbivore'][1, 17] == 100
+        assert celle.totals == {'Herbivore': 100, 'Carnivore': 50}
+
+        celle.cell_cycle()
+        if backend == 'object':
+            n_herb = sum(len(cell.pop_herb) for row in celle.map for cell in row)
+        else:
+            n_herb = len(celle.populations['Herbivore'])
+        assert celle.totals['Herbivore'] == n_herb == celle.counts['Herbivore'].sum()
+
+
+class TestActive:
+    """
+    Class for testing the set of cells where animals live, with the object backend
+    """
+    def test_active_follows_migration(self):
+        """
+        After migration and death, active holds exactly the cells where animals live
+        """
+        celle = Cells(seed=4)
+        celle.generate_animals()
+        assert celle.active == {celle.cell_index(1, 17), celle.cell_index(4, 16)}
+
+        for _ in range(5):
+            celle.cell_cycle()
+            assert set(celle.occupied_cells()) == {
+                ix for ix, cell in enumerate(celle.flat_map) if cell.pop_herb or cell.pop_carn}
+        assert len(celle.active) > 2
+
+    def test_empty_cells_skipped(self, mocker):
+        """
+        The phases of the year never visit ocean cells, or desert the animals cannot reach
+        """
+        celle = Cells([{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                               for _ in range(20)] +
+                                              [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                               for _ in range(5)]}],
+                      """\
+                      OOOOO
+                      OJODO
+                      OOOOO""", seed=1)
+        celle.generate_animals()
+        skipped = [cell for ix, cell in enumerate(celle.flat_map) if ix != celle.cell_index(1, 1)]
+        mocks = [mocker.patch.object(cell, method) for cell in skipped
+                 for method in ('feeding_herb', 'feeding_carn', 'birth', 'set_not_walked_true',
+                                'age', 'weight_loss', 'survive')]
+
+        for _ in range(3):
+            celle.cell_cycle()
+        assert celle.totals['Herbivore'] > 0
+        assert not any(mock.called for mock in mocks)
+
+    def test_refresh_active(self):
+        """
+        Animals placed in a cell directly are counted after refresh_active
+        """
+        celle = Cells()
+        celle.generate_animals()
+        cell = celle.map[2][7]
+        cell.pop_herb.append(celle.species['Herbivore']('Herbivore', 3, 20))
+        celle.refresh_active()
+        celle.update_counts()
+        assert celle.counts['Herbivore'][2, 7] == 1
+        assert celle.totals['Herbivore'] == 101
+
+
+class TestFood:
+    """
+    Class for testing the renewal of food in cells without herbivores
+    """
+    @pytest.mark.parametrize('backend', ['object', 'array'])
+    def test_lazy_regrowth(self, backend, mocker):
+        """
+        Empty cells are not visited, but the food read from state has regrown every year
+        """
+        celle = Cells([], """\
+                      OOOO
+                      OSJO
+                      OOOO""", backend=backend)
+        savannah, jungle = celle.flat_map[5], celle.flat_map[6]
+        savannah.food, jungle.food = 0.0, 1.0
+        feeding = [mocker.spy(cell, method) for cell in (savannah, jungle)
+                   for method in ('feeding_herb', 'feeding_herb_array')]
+
+        for _ in range(4):
+            celle.cell_cycle()
+        assert not any(spy.called for spy in feeding)
+        assert savannah.food == 0
+
+        expected = 0.0
+        for _ in range(4):
+            expected += Savannah.alpha * (Savannah.f_max - expected)
+        food = celle.state()['food']
+        assert food[5] == expected
+        assert food[6] == Jungle.f_max
+
+    def test_caught_up_before_grazing(self):
+        """
+        Herbivores arriving in a cell find the food regrown for the years it was empty
+        """
+        celle = Cells([], """\
+                      OOOO
+                      OSSO
+                      OOOO""")
+        savannah = celle.flat_map[5]
+        savannah.food = 0.0
+        for _ in range(3):
+            celle.cell_cycle()
+
+        savannah.pop_herb.append(celle.species['Herbivore']('Herbivore', 5, 20))
+        celle.refresh_active()
+        celle.grazing()
+        expected = 0.0
+        for _ in range(4):
+            expected += Savannah.alpha * (Savannah.f_max - expected)
+        assert savannah.food == expected - Herbivore.F
+        assert celle.food_year[5] == 4
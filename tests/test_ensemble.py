@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import numpy as np
+import pytest
+from biosim.animals import Carnivore, Herbivore
+from biosim.ensemble import Ensemble, run_ensemble
+
+
+ISLAND = """\
+         OOOOO
+         OJJSO
+         OJDJO
+         OOOOO"""
+
+POPULATION = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(40)] +
+                                     [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                      for _ in range(5)]}]
+
+
+class TestEnsemble:
+    """
+    Class for testing the Ensemble class
+    """
+    def test_parameters(self):
+        """
+        Overrides are checked and applied to the parameters of the ensemble only
+        """
+        omega = Herbivore.omega
+        ensemble = Ensemble(ISLAND, POPULATION, {'Herbivore': {'omega': 0.5}})
+        assert ensemble.params.herbivore.omega == 0.5
+        assert ensemble.params.carnivore.DeltaPhiMax == Carnivore.DeltaPhiMax
+        assert Herbivore.omega == omega
+        with pytest.raises(ValueError):
+            Ensemble(ISLAND, POPULATION, {'Herbivore': {'omega': 2}})
+        with pytest.raises(KeyError):
+            Ensemble(ISLAND, POPULATION, {'J': {'omega': 0.5}})
+
+    def test_counts_shape(self):
+        """
+        The counts hold the initial population and one entry per year for every seed
+        """
+        ensemble = Ensemble(ISLAND, POPULATION)
+        counts = ensemble.run([1, 2, 3], 4, processes=1)
+        assert counts.shape == (3, 5, 2)
+        assert list(counts[:, 0, 0]) == [40, 40, 40]
+
+    def test_pool_matches_serial(self):
+        """
+        Replicates give the same counts whether they run in a pool or in this process
+        """
+        omega = Herbivore.omega
+        serial = Ensemble(ISLAND, POPULATION, {'Herbivore': {'omega': 0.6}})
+        pooled = Ensemble(ISLAND, POPULATION, {'Herbivore': {'omega': 0.6}})
+        assert np.array_equal(serial.run([1, 2], 5, processes=1),
+                              pooled.run([1, 2], 5, processes=2))
+        assert Herbivore.omega == omega
+
+    def test_summary(self):
+        """
+        The summary holds the mean and the quantiles of every year
+        """
+        summary = run_ensemble([1, 2, 3], 3, ISLAND, POPULATION, processes=1,
+                               quantiles=(0, 1))
+        herbs = summary['Herbivore']
+        assert len(herbs['mean']) == 4
+        assert np.all(herbs['quantiles'][0] <= herbs['mean'])
+        assert np.all(herbs['mean'] <= herbs['quantiles'][1])
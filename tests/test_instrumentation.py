@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import csv
+import numpy as np
+import pytest
+from biosim.cell_control import Cells
+from biosim.instrumentation import PhaseRecorder, YearRecord
+from biosim.simulation import BioSim
+
+
+ISLAND = """\
+         OOOOO
+         OJJSO
+         OJJJO
+         OOOOO"""
+
+POPULATION = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(100)] +
+                                     [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                      for _ in range(20)]}]
+
+
+class TestYearRecord:
+    """
+    Class for testing the YearRecord class
+    """
+    def test_rates(self):
+        """
+        The total time and the animal-years per second follow from the phase times, and the
+        rate does not depend on the time spent on output
+        """
+        record = YearRecord(0, 100, {'birth': 0.25, 'death': 0.25})
+        assert record.total_seconds == 0.5
+        assert record.animal_years_per_second == 200
+        assert YearRecord(0, 100).animal_years_per_second == 0
+
+        record.seconds['output'] = 1.5
+        assert record.total_seconds == 2.0
+        assert record.phase_seconds == 0.5
+        assert record.animal_years_per_second == 200
+
+
+class TestPhaseRecorder:
+    """
+    Class for testing the PhaseRecorder class
+    """
+    @pytest.mark.parametrize('backend', ['object', 'array'])
+    def test_counts(self, backend):
+        """
+        The counts add up to the change in the number of animals, and recording does not
+        change the simulation
+        """
+        recorded = Cells(POPULATION, ISLAND, backend=backend, seed=2)
+        plain = Cells(POPULATION, ISLAND, backend=backend, seed=2)
+        recorder = PhaseRecorder()
+        recorded.recorder = recorder
+        for cells in (recorded, plain):
+            cells.generate_animals()
+            for _ in range(5):
+                cells.cell_cycle()
+
+        assert recorded.totals == plain.totals
+        assert [record.year for record in recorder.records] == list(range(5))
+        animals = [record.animals for record in recorder.records] + [recorded.count_animals()]
+        for record, after in zip(recorder.records, animals[1:]):
+            assert record.animals + record.births - record.deaths - record.kills == after
+            assert set(record.seconds) == set(Cells.phases)
+        assert sum(record.kills for record in recorder.records) > 0
+        assert sum(record.migrations for record in recorder.records) > 0
+
+    def test_biosim(self, tmpdir):
+        """
+        BioSim records the time spent outside the phases, and the records can be exported
+        """
+        recorder = PhaseRecorder()
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, engine='array',
+                     headless=True, recorder=recorder)
+        sim.simulate(3)
+        assert len(recorder.records) == 3
+        assert all('output' in record.seconds for record in recorder.records)
+
+        path = str(tmpdir.join('phases.csv'))
+        recorder.export(path)
+        with open(path) as file:
+            rows = list(csv.DictReader(file))
+        assert [int(row['year']) for row in rows] == [0, 1, 2]
+        assert int(rows[1]['births']) == recorder.records[1].births
+        assert float(rows[0]['seconds_grazing']) == recorder.records[0].seconds['grazing']
+        assert np.isclose(float(rows[2]['total_seconds']), recorder.records[2].total_seconds)
+
+    def test_bands(self):
+        """
+        Phases can not be recorded on bands
+        """
+        with pytest.raises(ValueError):
+            BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, engine='bands',
+                   headless=True, recorder=PhaseRecorder())
@@ -5,9 +5,13 @@ __author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
 __email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
 """
 
+import math
+import random
 import pytest
-from biosim.landscape import Landscape, Jungle, Savannah, Desert, Mountain, Ocean
+from biosim.animals import Carnivore, Herbivore
+from biosim.landscape import Landscape, Jungle, Savannah, Desert, Mountain, Ocean, _PreyIndex
 from biosim.cell_control import Cells
+from biosim.parameters import Parameters
 
 
 class TestLandscape:
@@ -37,7 +41,9 @@ class TestLandscape:
         """
         celle = Cells()
         celle.generate_animals()
-        mocker.patch('random.random', return_value=0)
+        rng = mocker.Mock()
+        rng.random.return_value = 0
+        rng.normal.return_value = 8
 
         for row in celle.map:
             for cell in row:
@@ -46,7 +52,7 @@ class TestLandscape:
                         for animal in cell.pop_herb+cell.pop_carn:
                             animal.w = 50
                         pre_baby = len(cell.pop_herb+cell.pop_carn)
-                        cell.birth()
+                        cell.birth(rng)
                         assert len(cell.pop_herb+cell.pop_carn) > pre_baby
 
     def test_death_list(self, mocker):
@@ -55,16 +61,53 @@ class TestLandscape:
         """
         celle = Cells()
         celle.generate_animals()
-        mocker.patch('random.random', return_value=0)
+        rng = mocker.Mock()
+        rng.random.return_value = 0
 
         for row in celle.map:
             for cell in row:
                 if not isinstance(cell, Ocean) and not isinstance(cell, Mountain):
                     if cell.pop_herb or cell.pop_carn:
                         pre_death = len(cell.pop_herb+cell.pop_carn)
-                        cell.survive()
+                        cell.survive(rng)
                         assert len(cell.pop_herb+cell.pop_carn) < pre_death
 
+    def test_sort_reused(self, mocker):
+        """
+        The fitness ordering is reused until the animals change
+        """
+        celle = Cells()
+        celle.generate_animals()
+        cell = celle.map[1][17]
+        cell.sort_fitness()
+
+        spy = mocker.spy(Herbivore, 'update_fitness')
+        cell.sort_fitness()
+        assert spy.call_count == 0
+
+        cell.age()
+        cell.sort_fitness()
+        assert spy.call_count == 1
+        phis = [animal.phi for animal in cell.pop_herb]
+        assert phis == sorted(phis, reverse=True)
+
+    def test_direct_change_invalidated(self):
+        """
+        A direct change of a weight is only reflected in the ordering after invalidate_order
+        """
+        celle = Cells()
+        celle.generate_animals()
+        cell = celle.map[1][17]
+        cell.sort_fitness()
+        weakest = cell.pop_herb[-1]
+        weakest.w = 1000
+
+        cell.sort_fitness()
+        assert cell.pop_herb[-1] is weakest
+        cell.invalidate_order()
+        cell.sort_fitness()
+        assert cell.pop_herb[0] is weakest
+
     def test_walked_true(self):
         """
         The function set_not_walked_true sets all not_walked-attributes to be true
@@ -81,7 +124,60 @@ class TestLandscape:
                     assert animal.not_walked
 
     def test_feeding_carn(self):
-        pass
+        """
+        A carnivore stops hunting when it has eaten F, and the herbivores it did not try
+        stay in the cell
+        """
+        celle = Cells([{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 50, 'weight': 20}
+                                               for _ in range(10)] +
+                                              [{'species': 'Carnivore', 'age': 5, 'weight': 30}]}],
+                      "OOO\nOJO\nOOO",
+                      params=Parameters.from_classes().update('Carnivore', {'DeltaPhiMax': 1e-6}))
+        celle.generate_animals()
+        cell = celle.map[1][1]
+        cell.feeding_carn()
+
+        assert len(cell.pop_herb) == 10 - math.ceil(Carnivore.F / 20)
+        assert cell.pop_carn[0].w == 30 + Carnivore.beta * Carnivore.F
+
+    def test_hunt_probability(self):
+        """
+        Each herbivore is killed with probability (phi_carn - phi_herb) / DeltaPhiMax
+        """
+        random.seed(2)
+        prey_phi = [0.1, 0.3, 0.5, 0.7, 0.9]
+        kills = [0] * len(prey_phi)
+        for _ in range(4000):
+            killed = Landscape.hunt(prey_phi, [1] * 5, [0.8], math.inf, 1.,
+                                    lambda hunter, eaten: 0.8, random.random)
+            kills = [k + dead for k, dead in zip(kills, killed)]
+
+        expected = [max(0., 0.8 - phi) for phi in prey_phi]
+        assert [k / 4000 for k in kills] == pytest.approx(expected, abs=0.03)
+
+    def test_hunt_tiny_probability(self):
+        """
+        A kill probability too small to be told from zero kills nothing, also with nearly
+        equal fitness or a huge DeltaPhiMax
+        """
+        random.seed(3)
+        feed = lambda hunter, eaten: 0.5
+        assert Landscape.hunt([math.nextafter(0.5, 0)], [10.0], [0.5], 50.0, 10.0, feed,
+                              random.random) == [False]
+        assert Landscape.hunt([0.1, 0.2, 0.3], [10.0] * 3, [0.5], 50.0, 1e300, feed,
+                              random.random) == [False] * 3
+        assert Landscape.hunt([1e-300], [10.0], [2e-300], 50.0, 10.0, feed,
+                              random.random) == [False]
+
+    def test_prey_index(self):
+        """
+        The prey index finds the k-th living herbivore after some have been killed
+        """
+        alive = _PreyIndex(10)
+        for i in (0, 3, 4, 9):
+            alive.remove(i)
+        assert [alive.kth(k) for k in range(6)] == [1, 2, 5, 6, 7, 8]
+        assert alive.alive_before(5) == 2
 
 
 class TestJungle:
@@ -159,6 +255,35 @@ class TestSavannah:
                     cell.regrow()
                     assert init_food >= cell.food
 
+    def test_idle(self):
+        """
+        Regrowing for several years at once gives the same food as regrowing once per year
+        """
+        once, yearly = Savannah(), Savannah()
+        once.food = yearly.food = 1.5
+        once.idle(200)
+        for _ in range(200):
+            yearly.regrow()
+        assert once.food == yearly.food
+        once.idle(0)
+        assert once.food == yearly.food
+
+
+class TestIdle:
+    """
+    Class for testing the renewal of food in cells without herbivores
+    """
+    def test_jungle_idle(self):
+        """
+        The jungle is back at f_max after a feeding season, and unchanged without one
+        """
+        jungle = Jungle()
+        jungle.food = 10
+        jungle.idle(0)
+        assert jungle.food == 10
+        jungle.idle(3)
+        assert jungle.food == Jungle.f_max
+
 
 class TestMountainOcean:
     """
@@ -29,3 +29,18 @@ class TestIsland:
             for y, cell in enumerate(row):
                 assert isinstance(map_test[x][y], Landscape)
 
+    def test_compiled_map(self):
+        """
+        The compiled map has landscape codes, a habitable mask and habitable neighbours
+        """
+        isl = Island("""\
+                    OOOO
+                    ODMO
+                    OSJO
+                    OOOO""")
+        isl.create_map()
+        assert isl.type_grid[1, 1] == Island.landscape_codes['D']
+        assert isl.habitable[2, 2] and not isl.habitable[1, 2]
+        assert isl.cell_ids[2, 1] == 9
+        assert list(isl.neighbours[isl.cell_ids[2, 1]]) == [5, 10, -1, -1]
+
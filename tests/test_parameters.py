@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import dataclasses
+import gc
+import pytest
+from biosim import animals, landscape
+from biosim.animals import Herbivore
+from biosim.landscape import Jungle
+from biosim.parameters import Parameters
+from biosim.simulation import BioSim
+
+
+ISLAND = "OOOO\nOJSO\nOOOO"
+
+POPULATION = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(20)]}]
+
+
+class TestParameters:
+    """
+    Class for testing the Parameters class
+    """
+    def test_frozen_and_hashable(self):
+        """
+        Parameters can not be changed in place, and equal parameters have equal hashes
+        """
+        params = Parameters.from_classes()
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            params.herbivore.omega = 0.1
+        assert hash(params) == hash(Parameters.from_classes())
+        assert params.update('J', {'f_max': 100.}) != params
+
+    def test_update_checked(self):
+        """
+        Invalid names, owners and values are rejected
+        """
+        params = Parameters.from_classes()
+        with pytest.raises(KeyError):
+            params.update('Herbivore', {'omega_typo': 0.1})
+        with pytest.raises(ValueError):
+            params.update('Herbivore', {'omega': 1.5})
+        with pytest.raises(ValueError):
+            params.update('D', {'f_max': 100.})
+
+    def test_bound_classes(self):
+        """
+        Bound classes carry the parameters, and are shared by equal parameter sets
+        """
+        params = Parameters.from_classes().update('Herbivore', {'omega': 0.1})
+        herbivore = params.species('Herbivore')
+        assert issubclass(herbivore, Herbivore)
+        assert herbivore.omega == 0.1
+        assert herbivore is Parameters.from_classes().update('Herbivore',
+                                                             {'omega': 0.1}).species('Herbivore')
+        assert params.landscapes()['J'].herbivore is herbivore
+
+    def test_bound_classes_released(self):
+        """
+        Bound classes are dropped once no simulation uses them
+        """
+        params = Parameters.from_classes().update('Herbivore', {'omega': 0.123})
+        jungle = params.landscapes()['J']
+        key = (Herbivore, params.herbivore)
+        assert key in animals._bound_classes
+        del jungle
+        gc.collect()
+        gc.collect()
+        assert key not in animals._bound_classes
+        assert not any(key[1] == params for key in landscape._bound_classes.keys())
+
+
+class TestSimulationParameters:
+    """
+    Class for testing that every simulation owns its parameters
+    """
+    @pytest.mark.parametrize('engine', ['object', 'array'])
+    def test_no_leak_between_simulations(self, engine):
+        """
+        Setting parameters in one simulation changes neither the classes nor another
+        simulation in the same process
+        """
+        omega, f_max = Herbivore.omega, Jungle.f_max
+        first = BioSim(island_map=ISLAND, ini_pop=POPULATION, seed=1, engine=engine,
+                       headless=True)
+        second = BioSim(island_map=ISLAND, ini_pop=POPULATION, seed=1, engine=engine,
+                        headless=True)
+        first.set_animal_parameters('Herbivore', {'omega': 0.999})
+        first.set_landscape_parameters('J', {'f_max': 10.})
+
+        assert Herbivore.omega == omega and Jungle.f_max == f_max
+        assert second.params == Parameters.from_classes()
+        first.simulate(3)
+        second.simulate(3)
+        assert first.num_animals < second.num_animals
+
+    def test_fitness_cache_not_shared(self):
+        """
+        Changing the fitness parameters of one simulation keeps the cached fitness of the
+        animals in another simulation
+        """
+        first = BioSim(island_map=ISLAND, ini_pop=POPULATION, seed=1, headless=True)
+        second = BioSim(island_map=ISLAND, ini_pop=POPULATION, seed=1, headless=True)
+        herbs = second._cycle.map[1][1].pop_herb
+        phis = [herb.fitness() for herb in herbs]
+
+        first.set_animal_parameters('Herbivore', {'phi_age': 0.5})
+        assert all(herb._phi_version == type(herb)._param_version for herb in herbs)
+        assert [herb.fitness() for herb in herbs] == phis
+        first_herbs = first._cycle.map[1][1].pop_herb
+        assert [herb.fitness() for herb in first_herbs] != phis
+
+    def test_animals_follow_new_parameters(self):
+        """
+        Animals already on the island use parameters set after they were placed
+        """
+        sim = BioSim(island_map=ISLAND, ini_pop=POPULATION, seed=1)
+        sim.set_animal_parameters('Herbivore', {'mu': 0.01})
+        herbs = sim._cycle.map[1][1].pop_herb
+        assert all(herb.mu == 0.01 for herb in herbs)
+        assert sim._cycle.map[1][1].herbivore.mu == 0.01
+
+    def test_gui_callback(self):
+        """
+        The sliders change the parameters of their own simulation only
+        """
+        sim = BioSim(island_map=ISLAND, ini_pop=POPULATION, seed=1)
+        sim._set_om_herb(0.)
+        assert sim.params.herbivore.omega == 0.
+        assert Herbivore.omega != 0.
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import pytest
+import numpy as np
+from biosim.animals import Herbivore, Carnivore
+from biosim.population import Population
+from biosim.random_streams import RandomStream
+from biosim.cell_control import Cells
+from biosim.simulation import BioSim
+
+
+class TestPopulation:
+    """
+    Class for testing the Population class
+    """
+    def test_invalid_specie(self):
+        """
+        A ValueError is raised if the species is unknown
+        """
+        with pytest.raises(ValueError):
+            Population('Omnivore')
+
+    def test_add_grows(self):
+        """
+        The arrays grow when more animals are added than there is room for
+        """
+        pop = Population('Herbivore', capacity=2)
+        pop.add([1, 2, 3], [10, 20, 30], 5)
+        pop.add([4], [40], 6)
+        assert len(pop) == 4
+        assert list(pop.w) == [10, 20, 30, 40]
+        assert list(pop.cell) == [5, 5, 5, 6]
+
+    def test_keep(self):
+        """
+        Removed animals disappear, and the order of the others is kept
+        """
+        pop = Population('Carnivore')
+        pop.add([1, 2, 3], [10, 20, 30], [0, 1, 2])
+        pop.keep(np.array([True, False, True]))
+        assert list(pop.a) == [1, 3]
+        assert list(pop.cell) == [0, 2]
+
+    def test_fitness_matches_animal(self):
+        """
+        The fitness equals the fitness of the corresponding Herbivore instance
+        """
+        pop = Population('Herbivore')
+        pop.add([5, 30], [10, 25], 0)
+        for a, w, phi in zip(pop.a, pop.w, pop.fitness()):
+            assert phi == pytest.approx(Herbivore('Herbivore', a, w).fitness())
+
+    def test_by_cell(self):
+        """
+        The animals are grouped by the cell they live in
+        """
+        pop = Population('Herbivore')
+        pop.add([1, 2, 3, 4], [10, 10, 10, 10], [2, 0, 2, 1])
+        order, starts = pop.by_cell(4)
+        assert list(order[starts[2]:starts[3]]) == [0, 2]
+        assert starts[3] == starts[4]
+
+    def test_fitness_order(self):
+        """
+        The animals are grouped by cell with the fittest first, and the ordering is cached
+        until the population changes
+        """
+        pop = Population('Herbivore')
+        pop.add([40, 5, 20, 5], [10, 10, 10, 30], [1, 1, 0, 1])
+        order, starts = pop.fitness_order(2)
+        assert list(order[starts[1]:starts[2]]) == [3, 1, 0]
+        assert pop.fitness_order(2)[0] is order
+
+        pop.aging()
+        assert pop.fitness_order(2)[0] is not order
+
+    def test_survival_weightless(self, mocker):
+        """
+        An animal without weight never survives
+        """
+        rng = mocker.Mock()
+        rng.random.return_value = np.ones(2)
+        pop = Population('Herbivore')
+        pop.add([1, 1], [10, 0], 0)
+        assert list(pop.survival(rng=rng)) == [True, False]
+
+
+class TestArrayBackend:
+    """
+    Class for testing Cells running on top of Population
+    """
+    def test_generate_animals(self):
+        """
+        Animals are placed in the populations, not in the landscape cells
+        """
+        celle = Cells(backend='array')
+        celle.generate_animals()
+        assert len(celle.populations['Herbivore']) == 100
+        assert len(celle.populations['Carnivore']) == 50
+        assert not celle.map[1][17].pop_herb
+        assert celle.populations['Herbivore'].count(celle.n_cells)[
+                   celle.cell_index(1, 17)] == 100
+
+    def test_invalid_backend(self):
+        """
+        A ValueError is raised if the backend is unknown
+        """
+        with pytest.raises(ValueError):
+            Cells(backend='linked_list')
+
+    def test_animals_stay_habitable(self):
+        """
+        After some years, every animal still lives in a habitable cell
+        """
+        celle = Cells(backend='array')
+        celle.generate_animals()
+        for _ in range(10):
+            celle.cell_cycle()
+
+        flat_map = [cell for row in celle.map for cell in row]
+        for pop in celle.populations.values():
+            assert all(flat_map[ix].habitable for ix in pop.cell)
+            assert np.all(pop.w > 0)
+
+
+class TestArrayEngine:
+    """
+    Class for testing that the batched annual cycle follows the per-animal rules
+    """
+    def test_survival_rate(self):
+        """
+        The fraction of survivors matches the death probability in Animal.survival
+        """
+        rng = RandomStream(np.random.default_rng(1))
+        pop = Population('Carnivore')
+        pop.add(np.full(20000, 5), np.full(20000, 6.), 0)
+        phi = Carnivore('Carnivore', 5, 6.).fitness()
+        expected = 1 - Carnivore.omega * (1 - phi)
+        assert np.mean(pop.survival(rng=rng)) == pytest.approx(expected, abs=0.02)
+
+    def test_birth_rate(self):
+        """
+        The number of babies matches the birth probability in Animal.give_birth
+        """
+        rng = RandomStream(np.random.default_rng(1))
+        pop = Population('Herbivore')
+        pop.add(np.full(20000, 5), np.full(20000, 40.), 0)
+        phi = Herbivore('Herbivore', 5, 40.).fitness()
+        expected = min(1, Herbivore.gamma * phi * (3 - 1))
+        assert pop.give_birth(None, 3, rng) / 20000 == pytest.approx(expected, abs=0.02)
+        assert len(pop) > 20000
+        assert np.all(pop.a[20000:] == 0)
+
+    def test_biosim_engine(self):
+        """
+        BioSim can run on the array engine, and counts the animals in the populations
+        """
+        sim = BioSim(island_map="OOOO\nOJSO\nOOOO",
+                     ini_pop=[{'loc': (2, 2),
+                               'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                       for _ in range(50)]}],
+                     seed=1, engine='array', headless=True)
+        sim.simulate(num_years=5)
+        assert sim.year == 5
+        assert sim.num_animals_per_species['Herbivore'] > 0
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import random
+import numpy as np
+import pytest
+from biosim.animals import Herbivore
+from biosim.random_streams import RandomStream, SeedTree, default_stream
+from biosim.simulation import BioSim
+
+
+class TestRandomStream:
+    """
+    Class for testing the RandomStream class
+    """
+    def test_single_draws_follow_generator(self):
+        """
+        Single draws hand out the same numbers as one block drawn from the generator
+        """
+        stream = RandomStream(np.random.default_rng(3), block=8)
+        draws = [stream.random() for _ in range(8)]
+        assert sorted(draws) == sorted(np.random.default_rng(3).random(8).tolist())
+
+    def test_array_draws(self):
+        """
+        Array draws have the requested size and range
+        """
+        stream = RandomStream(np.random.default_rng(3))
+        assert stream.random(5).shape == (5,)
+        assert np.all(stream.integers(0, 4, 100) < 4)
+
+    def test_default_stream_shared(self, mocker):
+        """
+        Calls without a stream share one default stream instead of creating a new one
+        """
+        assert default_stream() is default_stream()
+        spy = mocker.spy(RandomStream, '__init__')
+        for _ in range(10):
+            Herbivore('Herbivore', 5, 20).survival()
+        assert spy.call_count == 0
+
+
+class TestSeedTree:
+    """
+    Class for testing the SeedTree class
+    """
+    def test_same_key_same_stream(self):
+        """
+        A stream only depends on the seed and its key, not on the order streams are requested
+        """
+        first = SeedTree(7)
+        second = SeedTree(7)
+        second.stream(1, 'birth')
+        assert first.stream(3, 'feeding', 12).random(4) == \
+            pytest.approx(second.stream(3, 'feeding', 12).random(4))
+
+    def test_different_keys_differ(self):
+        """
+        Different years, phases and cells give different streams
+        """
+        seeds = SeedTree(7)
+        draws = [seeds.stream(*key).random(4).tolist() for key in
+                 [(0, 'feeding', 1), (0, 'feeding', 2), (1, 'feeding', 1), (0, 'death')]]
+        assert len({tuple(d) for d in draws}) == 4
+
+
+class TestReproducibility:
+    """
+    Class for testing that simulations are reproducible and independent of each other
+    """
+    @pytest.mark.parametrize('engine', ['object', 'array'])
+    def test_same_seed_same_result(self, engine):
+        """
+        Two simulations with the same seed end up with the same animals, even when they are
+        run interleaved and the random module is used in between
+        """
+        first = BioSim(seed=12, engine=engine)
+        second = BioSim(seed=12, engine=engine)
+        for _ in range(5):
+            first._cycle.cell_cycle()
+            random.random()
+            np.random.random()
+            second._cycle.cell_cycle()
+
+        assert first.num_animals_per_species == second.num_animals_per_species
+        assert np.array_equal(first._cycle.counts['Herbivore'],
+                              second._cycle.counts['Herbivore'])
+
+    def test_global_state_untouched(self):
+        """
+        Running a simulation does not change the state of the random module
+        """
+        random.seed(5)
+        expected = random.random()
+        random.seed(5)
+        sim = BioSim(seed=1)
+        sim._cycle.cell_cycle()
+        assert random.random() == expected
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import gc
+import os
+import sys
+import numpy as np
+import pytest
+import biosim.simulation
+from biosim.rendering import FrameRenderer, density_colours, map_colours
+from biosim.simulation import BioSim
+
+
+ISLAND = """\
+         OOOOO
+         OJJSO
+         OJDJO
+         OOOOO"""
+
+POPULATION = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(40)]}]
+
+# Stands in for ffmpeg: reads the frames from standard input and writes their size in bytes
+# to the output file, the last argument
+FAKE_FFMPEG = '''\
+import sys
+size = len(sys.stdin.buffer.read())
+with open(sys.argv[-1], 'w') as movie:
+    movie.write(str(size))
+'''
+
+
+@pytest.fixture
+def ffmpeg(tmpdir):
+    """Provide an executable that behaves like ffmpeg reading raw frames"""
+    script = tmpdir.join('ffmpeg.py')
+    script.write(FAKE_FFMPEG)
+    binary = tmpdir.join('ffmpeg')
+    binary.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, script))
+    os.chmod(str(binary), 0o755)
+    return str(binary)
+
+
+class TestFrameRenderer:
+    """
+    Class for testing the FrameRenderer class
+    """
+    def test_render(self, ffmpeg, tmpdir):
+        """
+        A frame shows the map and the two densities, scaled up, with a gap between them
+        """
+        renderer = FrameRenderer(str(tmpdir.join('movie.mp4')), ISLAND,
+                                 {'Herbivore': 10, 'Carnivore': 10}, scale=2, binary=ffmpeg)
+        herbs = np.zeros((4, 5))
+        herbs[1, 1] = 20
+        frame = renderer.render({'Herbivore': herbs, 'Carnivore': np.zeros((4, 5))})
+        assert frame.shape == (8, 3 * 10 + 4, 3)
+        assert tuple(frame[0, 0]) == map_colours['O']
+        assert tuple(frame[2, 2]) == map_colours['J']
+        assert tuple(frame[0, 10]) == (255, 255, 255)
+        assert tuple(frame[2, 14]) == tuple(density_colours[255])
+        assert tuple(frame[0, 12]) == tuple(density_colours[0])
+        renderer.close()
+
+    def test_frames_piped(self, ffmpeg, tmpdir):
+        """
+        Every submitted frame reaches ffmpeg as raw RGB bytes
+        """
+        path = str(tmpdir.join('movie.mp4'))
+        renderer = FrameRenderer(path, ISLAND, {'Herbivore': 10, 'Carnivore': 10},
+                                 binary=ffmpeg)
+        for _ in range(3):
+            renderer.submit({'Herbivore': np.ones((4, 5)), 'Carnivore': np.zeros((4, 5))})
+        renderer.close()
+        with open(path) as movie:
+            assert int(movie.read()) == 3 * renderer.height * renderer.width * 3
+
+    def test_render_error(self, ffmpeg, tmpdir):
+        """
+        An error in render stops neither submit nor close: it is raised by the next submit,
+        and by close
+        """
+        renderer = FrameRenderer(str(tmpdir.join('movie.mp4')), ISLAND, {'Herbivore': 10},
+                                 binary=ffmpeg, queue_size=2)
+        density = {'Herbivore': np.ones((4, 5)), 'Carnivore': np.zeros((4, 5))}
+        with pytest.raises(RuntimeError):
+            for _ in range(10):
+                renderer.submit(density)
+        assert renderer.frames <= 4
+        with pytest.raises(RuntimeError):
+            renderer.close()
+
+    def test_failure(self, tmpdir):
+        """
+        A missing or failing ffmpeg is reported
+        """
+        with pytest.raises(RuntimeError):
+            FrameRenderer(str(tmpdir.join('movie.mp4')), ISLAND, {}, binary='no-such-ffmpeg')
+        renderer = FrameRenderer(str(tmpdir.join('movie.mp4')), ISLAND, {}, binary='false')
+        with pytest.raises(RuntimeError):
+            renderer.close()
+
+    def test_collected_without_close(self, ffmpeg, tmpdir):
+        """
+        A renderer that is never closed finishes the movie and stops ffmpeg when it is garbage
+        collected
+        """
+        path = str(tmpdir.join('movie.mp4'))
+        renderer = FrameRenderer(path, ISLAND, {'Herbivore': 10, 'Carnivore': 10},
+                                 binary=ffmpeg)
+        renderer.submit({'Herbivore': np.ones((4, 5)), 'Carnivore': np.zeros((4, 5))})
+        process, frame_bytes = renderer._process, renderer.height * renderer.width * 3
+        del renderer
+        gc.collect()
+        assert process.poll() == 0
+        with open(path) as movie:
+            assert int(movie.read()) == frame_bytes
+
+    def test_context_manager(self, ffmpeg, tmpdir):
+        """
+        Leaving a with block stops ffmpeg, also when an exception is raised
+        """
+        path = str(tmpdir.join('movie.mp4'))
+        with pytest.raises(KeyError):
+            with FrameRenderer(path, ISLAND, {'Herbivore': 10, 'Carnivore': 10},
+                               binary=ffmpeg) as renderer:
+                raise KeyError('Herbivore')
+        assert renderer._process.poll() is not None
+        renderer.close()
+
+        with FrameRenderer(path, ISLAND, {'Herbivore': 10, 'Carnivore': 10},
+                           binary=ffmpeg) as renderer:
+            renderer.submit({'Herbivore': np.ones((4, 5)), 'Carnivore': np.zeros((4, 5))})
+        assert renderer._process.poll() == 0
+
+    def test_odd_scale(self):
+        """
+        The encoder needs even frame sizes
+        """
+        with pytest.raises(ValueError):
+            FrameRenderer('movie.mp4', ISLAND, {}, scale=3)
+
+    def test_biosim_stream(self, ffmpeg, tmpdir, mocker):
+        """
+        A headless simulation with a movie format streams every img_years year into the
+        movie and writes no images
+        """
+        mocker.patch.object(biosim.simulation, '_FFMPEG_BINARY', ffmpeg)
+        base = str(tmpdir.join('film'))
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, img_base=base,
+                     img_fmt='mp4', headless=True)
+        sim.simulate(6, img_years=2)
+        frame_size = sim._renderer.height * sim._renderer.width * 3
+        sim.make_movie()
+        with open(base + '.mp4') as movie:
+            assert int(movie.read()) == 3 * frame_size
+        assert not tmpdir.listdir(lambda path: path.ext == '.png')
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import numpy as np
+import pytest
+import subprocess
+import sys
+from biosim.simulation import BioSim
+
+
+ISLAND = """\
+         OOOOOO
+         OJJSSO
+         OJDJSO
+         OSJJJO
+         OOOOOO"""
+
+POPULATION = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(40)] +
+                                     [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                      for _ in range(5)]}]
+
+
+class TestImports:
+    """
+    Class for guarding the cost of importing biosim
+    """
+    def test_import_budget(self):
+        """
+        Importing biosim.simulation loads neither matplotlib, pandas nor the band
+        decomposition. The modules are checked rather than the time, which depends on the
+        load of the machine
+        """
+        code = ('import sys\n'
+                'import biosim.simulation\n'
+                'print(" ".join(sorted(sys.modules)))\n')
+        modules = subprocess.check_output([sys.executable, '-c', code], text=True).split()
+        assert 'biosim.simulation' in modules
+        for module in ('matplotlib', 'pandas', 'biosim.decomposition',
+                       'multiprocessing.shared_memory'):
+            assert module not in modules
+
+
+class TestModes:
+    """
+    Class for testing the headless and visual modes of BioSim
+    """
+    def test_headless_imports(self):
+        """
+        A headless simulation imports neither matplotlib nor pandas
+        """
+        code = ('import sys\n'
+                'from biosim.simulation import BioSim\n'
+                'BioSim(seed=1, headless=True).simulate(2)\n'
+                'assert "matplotlib" not in sys.modules, "matplotlib"\n'
+                'assert "pandas" not in sys.modules, "pandas"\n')
+        subprocess.check_call([sys.executable, '-c', code])
+
+    def test_headless_draws_nothing(self, mocker):
+        """
+        A headless simulation never sets up or updates the graphics
+        """
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, headless=True)
+        mocker.spy(sim, 'set_up_graphics')
+        mocker.spy(sim, '_update_graphics')
+        sim.simulate(3)
+        assert sim.set_up_graphics.call_count == 0
+        assert sim._update_graphics.call_count == 0
+
+    def test_vis_years(self, mocker):
+        """
+        The visual mode draws the figure every vis_years years only
+        """
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION)
+        mocker.patch.object(sim, '_update_graphics')
+        sim.simulate(10, vis_years=5)
+        assert sim._update_graphics.call_count == 2
+
+    def test_blitting(self, mocker):
+        """
+        The whole figure is drawn once per call to simulate, as the time axis grows, and
+        again when the axis limits change. Otherwise only the changing artists are drawn
+        """
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, ymax_animals=10000)
+        sim.simulate(1)
+        canvas = sim._fig.canvas
+        mocker.spy(canvas, 'draw')
+        mocker.spy(canvas, 'restore_region')
+        sim.simulate(4)
+        assert canvas.draw.call_count == 1
+        assert canvas.restore_region.call_count == 3
+
+        sim.ymax_animals, sim.automatic_ymax = 1, True
+        sim.simulate(1)
+        assert canvas.draw.call_count == 2
+        assert sim._pop_ax.get_ylim()[1] == sim.ymax_animals > 1
+
+
+class TestCheckpoint:
+    """
+    Class for testing checkpoints of BioSim
+    """
+    @pytest.mark.parametrize('engine', ['object', 'array'])
+    def test_resume(self, tmpdir, engine):
+        """
+        A simulation resumed from a checkpoint continues exactly like the simulation that
+        wrote it
+        """
+        sim = BioSim(seed=7, island_map=ISLAND, ini_pop=POPULATION, engine=engine,
+                     headless=True)
+        sim.set_landscape_parameters('S', {'f_max': 500})
+        sim.simulate(5)
+        path = str(tmpdir.join('sim.npz'))
+        sim.save_checkpoint(path)
+        sim.simulate(5)
+
+        resumed = BioSim.from_checkpoint(path, headless=True)
+        assert resumed.year == 5
+        assert resumed.params == sim.params
+        resumed.simulate(5)
+        assert resumed.year == 10
+        assert resumed.num_animals_per_species == sim.num_animals_per_species
+        assert np.array_equal(resumed._cycle.state()['Herbivore_w'],
+                              sim._cycle.state()['Herbivore_w'])
+        assert np.array_equal(resumed._cycle.state()['food'], sim._cycle.state()['food'])
+
+    def test_checkpoint_years(self, tmpdir):
+        """
+        simulate writes a checkpoint every checkpoint_years years
+        """
+        base = str(tmpdir.join('ckpt'))
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, checkpoint_base=base,
+                     headless=True)
+        sim.simulate(6, checkpoint_years=3)
+        assert sorted(f.basename for f in tmpdir.listdir()) == ['ckpt_00003.npz',
+                                                               'ckpt_00006.npz']
+        with np.load(base + '_00006.npz') as data:
+            assert int(data['year']) == 6
+            assert len(data['Herbivore_a']) == sim.num_animals_per_species['Herbivore']
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import numpy as np
+import pytest
+from biosim.cell_control import Cells
+from biosim.simulation import BioSim
+from biosim.statistics import StatisticsSink, StatisticsWriter, read_statistics
+
+
+ISLAND = """\
+         OOOOO
+         OJJSO
+         OJDJO
+         OOOOO"""
+
+POPULATION = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(40)] +
+                                     [{'species': 'Carnivore', 'age': 5, 'weight': 20}
+                                      for _ in range(5)]}]
+
+
+class TestStatisticsWriter:
+    """
+    Class for testing the StatisticsWriter class
+    """
+    def test_chunks(self, tmpdir):
+        """
+        Full chunks are written as they fill up, and the rest when the simulation stops
+        """
+        base = str(tmpdir.join('stats'))
+        writer = StatisticsWriter(base, chunk_years=4)
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, stats=writer,
+                     headless=True)
+        sim.simulate(5)
+        assert sorted(f.basename for f in tmpdir.listdir()) == ['stats_00000.npz',
+                                                                'stats_00001.npz']
+        sim.simulate(2)
+        stats = read_statistics(base)
+        assert list(stats['year']) == list(range(1, 8))
+        assert stats['density'].shape == (7, 2, 4, 5)
+        assert list(stats['counts'][-1]) == [sim.num_animals_per_species['Herbivore'],
+                                             sim.num_animals_per_species['Carnivore']]
+
+    def test_histograms(self, tmpdir):
+        """
+        Every animal is counted once in each histogram, also outside the bin edges
+        """
+        base = str(tmpdir.join('stats'))
+        writer = StatisticsWriter(base, age_bins=[0, 1, 2])
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, stats=writer,
+                     headless=True)
+        sim.simulate(3)
+        stats = read_statistics(base)
+        for key in ('age', 'weight', 'fitness'):
+            assert np.array_equal(stats[key].sum(axis=2), stats['counts'])
+        assert list(stats['age_bins']) == [0, 1, 2]
+
+    @pytest.mark.parametrize('engine', ['object', 'array'])
+    def test_food_left_lazy(self, tmpdir, mocker, engine):
+        """
+        Recording statistics reads the animals only, and leaves the food in idle cells to be
+        renewed when the cells are visited
+        """
+        writer = StatisticsWriter(str(tmpdir.join('stats')))
+        sim = BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, stats=writer,
+                     headless=True, engine=engine)
+        state = mocker.spy(Cells, 'state')
+        update_food = mocker.spy(Cells, 'update_food')
+        sim.simulate(3)
+        assert state.call_count == 0
+        assert all(len(call.args) > 1 for call in update_food.call_args_list)
+        properties = sim.animal_properties()
+        assert len(properties['Herbivore'][0]) == sim.num_animals_per_species['Herbivore']
+
+    def test_sink(self):
+        """
+        A sink gets the simulation after every year
+        """
+        class Years(StatisticsSink):
+            def __init__(self):
+                self.years = []
+
+            def record(self, sim):
+                self.years.append(sim.year)
+
+        sink = Years()
+        BioSim(seed=1, island_map=ISLAND, ini_pop=POPULATION, stats=sink,
+               headless=True).simulate(3)
+        assert sink.years == [1, 2, 3]
+
+    def test_sink_abstract(self):
+        """
+        A sink without record can not be created
+        """
+        class Empty(StatisticsSink):
+            pass
+
+        with pytest.raises(TypeError):
+            Empty()
+
+    def test_missing(self, tmpdir):
+        """
+        Reading statistics that were never written fails
+        """
+        with pytest.raises(FileNotFoundError):
+            read_statistics(str(tmpdir.join('stats')))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+__author__ = 'Inger Annett Grünbeck','Yngvild Sauge'
+__email__ = 'inger.annett.grunbeck@nmbu.no', 'yngvild.sauge@nmbu.no'
+"""
+
+import numpy as np
+import pytest
+from biosim import sweep
+from biosim.parameters import Parameters
+from biosim.sweep import ResultCache, Sweep, grid, latin_hypercube
+
+
+ISLAND = """\
+         OOOOO
+         OJJSO
+         OJDJO
+         OOOOO"""
+
+POPULATION = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                      for _ in range(40)]}]
+
+
+class TestSampling:
+    """
+    Class for testing the grid and latin_hypercube functions
+    """
+    def test_grid(self):
+        """
+        The grid holds every combination of values
+        """
+        points = grid({'Herbivore': {'omega': [0.3, 0.5], 'mu': [0.1, 0.2, 0.3]},
+                       'J': {'f_max': [100.]}})
+        assert len(points) == 6
+        assert {'Herbivore': {'omega': 0.5, 'mu': 0.3}, 'J': {'f_max': 100.}} in points
+
+    def test_latin_hypercube(self):
+        """
+        Every stratum of every parameter is used exactly once
+        """
+        points = latin_hypercube({'Herbivore': {'omega': (0.2, 0.6)},
+                                  'S': {'alpha': (0., 1.)}}, 10, seed=1)
+        for owner, key, low in (('Herbivore', 'omega', 0.2), ('S', 'alpha', 0.)):
+            values = np.array([point[owner][key] for point in points])
+            strata = np.floor((values - low) / (0.4 if owner == 'Herbivore' else 1.) * 10)
+            assert sorted(strata.tolist()) == list(range(10))
+
+
+class TestResultCache:
+    """
+    Class for testing the ResultCache class
+    """
+    def test_key(self):
+        """
+        The key depends on every part of a run, but not on the indentation of the map
+        """
+        params = Parameters.from_classes()
+        key = ResultCache.key(ISLAND, POPULATION, params, 1, 5, 'array')
+        assert key == ResultCache.key('OOOOO\nOJJSO\nOJDJO\nOOOOO', POPULATION, params, 1, 5,
+                                      'array')
+        assert key != ResultCache.key(ISLAND, POPULATION, params, 2, 5, 'array')
+        assert key != ResultCache.key(ISLAND, POPULATION, params, 1, 6, 'array')
+        assert key != ResultCache.key(ISLAND, [], params, 1, 5, 'array')
+        assert key != ResultCache.key(ISLAND, POPULATION,
+                                      params.update('J', {'f_max': 10.}), 1, 5, 'array')
+
+    def test_get_put(self, tmpdir):
+        """
+        Stored counts are found again, and missing runs give None
+        """
+        cache = ResultCache(str(tmpdir))
+        assert cache.get('abc') is None
+        cache.put('abc', np.arange(6).reshape(3, 2))
+        assert np.array_equal(cache.get('abc'), np.arange(6).reshape(3, 2))
+
+
+class TestSweep:
+    """
+    Class for testing the Sweep class
+    """
+    def test_repeated_sweep_cached(self, tmpdir):
+        """
+        A repeated sweep reads every run from the cache, and gives the same counts
+        """
+        points = grid({'Herbivore': {'omega': [0.3, 0.6]}})
+        first = Sweep(ISLAND, POPULATION, cache_dir=str(tmpdir))
+        counts = first.run(points, [1, 2], 4, processes=2)
+        assert first.runs == 4
+        assert len(counts) == 2 and counts[0].shape == (2, 5, 2)
+
+        second = Sweep(ISLAND, POPULATION, cache_dir=str(tmpdir))
+        again = second.run(points + grid({'Herbivore': {'omega': [0.9]}}), [1, 2], 4,
+                           processes=1)
+        assert second.runs == 2
+        assert all(np.array_equal(a, b) for a, b in zip(counts, again))
+
+    def test_interrupted_sweep_resumed(self, tmpdir, mocker):
+        """
+        The runs finished before a sweep is interrupted are cache hits when it is run again
+        """
+        points = grid({'Herbivore': {'omega': [0.3, 0.6, 0.9]}})
+        calls = []
+
+        def failing(task):
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            calls.append(task)
+            return np.zeros((task[4] + 1, 2), dtype=np.int64)
+
+        mocker.patch.object(sweep, 'replicate_counts', side_effect=failing)
+        first = Sweep(ISLAND, POPULATION, cache_dir=str(tmpdir))
+        with pytest.raises(KeyboardInterrupt):
+            first.run(points, [1], 4, processes=1)
+        assert first.runs == 2
+
+        mocker.stopall()
+        second = Sweep(ISLAND, POPULATION, cache_dir=str(tmpdir))
+        counts = second.run(points, [1], 4, processes=1)
+        assert second.runs == 1
+        assert not counts[0].any() and not counts[1].any() and counts[2].any()
+
+    def test_identical_runs_once(self):
+        """
+        Identical points and seeds in one sweep are only run once
+        """
+        points = [{'Herbivore': {'omega': 0.3}}] * 2
+        counting = Sweep(ISLAND, POPULATION)
+        counts = counting.run(points, [1, 1], 4, processes=2)
+        assert counting.runs == 1
+        assert len(counts) == 2 and counts[0].shape == (2, 5, 2)
+        assert np.array_equal(counts[0][0], counts[1][1])
+
+    def test_no_seeds(self):
+        """
+        A sweep needs at least one seed
+        """
+        with pytest.raises(ValueError):
+            Sweep(ISLAND, POPULATION).run([{}], [], 4)